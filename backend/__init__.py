@@ -0,0 +1,4 @@
+"""
+拼图大师后端支撑模块
+server.py 中使用的各类基础设施（哈希、限流、缓存、数据库路由等）
+"""
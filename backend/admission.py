@@ -0,0 +1,150 @@
+"""
+准入控制（按优先级削峰）
+跟踪进行中的请求、进行中的数据库操作以及数据库延迟，
+在数据库变慢时优先拒绝或排队低优先级请求，保护对战相关的实时事件
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+PRIORITY_CRITICAL = 'critical'
+PRIORITY_NORMAL = 'normal'
+PRIORITY_LOW = 'low'
+
+
+class PriorityClass:
+    """
+    优先级配置
+    capacity: 可使用的并发槽位比例
+    max_latency_ms: 数据库平均延迟超过该值时直接拒绝（None 表示不按延迟削峰）
+    queue_timeout: 槽位已满时最长排队等待秒数
+    max_queue: 最多排队的请求数
+    """
+
+    def __init__(self, capacity, max_latency_ms=None, queue_timeout=0.0, max_queue=0):
+        self.capacity = capacity
+        self.max_latency_ms = max_latency_ms
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+
+
+DEFAULT_CLASSES = {
+    PRIORITY_CRITICAL: PriorityClass(capacity=1.0, max_latency_ms=None, queue_timeout=5.0, max_queue=256),
+    PRIORITY_NORMAL: PriorityClass(capacity=0.75, max_latency_ms=500, queue_timeout=1.0, max_queue=64),
+    PRIORITY_LOW: PriorityClass(capacity=0.4, max_latency_ms=200, queue_timeout=0.2, max_queue=16),
+}
+
+
+class OverloadedError(Exception):
+    """请求被准入控制拒绝"""
+
+    def __init__(self, priority, reason):
+        super().__init__(f'{priority} 请求被拒绝: {reason}')
+        self.priority = priority
+        self.reason = reason
+
+
+class AdmissionController:
+    """基于并发槽位和数据库延迟 EWMA 的准入控制器"""
+
+    def __init__(self, max_inflight=32, classes=None, ewma_alpha=0.2, latency_half_life=5.0):
+        self.max_inflight = max_inflight
+        self.classes = dict(classes or DEFAULT_CLASSES)
+        self.ewma_alpha = ewma_alpha
+        self.latency_half_life = latency_half_life
+
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._inflight_by_class = {name: 0 for name in self.classes}
+        self._queued_by_class = {name: 0 for name in self.classes}
+        self._admitted = {name: 0 for name in self.classes}
+        self._shed = {name: 0 for name in self.classes}
+
+        self._db_lock = threading.Lock()
+        self._db_inflight = 0
+        self._db_latency_ms = 0.0
+        self._db_sampled_at = time.monotonic()
+
+    @contextmanager
+    def admit(self, priority):
+        """占用一个并发槽位，无法准入时抛出 OverloadedError"""
+        self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    @contextmanager
+    def track_db(self):
+        """记录一次数据库操作的并发与耗时"""
+        start = time.perf_counter()
+        with self._db_lock:
+            self._db_inflight += 1
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._db_lock:
+                self._db_inflight -= 1
+                self._db_latency_ms += self.ewma_alpha * (elapsed_ms - self._db_latency_ms)
+                self._db_sampled_at = time.monotonic()
+
+    def snapshot(self):
+        """导出当前状态，供监控使用"""
+        with self._cond:
+            classes = {
+                name: {
+                    'capacity': int(self.max_inflight * cls.capacity),
+                    'inflight': self._inflight_by_class[name],
+                    'queued': self._queued_by_class[name],
+                    'admitted': self._admitted[name],
+                    'shed': self._shed[name],
+                }
+                for name, cls in self.classes.items()
+            }
+            inflight = self._inflight
+        with self._db_lock:
+            db = {'inflight': self._db_inflight, 'latency_ms': round(self._db_latency(), 2)}
+        return {'max_inflight': self.max_inflight, 'inflight': inflight, 'db': db, 'classes': classes}
+
+    def _db_latency(self):
+        # 长时间没有新样本时（例如低优先级请求全部被拒绝）让延迟估计逐渐衰减，避免永久削峰
+        idle = time.monotonic() - self._db_sampled_at
+        return self._db_latency_ms * 0.5 ** (idle / self.latency_half_life)
+
+    def _acquire(self, priority):
+        cls = self.classes[priority]
+        limit = max(1, int(self.max_inflight * cls.capacity))
+
+        with self._db_lock:
+            db_latency_ms = self._db_latency()
+
+        with self._cond:
+            if cls.max_latency_ms is not None and db_latency_ms > cls.max_latency_ms:
+                self._shed[priority] += 1
+                raise OverloadedError(priority, '数据库延迟过高')
+
+            if self._inflight >= limit:
+                if self._queued_by_class[priority] >= cls.max_queue:
+                    self._shed[priority] += 1
+                    raise OverloadedError(priority, '排队已满')
+
+                self._queued_by_class[priority] += 1
+                try:
+                    admitted = self._cond.wait_for(lambda: self._inflight < limit, timeout=cls.queue_timeout)
+                finally:
+                    self._queued_by_class[priority] -= 1
+                if not admitted:
+                    self._shed[priority] += 1
+                    raise OverloadedError(priority, '排队超时')
+
+            self._inflight += 1
+            self._inflight_by_class[priority] += 1
+            self._admitted[priority] += 1
+
+    def _release(self, priority):
+        with self._cond:
+            self._inflight -= 1
+            self._inflight_by_class[priority] -= 1
+            self._cond.notify_all()
@@ -0,0 +1,202 @@
+"""
+异步数据库访问
+在独立线程的事件循环上运行 aiomysql 连接池，提供与 execute_query 相同语义的
+协程接口（fetch='one' / 'all'，写操作返回 lastrowid，fetch='rowcount' 时返回受影响的行数）
+
+SocketIO 事件处理函数通过 spawn() 把后续的数据库操作和消息推送交给事件循环，
+处理线程立即返回（任务在调用方 contextvars 上下文的副本中运行）；
+异步路由可以在任意事件循环中直接 await execute_query()
+未安装 aiomysql 或 use_pool=False（如内存存储后端）时退化为在线程池中调用同步的 execute_query
+
+事件循环上没有请求上下文，调用方通过 pin_keys 指明写操作涉及的用户：写成功后经 on_write
+通知存储层把这些用户的读请求固定到主库（读己之写），同步回退路径的读也按 pin_keys 路由
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import threading
+import time
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+
+class AsyncDatabase:
+    """异步数据库访问层"""
+
+    def __init__(self, config, minsize=1, maxsize=10, sync_fallback=None, track_db=None, use_pool=True,
+                 observe=None, on_spawn=None, on_write=None):
+        self.config = dict(config)
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self._sync_fallback = sync_fallback
+        self._track_db = track_db
+        self.use_pool = use_pool and aiomysql is not None
+        # observe(query, fetch, seconds, result)：每次查询完成后回调（指标、追踪）
+        self._observe = observe
+        # on_spawn()：调度任务时在调用方线程中调用，可返回一个任务完成时调用的回调
+        self._on_spawn = on_spawn
+        # on_write(pin_keys)：带 pin_keys 的写操作成功后调用
+        self._on_write = on_write
+
+        self._loop = None
+        self._thread = None
+        self._pool = None
+        self._pool_lock = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """数据库事件循环（首次访问时启动）"""
+        if self._loop is None:
+            self.start()
+        return self._loop
+
+    def start(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name='async-db', daemon=True)
+            self._thread.start()
+            ready.wait()
+            self._loop = loop
+
+    def spawn(self, coro_fn, *args, **kwargs):
+        """在数据库事件循环上调度一个协程，返回 concurrent.futures.Future"""
+        future = self._submit(coro_fn(*args, **kwargs))
+        future.add_done_callback(_log_failure)
+        if self._on_spawn is not None:
+            done = self._on_spawn()
+            if done is not None:
+                future.add_done_callback(done)
+        return future
+
+    async def execute_query(self, query, params=None, fetch=False, pin_keys=()):
+        """执行数据库查询（可在任意事件循环中 await）；pin_keys 为本次读写涉及的用户ID"""
+        coro = self._execute(query, params, fetch, tuple(pin_keys))
+        if _running_loop() is self.loop:
+            return await coro
+        return await asyncio.wrap_future(self._submit(coro))
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    def _submit(self, coro):
+        """在数据库事件循环上以调用方上下文的副本运行协程，返回 concurrent.futures.Future"""
+        context = contextvars.copy_context()
+        future = concurrent.futures.Future()
+
+        def start():
+            # Task 创建时复制“当前”上下文，因此在调用方上下文中创建
+            task = context.run(self.loop.create_task, coro)
+            task.add_done_callback(lambda t: _copy_task_result(t, future))
+
+        self.loop.call_soon_threadsafe(start)
+        return future
+
+    async def _execute(self, query, params, fetch, pin_keys):
+        result = await self._dispatch(query, params, fetch, pin_keys)
+        if pin_keys and result is not None and fetch not in ('one', 'all') and self._on_write is not None:
+            self._on_write(pin_keys)
+        return result
+
+    async def _dispatch(self, query, params, fetch, pin_keys):
+        if not self.use_pool:
+            # 同步回退路径由 execute_query 自身记录指标和追踪，线程池任务同样在当前上下文中执行
+            # 参与者都已被固定到主库，按其中任意一个路由即可
+            context = contextvars.copy_context()
+            call = functools.partial(self._sync_fallback, query, params, fetch,
+                                     pin_key=pin_keys[0] if pin_keys else None)
+            return await self.loop.run_in_executor(None, context.run, call)
+
+        start = time.perf_counter()
+        result = None
+        try:
+            if self._track_db is None:
+                result = await self._execute_pooled(query, params, fetch)
+            else:
+                with self._track_db():
+                    result = await self._execute_pooled(query, params, fetch)
+            return result
+        finally:
+            if self._observe is not None:
+                self._observe(query, fetch, time.perf_counter() - start, result)
+
+    async def _execute_pooled(self, query, params, fetch):
+        try:
+            pool = await self._get_pool()
+        except Exception as e:
+            print(f"数据库连接失败: {e}")
+            return None
+
+        async with pool.acquire() as connection:
+            try:
+                async with connection.cursor(aiomysql.DictCursor) as cursor:
+                    await cursor.execute(query, params or ())
+                    if fetch == 'rowcount':
+                        return cursor.rowcount
+                    if fetch:
+                        return await cursor.fetchall() if fetch == 'all' else await cursor.fetchone()
+                    return cursor.lastrowid
+            except Exception as e:
+                print(f"查询执行失败: {e}")
+                return None
+
+    async def _get_pool(self):
+        if self._pool is not None:
+            return self._pool
+        if self._pool_lock is None:
+            self._pool_lock = asyncio.Lock()
+        async with self._pool_lock:
+            if self._pool is None:
+                self._pool = await aiomysql.create_pool(
+                    host=self.config.get('host', '127.0.0.1'),
+                    port=self.config.get('port', 3306),
+                    user=self.config.get('user'),
+                    password=self.config.get('password', ''),
+                    db=self.config.get('database'),
+                    charset=self.config.get('charset', 'utf8mb4'),
+                    minsize=self.minsize,
+                    maxsize=self.maxsize,
+                    # 每条语句独立提交，避免长事务导致读到旧快照
+                    autocommit=True,
+                )
+        return self._pool
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _copy_task_result(task, future):
+    if future.done():
+        return
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"异步任务执行失败: {future.exception()!r}")
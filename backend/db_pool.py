@@ -0,0 +1,188 @@
+"""
+数据库连接池与服务端预处理语句缓存
+每个池化连接按 SQL 文本缓存预处理游标（LRU，有上限），
+同一条语句重复执行时只发送参数，MySQL 无需重新解析和生成执行计划
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import mysql.connector
+from mysql.connector import errors
+
+
+class StatementCache:
+    """单个连接上的预处理语句缓存"""
+
+    def __init__(self, connection, max_size=64):
+        self._connection = connection
+        self.max_size = max_size
+        self._statements = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def execute(self, query, params=()):
+        """使用缓存的预处理语句执行 SQL，返回游标"""
+        entry = self._statements.get(query)
+        if entry is not None:
+            self._statements.move_to_end(query)
+            self.hits += 1
+        else:
+            self.misses += 1
+            # 游标内部用 `is` 判断语句是否已预处理，因此保存首次执行时的字符串对象
+            entry = (query, self._connection.cursor(prepared=True, dictionary=True))
+            self._statements[query] = entry
+            while len(self._statements) > self.max_size:
+                _, (_, evicted) = self._statements.popitem(last=False)
+                _close_quietly(evicted)
+
+        sql, cursor = entry
+        try:
+            cursor.execute(sql, params)
+        except errors.Error:
+            # 预处理失败的语句不保留在缓存中
+            self._statements.pop(query, None)
+            _close_quietly(cursor)
+            raise
+        return cursor
+
+    def clear(self, close=True):
+        if close:
+            for _, cursor in self._statements.values():
+                _close_quietly(cursor)
+        self._statements.clear()
+
+    def __len__(self):
+        return len(self._statements)
+
+
+class PooledConnection:
+    """池中的一个连接，close() 时归还给连接池"""
+
+    def __init__(self, pool, raw, statement_cache_size):
+        self._pool = pool
+        self.raw = raw
+        self.statements = StatementCache(raw, statement_cache_size)
+        self.last_used = time.monotonic()
+        self.broken = False
+
+    def execute(self, query, params=()):
+        try:
+            return self.statements.execute(query, params)
+        except (errors.OperationalError, errors.InterfaceError):
+            self.broken = True
+            raise
+
+    def begin(self):
+        """开始显式事务（连接以 autocommit 打开，START TRANSACTION 在提交或回滚前暂停自动提交）"""
+        try:
+            self.raw.start_transaction()
+        except (errors.OperationalError, errors.InterfaceError):
+            self.broken = True
+            raise
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        try:
+            self.raw.rollback()
+        except errors.Error:
+            self.broken = True
+
+    def close(self):
+        """归还连接"""
+        self._pool.release(self)
+
+
+class ConnectionPool:
+    """有上限的阻塞式连接池"""
+
+    def __init__(self, config, size=10, timeout=5.0, statement_cache_size=64,
+                 idle_ping_seconds=30.0, connect=None, name='pool'):
+        self.config = dict(config)
+        # 每条语句独立提交，避免池化连接上的长事务读到旧快照
+        self.config.setdefault('autocommit', True)
+        self.size = size
+        self.timeout = timeout
+        self.statement_cache_size = statement_cache_size
+        self.idle_ping_seconds = idle_ping_seconds
+        self.name = name
+        self._connect = connect or mysql.connector.connect
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._connections = set()
+        self._created = 0
+        self._in_use = 0
+
+    def acquire(self):
+        """取出一个连接，池满时最多等待 timeout 秒"""
+        with self._cond:
+            deadline = time.monotonic() + self.timeout
+            while not self._idle and self._created >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise errors.PoolError(f'连接池 {self.name} 已耗尽')
+            if self._idle:
+                connection = self._idle.pop()
+            else:
+                connection = None
+                self._created += 1
+            self._in_use += 1
+
+        try:
+            if connection is None:
+                connection = PooledConnection(self, self._connect(**self.config), self.statement_cache_size)
+                with self._cond:
+                    self._connections.add(connection)
+            elif time.monotonic() - connection.last_used > self.idle_ping_seconds:
+                self._revalidate(connection)
+        except errors.Error:
+            with self._cond:
+                if connection is not None:
+                    self._connections.discard(connection)
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return connection
+
+    def release(self, connection):
+        with self._cond:
+            self._in_use -= 1
+            if connection.broken:
+                self._created -= 1
+                self._connections.discard(connection)
+                connection.statements.clear(close=False)
+                _close_quietly(connection.raw)
+            else:
+                connection.last_used = time.monotonic()
+                self._idle.append(connection)
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            connections = list(self._connections)
+            stats = {'size': self.size, 'created': self._created, 'in_use': self._in_use, 'idle': len(self._idle)}
+        stats['statement_cache_hits'] = sum(c.statements.hits for c in connections)
+        stats['statement_cache_misses'] = sum(c.statements.misses for c in connections)
+        return stats
+
+    def _revalidate(self, connection):
+        try:
+            connection.raw.ping(reconnect=False)
+        except errors.Error:
+            # 连接已失效：重新建立，服务端的预处理语句也随之失效
+            connection.statements.clear(close=False)
+            _close_quietly(connection.raw)
+            connection.raw = self._connect(**self.config)
+            connection.statements = StatementCache(connection.raw, self.statement_cache_size)
+
+
+def _close_quietly(resource):
+    try:
+        resource.close()
+    except Exception:
+        pass
@@ -0,0 +1,194 @@
+"""
+数据库读写路由
+写操作和事务始终发往主库；只读查询分发到健康且延迟可接受的只读副本，
+用户写入后的一小段时间内其读请求固定走主库（读己之写）
+
+本地测试时副本可以是第二个 MySQL 实例，也可以是指向同一实例另一个端口的替身：
+未配置复制（SHOW REPLICA STATUS 为空）的节点视为无延迟
+"""
+
+import itertools
+import threading
+import time
+
+import mysql.connector
+from mysql.connector import Error, errors
+
+from backend.db_pool import ConnectionPool
+
+READ_PREFIXES = ('SELECT', 'SHOW', 'EXPLAIN')
+
+
+def is_read_only(query):
+    """判断 SQL 是否为只读语句"""
+    head = query.lstrip().lstrip('(').lstrip()[:8].upper()
+    if not head.startswith(READ_PREFIXES):
+        return False
+    upper = query.upper()
+    return 'FOR UPDATE' not in upper and 'LOCK IN SHARE MODE' not in upper
+
+
+class DatabaseNode:
+    """一个数据库节点及其健康状态"""
+
+    def __init__(self, name, config, is_primary=False, pool_options=None):
+        self.name = name
+        self.config = dict(config)
+        self.is_primary = is_primary
+        self.pool = ConnectionPool(self.config, name=name, **(pool_options or {}))
+        self.healthy = True
+        self.lag_seconds = 0.0
+        self.checked_at = 0.0
+        self.last_error = None
+
+    def status(self):
+        return {
+            'name': self.name,
+            'primary': self.is_primary,
+            'healthy': self.healthy,
+            'lag_seconds': self.lag_seconds,
+            'last_error': self.last_error,
+            'pool': self.pool.stats(),
+        }
+
+
+class DatabaseRouter:
+    """主从路由器"""
+
+    def __init__(self, primary_config, replica_configs=(), max_lag_seconds=2.0,
+                 health_interval=5.0, read_your_writes_window=5.0, connect=None, pool_options=None):
+        pool_options = dict(pool_options or {}, connect=connect)
+        self.primary = DatabaseNode('primary', primary_config, is_primary=True, pool_options=pool_options)
+        self.replicas = [DatabaseNode(f'replica-{i}', cfg, pool_options=pool_options)
+                         for i, cfg in enumerate(replica_configs)]
+        self.max_lag_seconds = max_lag_seconds
+        self.health_interval = health_interval
+        self.read_your_writes_window = read_your_writes_window
+        self._connect = connect or mysql.connector.connect
+
+        self._round_robin = itertools.count()
+        self._pins = {}
+        self._pins_lock = threading.Lock()
+        self._health_thread = None
+        self._stop = threading.Event()
+
+    def node_for(self, read_only, pin_key=None):
+        """选择执行节点"""
+        if not read_only or not self.replicas or self.is_pinned(pin_key):
+            return self.primary
+
+        candidates = [node for node in self.replicas
+                      if node.healthy and node.lag_seconds <= self.max_lag_seconds]
+        if not candidates:
+            return self.primary
+        return candidates[next(self._round_robin) % len(candidates)]
+
+    def connect(self, read_only=False, pin_key=None):
+        """
+        从对应节点的连接池取出连接，返回 (connection, node)
+        副本连接失败时标记为不健康并回退到主库；副本连接池耗尽只说明它忙，直接回退，不影响健康状态
+        """
+        node = self.node_for(read_only, pin_key)
+        if not node.is_primary:
+            try:
+                return node.pool.acquire(), node
+            except errors.PoolError:
+                node = self.primary
+            except Error as e:
+                self.mark_unhealthy(node, e)
+                node = self.primary
+        return node.pool.acquire(), node
+
+    def note_write(self, pin_key):
+        """记录用户写入，在窗口期内将其读请求固定到主库"""
+        if pin_key is None or not self.replicas:
+            return
+        with self._pins_lock:
+            self._pins[pin_key] = time.monotonic() + self.read_your_writes_window
+
+    def is_pinned(self, pin_key):
+        if pin_key is None:
+            return False
+        with self._pins_lock:
+            expires = self._pins.get(pin_key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._pins[pin_key]
+                return False
+            return True
+
+    def check_replicas(self):
+        """检查所有副本的连通性和复制延迟"""
+        for node in self.replicas:
+            self._check(node)
+        self._purge_pins()
+
+    def start_health_checks(self):
+        """启动后台健康检查线程"""
+        if not self.replicas or self._health_thread is not None:
+            return
+        self.check_replicas()
+        self._health_thread = threading.Thread(target=self._health_loop, name='db-health', daemon=True)
+        self._health_thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        return {
+            'primary': self.primary.status(),
+            'replicas': [node.status() for node in self.replicas],
+            'pinned_users': len(self._pins),
+        }
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_replicas()
+
+    def _check(self, node):
+        connection = None
+        try:
+            connection = self._connect(**node.config)
+            cursor = connection.cursor(dictionary=True)
+            lag = self._replication_lag(cursor)
+            cursor.close()
+            node.lag_seconds = lag
+            node.healthy = lag is not None
+            node.last_error = None if lag is not None else '复制已停止'
+        except Error as e:
+            self.mark_unhealthy(node, e)
+        finally:
+            node.checked_at = time.monotonic()
+            if connection is not None:
+                try:
+                    connection.close()
+                except Error:
+                    pass
+
+    @staticmethod
+    def _replication_lag(cursor):
+        """读取复制延迟（秒），复制中断返回 None，未配置复制返回 0"""
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Error:
+            # MySQL 8.0.22 之前的版本
+            cursor.execute("SHOW SLAVE STATUS")
+        row = cursor.fetchone()
+        cursor.fetchall()
+        if not row:
+            return 0.0
+        lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+        return float(lag) if lag is not None else None
+
+    def mark_unhealthy(self, node, error):
+        """标记节点不可用，直到下一次健康检查通过"""
+        node.healthy = False
+        node.last_error = str(error)
+        print(f"数据库节点 {node.name} 不可用: {error}")
+
+    def _purge_pins(self):
+        now = time.monotonic()
+        with self._pins_lock:
+            for key in [k for k, expires in self._pins.items() if expires < now]:
+                del self._pins[key]
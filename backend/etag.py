@@ -0,0 +1,46 @@
+"""
+按用户维护的资源版本号与强 ETag
+写操作递增对应资源的版本号，读接口据此生成 ETag，
+客户端携带 If-None-Match 轮询时可在访问数据库前直接返回 304
+"""
+
+import hashlib
+import secrets
+import threading
+
+
+class ResourceVersions:
+    """{ (user_id, scope): version } 版本号表"""
+
+    def __init__(self):
+        # 进程启动时生成的随机前缀，保证重启后旧 ETag 全部失效
+        self._epoch = secrets.token_hex(4)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, user_id, scope):
+        return self._versions.get((user_id, scope), 0)
+
+    def bump(self, user_ids, *scopes):
+        """递增一个或多个用户在若干资源上的版本号"""
+        if not isinstance(user_ids, (list, tuple, set)):
+            user_ids = (user_ids,)
+        with self._lock:
+            for user_id in user_ids:
+                if user_id is None:
+                    continue
+                for scope in scopes:
+                    key = (user_id, scope)
+                    self._versions[key] = self._versions.get(key, 0) + 1
+
+    def etag(self, user_id, scope, variant=b''):
+        """
+        生成不带引号的强 ETag
+        variant 用于区分同一资源的不同查询参数
+        """
+        tag = f'{self._epoch}-{user_id}-{scope}-{self.version(user_id, scope)}'
+        if variant:
+            if isinstance(variant, str):
+                variant = variant.encode()
+            tag += '-' + hashlib.blake2b(variant, digest_size=6).hexdigest()
+        return tag
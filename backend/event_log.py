@@ -0,0 +1,231 @@
+"""
+对战事件日志
+进度更新和完成事件编码为定长二进制记录（21 字节），按对战缓存在内存中，
+后台线程定期（或缓存超过阈值时）把所有缓存一次性追加到当前段文件，事件处理函数只做一次内存追加
+
+目录结构：
+    segment-000001.log   记录数据，同一对战的一批记录连续存放
+    segment-000001.idx   索引，每批一条 (match_id, 偏移, 长度)
+段文件超过 segment_bytes 后切换到下一个；启动时读取所有 .idx 重建内存索引，
+回放时按索引只读取该对战的数据块，再加上尚未落盘的缓存
+"""
+
+import math
+import os
+import re
+import struct
+import threading
+import time
+
+EVENT_PROGRESS = 1
+EVENT_FINISH = 2
+
+EVENT_NAMES = {EVENT_PROGRESS: 'progress', EVENT_FINISH: 'finish'}
+
+# match_id, user_id, 时间戳（毫秒）, 事件类型, 数值（进度百分比 / 完成用时毫秒）
+RECORD = struct.Struct('<IIQBf')
+INDEX_ENTRY = struct.Struct('<IQI')
+
+# 数值字段为 float32，超出范围的值截断到边界
+EVENT_VALUE_MAX = 3.4028234663852886e38
+
+SEGMENT_PATTERN = re.compile(r'^segment-(\d+)\.log$')
+
+
+def decode_records(data):
+    """把连续的记录解码为事件字典"""
+    for match_id, user_id, ts_ms, kind, value in RECORD.iter_unpack(data):
+        yield {
+            'match_id': match_id,
+            'user_id': user_id,
+            'ts': ts_ms,
+            'type': EVENT_NAMES.get(kind, kind),
+            'value': round(value, 3),
+        }
+
+
+def _record_value(value):
+    """数值字段：非有限值记为 0，超出 float32 范围的值截断到边界"""
+    try:
+        value = float(value or 0)
+    except OverflowError:
+        return EVENT_VALUE_MAX if value > 0 else -EVENT_VALUE_MAX
+    if not math.isfinite(value):
+        return 0.0
+    return max(-EVENT_VALUE_MAX, min(EVENT_VALUE_MAX, value))
+
+
+class EventLog:
+    """按对战缓存、批量落盘的追加式事件日志"""
+
+    def __init__(self, directory, flush_interval=1.0, max_buffer_bytes=1024 * 1024,
+                 segment_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_buffer_bytes = max_buffer_bytes
+        self.segment_bytes = segment_bytes
+
+        self._buffers = {}        # match_id -> bytearray，尚未落盘的记录
+        self._buffered = 0
+        self._index = {}          # match_id -> [(段号, 偏移, 长度)]
+        self._segment = 0
+        self._segment_size = 0
+        self._lock = threading.Lock()        # 保护缓存
+        self._write_lock = threading.Lock()  # 串行化落盘
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.events_appended = 0
+        self.events_dropped = 0
+        self.bytes_written = 0
+        self.flushes = 0
+
+    def append(self, match_id, user_id, kind, value):
+        """追加一条事件（热路径：编码后追加到内存缓存）；无法编码的事件丢弃并计数，不抛出异常"""
+        try:
+            record = RECORD.pack(match_id, user_id, int(time.time() * 1000), kind, _record_value(value))
+        except (struct.error, TypeError, ValueError):
+            self.events_dropped += 1
+            return
+        with self._lock:
+            buffer = self._buffers.get(match_id)
+            if buffer is None:
+                buffer = self._buffers[match_id] = bytearray()
+            buffer += record
+            self._buffered += RECORD.size
+            self.events_appended += 1
+            full = self._buffered >= self.max_buffer_bytes
+        if full:
+            self._wake.set()
+
+    def replay(self, match_id):
+        """按时间顺序返回对战的所有事件（已落盘的部分 + 内存缓存）"""
+        # 同时持有两把锁取快照，避免恰好落盘的那一批既不在索引中也不在缓存中
+        with self._write_lock:
+            chunks = list(self._index.get(match_id, ()))
+            with self._lock:
+                pending = bytes(self._buffers.get(match_id, b''))
+
+        handles = {}
+        try:
+            for segment, offset, length in chunks:
+                f = handles.get(segment)
+                if f is None:
+                    f = handles[segment] = open(self._segment_path(segment, 'log'), 'rb')
+                f.seek(offset)
+                yield from decode_records(f.read(length))
+        finally:
+            for f in handles.values():
+                f.close()
+        yield from decode_records(pending)
+
+    def has_events(self, match_id):
+        return match_id in self._index or match_id in self._buffers
+
+    def flush(self):
+        """把所有缓存写入当前段文件，返回写入的字节数"""
+        with self._write_lock:
+            with self._lock:
+                buffers, self._buffers = self._buffers, {}
+                self._buffered = 0
+            if not buffers:
+                return 0
+
+            if self._segment == 0 or self._segment_size >= self.segment_bytes:
+                self._segment += 1
+                self._segment_size = 0
+
+            data = bytearray()
+            entries = bytearray()
+            locations = []
+            for match_id, buffer in buffers.items():
+                offset = self._segment_size + len(data)
+                data += buffer
+                entries += INDEX_ENTRY.pack(match_id, offset, len(buffer))
+                locations.append((match_id, offset, len(buffer)))
+
+            # 先写数据再写索引：崩溃时索引不会指向不完整的数据
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(self._segment_path(self._segment, 'log'), 'ab') as f:
+                    f.write(data)
+                with open(self._segment_path(self._segment, 'idx'), 'ab') as f:
+                    f.write(entries)
+            except OSError:
+                # 写入失败时放回缓存，下次重试；数据文件可能写了一部分，换到新段
+                with self._lock:
+                    for match_id, buffer in buffers.items():
+                        buffer += self._buffers.get(match_id, b'')
+                        self._buffers[match_id] = buffer
+                    self._buffered = sum(len(buffer) for buffer in self._buffers.values())
+                self._segment_size = self.segment_bytes
+                raise
+
+            for match_id, offset, length in locations:
+                self._index.setdefault(match_id, []).append((self._segment, offset, length))
+            self._segment_size += len(data)
+            self.bytes_written += len(data)
+            self.flushes += 1
+            return len(data)
+
+    def load(self):
+        """读取已有段文件的索引，新的记录写入新的段"""
+        os.makedirs(self.directory, exist_ok=True)
+        segments = sorted(int(m.group(1)) for m in map(SEGMENT_PATTERN.match, os.listdir(self.directory)) if m)
+        with self._write_lock:
+            for segment in segments:
+                path = self._segment_path(segment, 'idx')
+                if not os.path.exists(path):
+                    continue
+                with open(path, 'rb') as f:
+                    data = f.read()
+                usable = len(data) - len(data) % INDEX_ENTRY.size
+                for match_id, offset, length in INDEX_ENTRY.iter_unpack(data[:usable]):
+                    self._index.setdefault(match_id, []).append((segment, offset, length))
+            self._segment = segments[-1] if segments else 0
+            # 不向旧段追加：上次退出时数据文件可能多出未建索引的尾部
+            self._segment_size = self.segment_bytes
+        if segments:
+            print(f"对战事件日志: 载入 {len(segments)} 个段文件, {len(self._index)} 场对战")
+
+    def status(self):
+        with self._lock:
+            buffered = self._buffered
+        return {
+            'events_appended': self.events_appended,
+            'events_dropped': self.events_dropped,
+            'buffered_bytes': buffered,
+            'bytes_written': self.bytes_written,
+            'flushes': self.flushes,
+            'segment': self._segment,
+            'indexed_matches': len(self._index),
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.load()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='event-log', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"对战事件日志写入失败: {e}")
+
+    def _segment_path(self, segment, suffix):
+        return os.path.join(self.directory, f'segment-{segment:06d}.{suffix}')
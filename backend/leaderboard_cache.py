@@ -0,0 +1,118 @@
+"""
+排行榜响应缓存
+按 (difficulty, limit) 缓存已序列化的响应体，LRU 淘汰并限制总字节数；
+新分数只有在可能进入某个已缓存前 N 名时才会使该条目失效
+"""
+
+import threading
+from collections import OrderedDict, deque
+
+
+class _Entry:
+    __slots__ = ('body', 'row_count', 'cutoff')
+
+    def __init__(self, body, row_count, cutoff):
+        self.body = body
+        self.row_count = row_count
+        self.cutoff = cutoff
+
+
+def _enters_top(difficulty, score, time_taken, entry_difficulty, limit, row_count, cutoff):
+    """新分数是否可能出现在该排行榜中（排序规则：score DESC, time_taken ASC，并列时视为进入）"""
+    if entry_difficulty != 'all' and entry_difficulty != difficulty:
+        return False
+    if row_count < limit or cutoff is None:
+        return True
+    cut_score, cut_time = cutoff
+    return score > cut_score or (score == cut_score and time_taken <= cut_time)
+
+
+class LeaderboardCache:
+    """排行榜缓存，条目键为 (difficulty, limit)"""
+
+    def __init__(self, max_entries=64, max_bytes=4 * 1024 * 1024, recent_scores=1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # 最近提交的分数，用于判断加载期间是否有新分数进入榜单
+        self._seq = 0
+        self._recent = deque(maxlen=recent_scores)
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, difficulty, limit):
+        """命中时返回已序列化的响应体，否则返回 None"""
+        with self._lock:
+            entry = self._entries.get((difficulty, limit))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((difficulty, limit))
+            self.hits += 1
+            return entry.body
+
+    def begin_load(self):
+        """开始从数据库加载前调用，返回加载序号"""
+        with self._lock:
+            return self._seq
+
+    def put(self, difficulty, limit, rows, body, load_seq, score_key='score', time_key='time'):
+        """
+        写入缓存
+        若加载期间有新分数可能进入该榜单，则放弃写入，避免缓存旧数据
+        """
+        cutoff = (rows[-1][score_key], rows[-1][time_key]) if rows else None
+        with self._lock:
+            if self._recent and self._recent[0][0] > load_seq + 1:
+                return False
+            for seq, score_difficulty, score, time_taken in self._recent:
+                if seq > load_seq and _enters_top(score_difficulty, score, time_taken,
+                                                  difficulty, limit, len(rows), cutoff):
+                    return False
+
+            if len(body) > self.max_bytes:
+                return False
+            self._remove((difficulty, limit))
+            self._entries[(difficulty, limit)] = _Entry(body, len(rows), cutoff)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            return True
+
+    def on_score(self, difficulty, score, time_taken):
+        """新分数提交后调用，仅使可能受影响的条目失效"""
+        with self._lock:
+            self._seq += 1
+            self._recent.append((self._seq, difficulty, score, time_taken))
+            stale = [
+                key for key, entry in self._entries.items()
+                if _enters_top(difficulty, score, time_taken, key[0], key[1], entry.row_count, entry.cutoff)
+            ]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
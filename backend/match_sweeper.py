@@ -0,0 +1,307 @@
+"""
+对战过期清理
+待回应的邀请超过 TTL 后取消；进行中的对战长时间没有进度更新，或有玩家掉线超过宽限期后结束：
+仍在线的一方判胜（弃赛），双方都不在线则取消
+
+截止时间保存在最小堆中，后台线程睡到最早的截止时间再醒来。进度更新只修改内存中的最后活动时间，
+不操作堆：弹出的条目如果实际截止时间已被推后，重新入堆即可（惰性删除）。
+到期的对战按批处理，每批用一个事务锁定仍处于原状态的行，再用 IN (...) 一次性更新；
+事务失败的批次重新登记，延迟 retry_delay 秒后重试
+"""
+
+import heapq
+import threading
+import time
+
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+
+
+class _TrackedMatch:
+    __slots__ = ('match_id', 'status', 'players', 'deadline_at', 'last_activity', 'left_at', 'retry_at')
+
+    def __init__(self, match_id, status, players, deadline_at=None, last_activity=None):
+        self.match_id = match_id
+        self.status = status
+        self.players = players
+        self.deadline_at = deadline_at     # 待回应邀请的截止时间
+        self.last_activity = last_activity  # 进行中对战的最后活动时间
+        self.left_at = None                 # 有玩家掉线的时间
+        self.retry_at = None                # 上次清理失败后最早的重试时间
+
+    def deadline(self, idle_ttl, disconnect_grace):
+        if self.status == PENDING:
+            deadline = self.deadline_at
+        else:
+            deadline = self.last_activity + idle_ttl
+            if self.left_at is not None:
+                deadline = min(deadline, self.left_at + disconnect_grace)
+        if self.retry_at is not None:
+            deadline = max(deadline, self.retry_at)
+        return deadline
+
+
+class MatchSweeper:
+    """对战过期清理器"""
+
+    def __init__(self, storage, is_online, on_expired, pending_ttl=120, idle_ttl=600,
+                 disconnect_grace=60, batch_size=200, retry_delay=5):
+        self.storage = storage
+        self.is_online = is_online
+        self.on_expired = on_expired
+        self.pending_ttl = pending_ttl
+        self.idle_ttl = idle_ttl
+        self.disconnect_grace = disconnect_grace
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+
+        self._matches = {}       # match_id -> _TrackedMatch
+        self._heap = []          # (截止时间, match_id)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+        self.expired = 0
+        self.forfeited = 0
+        self.cancelled = 0
+
+    def __len__(self):
+        return len(self._matches)
+
+    # ------------------------------------------------------------------
+    # 状态登记（由事件处理函数调用）
+    # ------------------------------------------------------------------
+
+    def track_pending(self, match_id, challenger_id, opponent_id, ttl=None):
+        """登记新邀请，ttl 为 0 时在下一轮立即取消（例如对手不在线）"""
+        ttl = self.pending_ttl if ttl is None else ttl
+        tracked = _TrackedMatch(int(match_id), PENDING, (challenger_id, opponent_id),
+                                deadline_at=time.time() + ttl)
+        self._track(tracked)
+
+    def track_active(self, match_id, challenger_id, opponent_id):
+        """邀请被接受，开始计算空闲时间"""
+        tracked = _TrackedMatch(int(match_id), IN_PROGRESS, (challenger_id, opponent_id),
+                                last_activity=time.time())
+        self._track(tracked)
+
+    def touch(self, match_id):
+        """对战有进度更新（热路径：只修改时间戳）"""
+        tracked = self._matches.get(match_id)
+        if tracked is not None:
+            tracked.last_activity = time.time()
+
+    def forget(self, match_id):
+        """对战已正常结束或被拒绝"""
+        with self._cond:
+            self._matches.pop(int(match_id), None)
+
+    def player_left(self, user_id):
+        """玩家掉线：其进行中的对战进入宽限期"""
+        now = time.time()
+        with self._cond:
+            for tracked in self._matches.values():
+                if tracked.status == IN_PROGRESS and user_id in tracked.players and tracked.left_at is None:
+                    tracked.left_at = now
+                    self._push(tracked)
+
+    def player_returned(self, user_id):
+        """玩家重新上线：取消宽限期（对手仍掉线时保持）"""
+        with self._cond:
+            for tracked in self._matches.values():
+                if tracked.status == IN_PROGRESS and user_id in tracked.players and tracked.left_at is not None:
+                    if all(self.is_online(player) for player in tracked.players):
+                        tracked.left_at = None
+
+    # ------------------------------------------------------------------
+    # 后台线程
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.load()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name='match-sweeper', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def load(self):
+        """启动时登记数据库中遗留的待回应 / 进行中对战（重启前的状态）"""
+        rows = self.storage.execute_query(
+            "SELECT id, challenger_id, opponent_id, status, created_at, started_at FROM matches "
+            "WHERE status IN ('pending', 'in_progress')",
+            fetch='all'
+        ) or []
+        now_wall = time.time()
+        for row in rows:
+            players = (row['challenger_id'], row['opponent_id'])
+            if row['status'] == PENDING:
+                created = row['created_at'].timestamp() if row['created_at'] else now_wall
+                self._track(_TrackedMatch(row['id'], PENDING, players, deadline_at=created + self.pending_ttl))
+            else:
+                started = row['started_at'].timestamp() if row['started_at'] else now_wall
+                tracked = _TrackedMatch(row['id'], IN_PROGRESS, players, last_activity=started)
+                tracked.left_at = now_wall  # 重启后双方都需要重新连接
+                self._track(tracked)
+        if rows:
+            print(f"对战清理: 载入 {len(rows)} 场未结束的对战")
+
+    def status(self):
+        with self._cond:
+            tracked = list(self._matches.values())
+        return {
+            'tracked_pending': sum(1 for t in tracked if t.status == PENDING),
+            'tracked_in_progress': sum(1 for t in tracked if t.status == IN_PROGRESS),
+            'expired': self.expired,
+            'forfeited': self.forfeited,
+            'cancelled': self.cancelled,
+        }
+
+    def sweep(self, now=None):
+        """
+        处理所有已到期的对战，返回处理的场数
+        某一批失败（事务回滚）时把这批对战重新登记，retry_delay 秒后重试，其余批次照常处理，最后抛出异常
+        """
+        now = time.time() if now is None else now
+        due = self._pop_due(now)
+        handled = 0
+        error = None
+        for status in (PENDING, IN_PROGRESS):
+            tracked = [t for t in due if t.status == status]
+            for i in range(0, len(tracked), self.batch_size):
+                batch = tracked[i:i + self.batch_size]
+                try:
+                    handled += self._expire_batch(status, [t.match_id for t in batch])
+                except Exception as e:
+                    self._retry(batch, now + self.retry_delay)
+                    error = e
+        if error is not None:
+            raise error
+        return handled
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                timeout = self._heap[0][0] - time.time() if self._heap else None
+                if timeout is None or timeout > 0:
+                    self._cond.wait(timeout)
+                    continue
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"对战清理失败: {e}")
+                time.sleep(1)
+
+    # ------------------------------------------------------------------
+    # 内部实现
+    # ------------------------------------------------------------------
+
+    def _track(self, tracked):
+        with self._cond:
+            self._matches[tracked.match_id] = tracked
+            self._push(tracked)
+
+    def _push(self, tracked):
+        deadline = tracked.deadline(self.idle_ttl, self.disconnect_grace)
+        heapq.heappush(self._heap, (deadline, tracked.match_id))
+        if self._heap[0][1] == tracked.match_id:
+            self._cond.notify()
+
+    def _retry(self, batch, retry_at):
+        with self._cond:
+            for tracked in batch:
+                # 处理期间同一对战被重新登记（例如邀请被接受）时以新的登记为准
+                if tracked.match_id in self._matches:
+                    continue
+                tracked.retry_at = retry_at
+                self._matches[tracked.match_id] = tracked
+                self._push(tracked)
+
+    def _pop_due(self, now):
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                _, match_id = heapq.heappop(self._heap)
+                tracked = self._matches.get(match_id)
+                if tracked is None:
+                    continue  # 已结束，条目作废
+                deadline = tracked.deadline(self.idle_ttl, self.disconnect_grace)
+                if deadline > now:
+                    heapq.heappush(self._heap, (deadline, match_id))
+                    continue
+                del self._matches[match_id]
+                due.append(tracked)
+        return due
+
+    def _expire_batch(self, status, ids):
+        placeholders = ', '.join(['%s'] * len(ids))
+        cancelled, forfeits = [], {}
+        with self.storage.transaction() as tx:
+            # 锁住仍处于原状态的行：期间被接受 / 完成的对战不会被误处理
+            rows = tx.execute_query(
+                f"SELECT id, challenger_id, opponent_id FROM matches WHERE status = %s AND id IN ({placeholders}) FOR UPDATE",
+                [status] + ids, fetch='all'
+            ) or []
+            for row in rows:
+                online = [p for p in (row['challenger_id'], row['opponent_id']) if self.is_online(p)]
+                if status == IN_PROGRESS and len(online) == 1:
+                    forfeits[row['id']] = online[0]
+                else:
+                    cancelled.append(row['id'])
+
+            # 状态条件与 FOR UPDATE 一起保证只处理仍处于原状态的对战
+            if cancelled:
+                tx.execute_query(
+                    f"UPDATE matches SET status = 'cancelled', completed_at = CURRENT_TIMESTAMP "
+                    f"WHERE id IN ({', '.join(['%s'] * len(cancelled))}) AND status = %s",
+                    cancelled + [status]
+                )
+            if forfeits:
+                cases = ' '.join(['WHEN %s THEN %s'] * len(forfeits))
+                params = [value for pair in forfeits.items() for value in pair] + list(forfeits)
+                tx.execute_query(
+                    f"UPDATE matches SET status = 'completed', completed_at = CURRENT_TIMESTAMP, "
+                    f"winner_id = CASE id {cases} END WHERE id IN ({', '.join(['%s'] * len(forfeits))}) "
+                    f"AND status = 'in_progress'",
+                    params
+                )
+
+        if not rows:
+            return 0
+
+        # 读回最终状态（主库，刚提交的事务在从库上可能还不可见），只通知确实由本次清理完成状态转换的对战
+        placeholders = ', '.join(['%s'] * len(rows))
+        final = {row['id']: row for row in self.storage.execute_query(
+            f"SELECT * FROM matches WHERE id IN ({placeholders})", [row['id'] for row in rows], fetch='all',
+            primary=True) or []}
+
+        results = []
+        for row in rows:
+            match = final.get(row['id'])
+            if row['id'] in forfeits:
+                if not match or match['status'] != 'completed' or match['winner_id'] != forfeits[row['id']]:
+                    print(f"对战清理: 对战 {row['id']} 的判负未生效，跳过通知")
+                    continue
+                outcome = 'forfeit'
+                self.forfeited += 1
+            else:
+                if match and match['status'] != 'cancelled':
+                    print(f"对战清理: 对战 {row['id']} 的取消未生效，跳过通知")
+                    continue
+                if status == PENDING:
+                    outcome = 'expired'
+                    self.expired += 1
+                else:
+                    outcome = 'cancelled'
+                    self.cancelled += 1
+            results.append(dict(row, outcome=outcome, match=match))
+        if results:
+            self.on_expired(results)
+        return len(results)
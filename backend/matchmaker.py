@@ -0,0 +1,171 @@
+"""
+对战匹配队列
+每个难度按技能分划分为宽度固定的桶，每个桶是按加入时间排序的 FIFO 队列（OrderedDict，O(1) 出入队）。
+玩家加入时在自身桶及相邻 base_tolerance 个桶内查找等待最久的对手；没有对手则入队等待。
+等待期间每 widen_seconds 秒容忍范围扩大一个桶，后台线程定期按等待时间从长到短重新为各桶队首查找对手
+
+查找只访问固定数量的桶、只取每个桶的队首，与排队人数无关，每次配对的均摊开销为 O(1)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class MatchTicket:
+    """一名排队中的玩家"""
+
+    __slots__ = ('user_id', 'difficulty', 'skill', 'bucket', 'joined_at', 'data')
+
+    def __init__(self, user_id, difficulty, skill, bucket, joined_at, data):
+        self.user_id = user_id
+        self.difficulty = difficulty
+        self.skill = skill
+        self.bucket = bucket
+        self.joined_at = joined_at
+        self.data = data
+
+
+class Matchmaker:
+    """分桶匹配队列，on_pair(先排队的玩家, 后排队的玩家) 在后台线程配对成功时调用"""
+
+    def __init__(self, on_pair, bucket_width=50, base_tolerance=1, widen_seconds=5, max_tolerance=20,
+                 tick_interval=1.0, clock=time.monotonic):
+        self.on_pair = on_pair
+        self.bucket_width = bucket_width
+        self.base_tolerance = base_tolerance
+        self.widen_seconds = widen_seconds
+        self.max_tolerance = max_tolerance
+        self.tick_interval = tick_interval
+        self.clock = clock
+
+        self._queues = {}    # difficulty -> {桶编号: OrderedDict(user_id -> MatchTicket)}
+        self._tickets = {}   # user_id -> MatchTicket
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.paired = 0
+        self.total_wait = 0.0
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def join(self, user_id, difficulty, skill, data=None):
+        """
+        加入队列（已在队列中则按新参数重新排队）
+        立即找到对手时返回 (对手, 自己) 并且两人都不再排队，否则返回 None
+        """
+        now = self.clock()
+        ticket = MatchTicket(user_id, difficulty, skill, int(skill // self.bucket_width), now, data)
+        with self._lock:
+            self._remove(self._tickets.get(user_id))
+            partner = self._find_partner(ticket, self.base_tolerance)
+            if partner is None:
+                self._queues.setdefault(difficulty, {}).setdefault(ticket.bucket, OrderedDict())[user_id] = ticket
+                self._tickets[user_id] = ticket
+                return None
+            self._remove(partner)
+            self._record(partner, now)
+        return partner, ticket
+
+    def leave(self, user_id):
+        """离开队列，返回玩家之前是否在排队"""
+        with self._lock:
+            ticket = self._tickets.get(user_id)
+            self._remove(ticket)
+        return ticket is not None
+
+    def is_queued(self, user_id):
+        return user_id in self._tickets
+
+    def tick(self):
+        """为等待中的玩家按扩大后的容忍范围重新配对，返回配对列表"""
+        now = self.clock()
+        pairs = []
+        with self._lock:
+            for buckets in self._queues.values():
+                while True:
+                    # 各桶队首按等待时间从长到短处理
+                    heads = sorted((next(iter(queue.values())) for queue in buckets.values() if queue),
+                                   key=lambda t: t.joined_at)
+                    paired = False
+                    for head in heads:
+                        if self._tickets.get(head.user_id) is not head:
+                            continue
+                        partner = self._find_partner(head, self._tolerance(head, now))
+                        if partner is not None:
+                            self._remove(head)
+                            self._remove(partner)
+                            self._record(head, now)
+                            pairs.append((head, partner))
+                            paired = True
+                    if not paired:
+                        break
+        for first, second in pairs:
+            self.on_pair(first, second)
+        return pairs
+
+    def status(self):
+        with self._lock:
+            queued = {difficulty: sum(len(queue) for queue in buckets.values())
+                      for difficulty, buckets in self._queues.items()}
+        return {
+            'queued': queued,
+            'paired': self.paired,
+            'avg_wait_seconds': round(self.total_wait / self.paired, 2) if self.paired else 0,
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='matchmaker', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.tick_interval):
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"匹配队列处理失败: {e}")
+
+    def _tolerance(self, ticket, now):
+        widened = int((now - ticket.joined_at) // self.widen_seconds)
+        return min(self.base_tolerance + widened, self.max_tolerance)
+
+    def _find_partner(self, ticket, tolerance):
+        """在 ±tolerance 个桶内由近到远查找等待最久的对手（调用方持有锁）"""
+        buckets = self._queues.get(ticket.difficulty)
+        if not buckets:
+            return None
+        for distance in range(tolerance + 1):
+            candidates = []
+            for bucket in {ticket.bucket - distance, ticket.bucket + distance}:
+                queue = buckets.get(bucket)
+                if not queue:
+                    continue
+                for other in queue.values():
+                    if other.user_id != ticket.user_id:
+                        candidates.append(other)
+                        break
+            if candidates:
+                return min(candidates, key=lambda t: t.joined_at)
+        return None
+
+    def _remove(self, ticket):
+        if ticket is None or self._tickets.get(ticket.user_id) is not ticket:
+            return
+        del self._tickets[ticket.user_id]
+        buckets = self._queues[ticket.difficulty]
+        queue = buckets[ticket.bucket]
+        del queue[ticket.user_id]
+        if not queue:
+            del buckets[ticket.bucket]
+
+    def _record(self, ticket, now):
+        self.paired += 1
+        self.total_wait += now - ticket.joined_at
@@ -0,0 +1,965 @@
+"""
+内存存储后端（用于基准测试和本地压测）
+按 jigsaw.sql 的表结构在内存中维护带索引的字典表，
+server.py 中的每条 SQL 按规范化后的文本分派到对应的 Python 实现，
+从而在没有 MySQL 的情况下单独测量 Flask/SocketIO 层的开销
+
+新增 SQL 时需要在这里注册对应的实现，未注册的语句会打印错误并返回 None
+"""
+
+import datetime
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from backend.storage import Storage
+
+
+class MemoryStorageError(Exception):
+    """内存后端执行失败（未知语句、唯一键冲突等）"""
+
+
+def normalize_sql(query):
+    """去掉注释并合并空白，作为语句分派的键"""
+    query = re.sub(r'--[^\n]*', ' ', query)
+    return re.sub(r'\s+', ' ', query).strip()
+
+
+def _now():
+    return datetime.datetime.now().replace(microsecond=0)
+
+
+def _fold(value):
+    # utf8mb4_0900_ai_ci 排序规则下字符串比较不区分大小写
+    return value.casefold() if isinstance(value, str) else value
+
+
+def _like(pattern, value):
+    """MySQL LIKE 匹配（% 和 _ 通配，不区分大小写）"""
+    regex = ''.join('.*' if ch == '%' else '.' if ch == '_' else re.escape(ch) for ch in pattern)
+    return re.fullmatch(regex, value or '', re.IGNORECASE | re.DOTALL) is not None
+
+
+def _ratio(total, count):
+    if not count:
+        return Decimal(0)
+    return (Decimal(total) / count).quantize(Decimal('0.0001'))
+
+
+# 每日汇总表中按条件计数的列
+_SCORE_FLAGS = {
+    'games_under_15s': lambda t, s: t <= 15,
+    'games_under_30s': lambda t, s: t <= 30,
+    'games_under_60s': lambda t, s: t <= 60,
+    'games_under_120s': lambda t, s: t <= 120,
+    'games_over_5min': lambda t, s: t >= 300,
+    'games_over_10min': lambda t, s: t >= 600,
+    'scores_over_1000': lambda t, s: s >= 1000,
+    'scores_over_5000': lambda t, s: s >= 5000,
+    'scores_over_10000': lambda t, s: s >= 10000,
+}
+_SUMMED_COLUMNS = ('games', 'total_score', 'total_time') + tuple(_SCORE_FLAGS)
+
+
+def _summarize(rows):
+    """把同一难度的若干条成绩汇总为 score_daily_summaries 的一行（不含 user_id / day）"""
+    summary = {
+        'difficulty': rows[0]['difficulty'],
+        'games': len(rows),
+        'best_score': max(r['score'] for r in rows),
+        'total_score': sum(r['score'] for r in rows),
+        'best_time': min(r['time_taken'] for r in rows),
+        'longest_time': max(r['time_taken'] for r in rows),
+        'total_time': sum(r['time_taken'] for r in rows),
+        'first_played_at': min(r['created_at'] for r in rows),
+        'last_played_at': max(r['created_at'] for r in rows),
+    }
+    for column, predicate in _SCORE_FLAGS.items():
+        summary[column] = sum(1 for r in rows if predicate(r['time_taken'], r['score']))
+    return summary
+
+
+class Table:
+    """内存表：自增主键 + 等值二级索引 + 唯一约束"""
+
+    def __init__(self, name, defaults, indexes=(), unique=(), folded=()):
+        self.name = name
+        self.defaults = defaults
+        self.rows = {}
+        self.next_id = 1
+        self.folded = set(folded)
+        self.unique = [tuple(cols) for cols in unique]
+        self._indexes = {tuple(cols): defaultdict(set) for cols in list(indexes) + self.unique}
+
+    def insert(self, values):
+        row = {'id': self.next_id}
+        for column, default in self.defaults.items():
+            row[column] = default() if callable(default) else default
+        row.update(values)
+        for cols in self.unique:
+            if self._index(cols).get(self._key(cols, row)):
+                raise MemoryStorageError(f"Duplicate entry for key '{self.name}.{'_'.join(cols)}'")
+        self.rows[row['id']] = row
+        self.next_id += 1
+        for cols, index in self._indexes.items():
+            index[self._key(cols, row)].add(row['id'])
+        return row['id']
+
+    def update(self, row, changes):
+        for cols, index in self._indexes.items():
+            if any(col in changes for col in cols):
+                index[self._key(cols, row)].discard(row['id'])
+        row.update(changes)
+        if 'updated_at' in row and 'updated_at' not in changes:
+            row['updated_at'] = _now()
+        for cols, index in self._indexes.items():
+            if any(col in changes for col in cols):
+                index[self._key(cols, row)].add(row['id'])
+
+    def delete(self, row):
+        for cols, index in self._indexes.items():
+            index[self._key(cols, row)].discard(row['id'])
+        del self.rows[row['id']]
+
+    def get(self, row_id):
+        return self.rows.get(_int(row_id))
+
+    def lookup(self, cols, *values):
+        """按索引等值查找"""
+        key = tuple(_fold(v) if col in self.folded else v for col, v in zip(cols, values))
+        return [self.rows[i] for i in sorted(self._index(tuple(cols)).get(key, ()))]
+
+    def _index(self, cols):
+        return self._indexes[tuple(cols)]
+
+    def _key(self, cols, row):
+        return tuple(_fold(row.get(col)) if col in self.folded else row.get(col) for col in cols)
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+_STATEMENTS = {}
+_PATTERNS = []
+
+
+def _sql(*texts):
+    """注册固定文本的语句实现"""
+    def decorator(fn):
+        for text in texts:
+            _STATEMENTS[normalize_sql(text)] = fn
+        return fn
+    return decorator
+
+
+def _sql_pattern(pattern):
+    """注册动态语句（正则匹配规范化后的 SQL）"""
+    def decorator(fn):
+        _PATTERNS.append((re.compile(pattern), fn))
+        return fn
+    return decorator
+
+
+class MemoryStorage(Storage):
+    """内存存储后端"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.tables = {
+            'users': Table('users', {
+                'username': None, 'email': None, 'password_hash': None,
+                'created_at': _now, 'updated_at': _now,
+            }, unique=[('username',), ('email',)], folded=('username', 'email')),
+            'scores': Table('scores', {
+                'user_id': None, 'score': 0, 'difficulty': 'easy', 'time_taken': 0, 'created_at': _now,
+            }, indexes=[('user_id',), ('difficulty',)]),
+            'game_saves': Table('game_saves', {
+                'user_id': None, 'save_name': None, 'difficulty': 'easy', 'progress': Decimal('0.00'),
+                'created_at': _now, 'updated_at': _now, 'game_mode': 'classic', 'elapsed_seconds': 0,
+                'current_score': 0, 'image_source': '', 'placed_pieces_ids': None,
+                'available_pieces_ids': None, 'master_pieces': None,
+            }, indexes=[('user_id',)], unique=[('user_id', 'save_name')]),
+            'friendships': Table('friendships', {
+                'user_one_id': None, 'user_two_id': None, 'status': 'pending', 'action_user_id': None,
+                'created_at': _now, 'updated_at': _now,
+            }, indexes=[('user_one_id',), ('user_two_id',)], unique=[('user_one_id', 'user_two_id')]),
+            'matches': Table('matches', {
+                'challenger_id': None, 'opponent_id': None, 'status': 'pending', 'difficulty': None,
+                'image_source': None, 'winner_id': None, 'challenger_time_ms': None,
+                'opponent_time_ms': None, 'created_at': _now, 'started_at': None, 'completed_at': None,
+                'layout_seed': None,
+            }, indexes=[('challenger_id',), ('opponent_id',), ('status',)]),
+            'user_achievements': Table('user_achievements', {
+                'user_id': None, 'achievement_id': None, 'completed_at': _now,
+            }, indexes=[('user_id',)], unique=[('user_id', 'achievement_id')]),
+            'score_daily_summaries': Table('score_daily_summaries', {
+                'user_id': None, 'difficulty': None, 'day': None,
+            }, indexes=[('user_id',)], unique=[('user_id', 'difficulty', 'day')]),
+            'score_rollup_state': Table('score_rollup_state', {
+                'name': None, 'last_score_id': 0, 'updated_at': _now,
+            }, unique=[('name',)]),
+            'user_ratings': Table('user_ratings', {
+                'user_id': None, 'rating': 1500, 'games': 0, 'wins': 0, 'updated_at': _now,
+            }, unique=[('user_id',)]),
+            'rating_history': Table('rating_history', {
+                'user_id': None, 'match_id': None, 'rating_before': None, 'rating_after': None, 'created_at': _now,
+            }, indexes=[('user_id',)], unique=[('match_id', 'user_id')]),
+            'scores_archive': Table('scores_archive', {
+                'user_id': None, 'score': 0, 'difficulty': None, 'time_taken': 0, 'created_at': None,
+                'archived_at': _now,
+            }),
+        }
+        # 对应迁移 0006 中插入的水位行
+        self.tables['score_rollup_state'].insert({'name': 'daily'})
+        self.statements_executed = 0
+
+    def execute_query(self, query, params=None, fetch=False, pin_key=None, primary=False):
+        params = tuple(params or ())
+        normalized = normalize_sql(query)
+        try:
+            handler, match = self._resolve(normalized)
+            with self._lock:
+                self.statements_executed += 1
+                result = handler(self, params, match)
+        except MemoryStorageError as e:
+            print(f"查询执行失败: {e}")
+            return None
+
+        if fetch not in ('one', 'all'):
+            return result
+        # 返回副本，调用方可以自由修改结果
+        rows = [dict(row) for row in result]
+        return rows if fetch == 'all' else (rows[0] if rows else None)
+
+    @contextmanager
+    def transaction(self):
+        # 持有全局锁依次执行，其他线程看不到中间状态（内存后端不支持回滚）
+        with self._lock:
+            yield self
+
+    def status(self):
+        with self._lock:
+            return {
+                'backend': self.name,
+                'statements_executed': self.statements_executed,
+                'tables': {name: len(table.rows) for name, table in self.tables.items()},
+            }
+
+    def _resolve(self, normalized):
+        handler = _STATEMENTS.get(normalized)
+        if handler is not None:
+            return handler, None
+        for pattern, fn in _PATTERNS:
+            match = pattern.fullmatch(normalized)
+            if match:
+                return fn, match
+        raise MemoryStorageError(f"内存后端不支持该语句: {normalized[:120]}")
+
+    def _user(self, user_id):
+        return self.tables['users'].get(user_id)
+
+    # ------------------------------------------------------------------
+    # users
+    # ------------------------------------------------------------------
+
+    @_sql_pattern(r"SELECT id, username FROM users WHERE id IN \([%s, ]+\)")
+    def _usernames(self, params, _):
+        users = [self._user(user_id) for user_id in params]
+        return [{'id': u['id'], 'username': u['username']} for u in users if u]
+
+    @_sql("SELECT id FROM users WHERE username = %s OR email = %s",
+          "SELECT id, username, email, password_hash FROM users WHERE username = %s OR email = %s")
+    def _users_by_login(self, params, _):
+        users = self.tables['users']
+        found = {row['id']: row for row in users.lookup(('username',), params[0]) + users.lookup(('email',), params[1])}
+        return [found[i] for i in sorted(found)]
+
+    @_sql("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)")
+    def _insert_user(self, params, _):
+        username, email, password_hash = params
+        return self.tables['users'].insert({'username': username, 'email': email, 'password_hash': password_hash})
+
+    @_sql("UPDATE users SET password_hash = %s WHERE id = %s")
+    def _update_password(self, params, _):
+        user = self._user(params[1])
+        if user:
+            self.tables['users'].update(user, {'password_hash': params[0]})
+        return 0
+
+    @_sql("SELECT id FROM users WHERE email = %s")
+    def _user_by_email(self, params, _):
+        return self.tables['users'].lookup(('email',), params[0])
+
+    @_sql("SELECT id, username, email, created_at FROM users WHERE id = %s")
+    def _user_by_id(self, params, _):
+        user = self._user(params[0])
+        return [{k: user[k] for k in ('id', 'username', 'email', 'created_at')}] if user else []
+
+    @_sql("""SELECT u.id, u.username, f.status, f.action_user_id FROM users u LEFT JOIN friendships f ON (
+        (f.user_one_id = u.id AND f.user_two_id = %s) OR (f.user_one_id = %s AND f.user_two_id = u.id)
+        ) WHERE (u.username LIKE %s OR u.email LIKE %s) AND u.id != %s LIMIT 10""")
+    def _search_users(self, params, _):
+        user_id, _, username_like, email_like, _ = params
+        rows = []
+        for user in self.tables['users'].rows.values():
+            if user['id'] == user_id:
+                continue
+            if not (_like(username_like, user['username']) or _like(email_like, user['email'])):
+                continue
+            pair = (min(user_id, user['id']), max(user_id, user['id']))
+            friendship = next(iter(self.tables['friendships'].lookup(('user_one_id', 'user_two_id'), *pair)), None)
+            rows.append({
+                'id': user['id'],
+                'username': user['username'],
+                'status': friendship['status'] if friendship else None,
+                'action_user_id': friendship['action_user_id'] if friendship else None,
+            })
+            if len(rows) == 10:
+                break
+        return rows
+
+    # ------------------------------------------------------------------
+    # scores
+    # ------------------------------------------------------------------
+
+    @_sql("INSERT INTO scores (user_id, score, difficulty, time_taken) VALUES (%s, %s, %s, %s)")
+    def _insert_score(self, params, _):
+        user_id, score, difficulty, time_taken = params
+        return self.tables['scores'].insert({
+            'user_id': user_id, 'score': score, 'difficulty': difficulty, 'time_taken': time_taken,
+        })
+
+    @_sql("""SELECT s.id, s.score, s.difficulty, s.time_taken as time, s.created_at, u.username
+        FROM scores s JOIN users u ON s.user_id = u.id ORDER BY s.score DESC, s.time_taken ASC LIMIT %s""",
+          """SELECT s.id, s.score, s.difficulty, s.time_taken as time, s.created_at, u.username
+        FROM scores s JOIN users u ON s.user_id = u.id WHERE s.difficulty = %s
+        ORDER BY s.score DESC, s.time_taken ASC LIMIT %s""")
+    def _leaderboard(self, params, _):
+        scores = self.tables['scores']
+        if len(params) == 2:
+            candidates = scores.lookup(('difficulty',), params[0])
+        else:
+            candidates = list(scores.rows.values())
+        candidates.sort(key=lambda s: (-s['score'], s['time_taken'], s['id']))
+        rows = []
+        for s in candidates[:int(params[-1])]:
+            user = self._user(s['user_id'])
+            if user:
+                rows.append({
+                    'id': s['id'], 'score': s['score'], 'difficulty': s['difficulty'],
+                    'time': s['time_taken'], 'created_at': s['created_at'], 'username': user['username'],
+                })
+        return rows
+
+    @_sql("""SELECT CAST(IFNULL(SUM(games), 0) AS SIGNED) as games_played, IFNULL(MAX(best_score), 0) as best_score,
+        IFNULL(SUM(total_score) / SUM(games), 0) as avg_score, IFNULL(MIN(best_time), 0) as best_time
+        FROM ( SELECT games, best_score, total_score, best_time FROM score_daily_summaries WHERE user_id = %s
+        UNION ALL SELECT 1, score, score, time_taken FROM scores WHERE user_id = %s
+        AND id > IFNULL((SELECT last_score_id FROM score_rollup_state WHERE name = 'daily'), 0) ) stats""")
+    def _profile_stats(self, params, _):
+        parts = self._score_parts(params[0])
+        games = sum(p['games'] for p in parts)
+        return [{
+            'games_played': games,
+            'best_score': max((p['best_score'] for p in parts), default=0),
+            'avg_score': _ratio(sum(p['total_score'] for p in parts), games),
+            'best_time': min((p['best_time'] for p in parts), default=0),
+        }]
+
+    @_sql("""SELECT
+        -- 基础统计
+        CAST(IFNULL(SUM(games), 0) AS SIGNED) as total_games,
+        IFNULL(MAX(best_score), 0) as best_score,
+        IFNULL(SUM(total_score), 0) as total_score,
+        IFNULL(SUM(total_score) / SUM(games), 0) as avg_score,
+        IFNULL(MIN(best_time), 0) as best_time,
+        IFNULL(MAX(longest_time), 0) as longest_time,
+        IFNULL(SUM(total_time) / SUM(games), 0) as avg_time,
+        CAST(IFNULL(SUM(CASE WHEN difficulty = 'easy' THEN games END), 0) AS SIGNED) as easy_completed,
+        CAST(IFNULL(SUM(CASE WHEN difficulty = 'medium' THEN games END), 0) AS SIGNED) as medium_completed,
+        CAST(IFNULL(SUM(CASE WHEN difficulty = 'hard' THEN games END), 0) AS SIGNED) as hard_completed,
+        CAST(IFNULL(SUM(CASE WHEN difficulty = 'master' THEN games END), 0) AS SIGNED) as master_completed,
+        CAST(IFNULL(SUM(games_under_15s), 0) AS SIGNED) as games_under_15s,
+        CAST(IFNULL(SUM(games_under_30s), 0) AS SIGNED) as games_under_30s,
+        CAST(IFNULL(SUM(games_under_60s), 0) AS SIGNED) as games_under_60s,
+        CAST(IFNULL(SUM(games_over_5min), 0) AS SIGNED) as games_over_5min,
+        CAST(IFNULL(SUM(games_over_10min), 0) AS SIGNED) as games_over_10min,
+        CAST(IFNULL(SUM(CASE WHEN difficulty = 'easy' THEN games_under_30s END), 0) AS SIGNED) as easy_under_30s,
+        CAST(IFNULL(SUM(CASE WHEN difficulty = 'easy' THEN games_under_15s END), 0) AS SIGNED) as easy_under_15s,
+        CAST(IFNULL(SUM(CASE WHEN difficulty = 'medium' THEN games_under_60s END), 0) AS SIGNED) as medium_under_60s,
+        CAST(IFNULL(SUM(CASE WHEN difficulty = 'hard' THEN games_under_120s END), 0) AS SIGNED) as hard_under_120s,
+        CAST(IFNULL(SUM(scores_over_1000), 0) AS SIGNED) as high_score_games,
+        CAST(IFNULL(SUM(scores_over_5000), 0) AS SIGNED) as very_high_score_games,
+        CAST(IFNULL(SUM(scores_over_10000), 0) AS SIGNED) as ultra_high_score_games,
+        MIN(first_played_at) as first_game_date,
+        MAX(last_played_at) as last_game_date
+        FROM (
+        SELECT difficulty, games, best_score, total_score, best_time, longest_time, total_time,
+        games_under_15s, games_under_30s, games_under_60s, games_under_120s,
+        games_over_5min, games_over_10min, scores_over_1000, scores_over_5000, scores_over_10000,
+        first_played_at, last_played_at
+        FROM score_daily_summaries WHERE user_id = %s
+        UNION ALL
+        SELECT difficulty, 1, score, score, time_taken, time_taken, time_taken,
+        time_taken <= 15, time_taken <= 30, time_taken <= 60, time_taken <= 120,
+        time_taken >= 300, time_taken >= 600, score >= 1000, score >= 5000, score >= 10000,
+        created_at, created_at
+        FROM scores WHERE user_id = %s
+        AND id > IFNULL((SELECT last_score_id FROM score_rollup_state WHERE name = 'daily'), 0)
+        ) stats""")
+    def _achievement_stats(self, params, _):
+        parts = self._score_parts(params[0])
+        games = sum(p['games'] for p in parts)
+
+        def total(column, difficulty=None):
+            return sum(p[column] for p in parts if difficulty is None or p['difficulty'] == difficulty)
+
+        return [{
+            'total_games': games,
+            'best_score': max((p['best_score'] for p in parts), default=0),
+            'total_score': Decimal(total('total_score')),
+            'avg_score': _ratio(total('total_score'), games),
+            'best_time': min((p['best_time'] for p in parts), default=0),
+            'longest_time': max((p['longest_time'] for p in parts), default=0),
+            'avg_time': _ratio(total('total_time'), games),
+            'easy_completed': total('games', 'easy'),
+            'medium_completed': total('games', 'medium'),
+            'hard_completed': total('games', 'hard'),
+            'master_completed': total('games', 'master'),
+            'games_under_15s': total('games_under_15s'),
+            'games_under_30s': total('games_under_30s'),
+            'games_under_60s': total('games_under_60s'),
+            'games_over_5min': total('games_over_5min'),
+            'games_over_10min': total('games_over_10min'),
+            'easy_under_30s': total('games_under_30s', 'easy'),
+            'easy_under_15s': total('games_under_15s', 'easy'),
+            'medium_under_60s': total('games_under_60s', 'medium'),
+            'hard_under_120s': total('games_under_120s', 'hard'),
+            'high_score_games': total('scores_over_1000'),
+            'very_high_score_games': total('scores_over_5000'),
+            'ultra_high_score_games': total('scores_over_10000'),
+            'first_game_date': min((p['first_played_at'] for p in parts), default=None),
+            'last_game_date': max((p['last_played_at'] for p in parts), default=None),
+        }]
+
+    # ------------------------------------------------------------------
+    # score rollups / archive
+    # ------------------------------------------------------------------
+
+    def _watermark(self):
+        state = self.tables['score_rollup_state'].lookup(('name',), 'daily')
+        return state[0]['last_score_id'] if state else 0
+
+    def _score_parts(self, user_id):
+        """用户的每日汇总行 + 水位之后的成绩（每条成绩按一行汇总处理）"""
+        watermark = self._watermark()
+        parts = self.tables['score_daily_summaries'].lookup(('user_id',), user_id)
+        parts += [_summarize([r]) for r in self.tables['scores'].lookup(('user_id',), user_id) if r['id'] > watermark]
+        return parts
+
+    @_sql("SELECT last_score_id FROM score_rollup_state WHERE name = %s FOR UPDATE",
+          "SELECT last_score_id FROM score_rollup_state WHERE name = %s")
+    def _rollup_state(self, params, _):
+        return [{'last_score_id': r['last_score_id']}
+                for r in self.tables['score_rollup_state'].lookup(('name',), params[0])]
+
+    @_sql("UPDATE score_rollup_state SET last_score_id = %s WHERE name = %s")
+    def _advance_rollup(self, params, _):
+        table = self.tables['score_rollup_state']
+        for row in table.lookup(('name',), params[1]):
+            table.update(row, {'last_score_id': params[0]})
+
+    @_sql("""SELECT COUNT(*) as count, MAX(id) as max_id FROM ( SELECT id FROM scores
+        WHERE id > %s AND created_at <= CURRENT_TIMESTAMP - INTERVAL %s SECOND ORDER BY id LIMIT %s ) batch""")
+    def _rollup_batch(self, params, _):
+        low, settle_seconds, limit = params
+        cutoff = _now() - datetime.timedelta(seconds=int(settle_seconds))
+        ids = sorted(i for i, r in self.tables['scores'].rows.items() if i > low and r['created_at'] <= cutoff)
+        ids = ids[:int(limit)]
+        return [{'count': len(ids), 'max_id': ids[-1] if ids else None}]
+
+    @_sql("""INSERT INTO score_daily_summaries (
+        user_id, difficulty, day, games, best_score, total_score, best_time, longest_time, total_time,
+        games_under_15s, games_under_30s, games_under_60s, games_under_120s,
+        games_over_5min, games_over_10min, scores_over_1000, scores_over_5000, scores_over_10000,
+        first_played_at, last_played_at
+        )
+        SELECT * FROM (
+        SELECT
+        user_id, difficulty, DATE(created_at) as b_day,
+        COUNT(*) as b_games,
+        MAX(score) as b_best_score,
+        SUM(score) as b_total_score,
+        MIN(time_taken) as b_best_time,
+        MAX(time_taken) as b_longest_time,
+        SUM(time_taken) as b_total_time,
+        SUM(time_taken <= 15) as b_under_15s,
+        SUM(time_taken <= 30) as b_under_30s,
+        SUM(time_taken <= 60) as b_under_60s,
+        SUM(time_taken <= 120) as b_under_120s,
+        SUM(time_taken >= 300) as b_over_5min,
+        SUM(time_taken >= 600) as b_over_10min,
+        SUM(score >= 1000) as b_over_1000,
+        SUM(score >= 5000) as b_over_5000,
+        SUM(score >= 10000) as b_over_10000,
+        MIN(created_at) as b_first,
+        MAX(created_at) as b_last
+        FROM scores
+        WHERE id > %s AND id <= %s
+        GROUP BY user_id, difficulty, DATE(created_at)
+        ) batch
+        ON DUPLICATE KEY UPDATE
+        games = games + b_games,
+        best_score = GREATEST(best_score, b_best_score),
+        total_score = total_score + b_total_score,
+        best_time = LEAST(best_time, b_best_time),
+        longest_time = GREATEST(longest_time, b_longest_time),
+        total_time = total_time + b_total_time,
+        games_under_15s = games_under_15s + b_under_15s,
+        games_under_30s = games_under_30s + b_under_30s,
+        games_under_60s = games_under_60s + b_under_60s,
+        games_under_120s = games_under_120s + b_under_120s,
+        games_over_5min = games_over_5min + b_over_5min,
+        games_over_10min = games_over_10min + b_over_10min,
+        scores_over_1000 = scores_over_1000 + b_over_1000,
+        scores_over_5000 = scores_over_5000 + b_over_5000,
+        scores_over_10000 = scores_over_10000 + b_over_10000,
+        first_played_at = LEAST(first_played_at, b_first),
+        last_played_at = GREATEST(last_played_at, b_last)""")
+    def _upsert_summaries(self, params, _):
+        low, high = params
+        groups = defaultdict(list)
+        for row_id, r in self.tables['scores'].rows.items():
+            if low < row_id <= high:
+                groups[(r['user_id'], r['difficulty'], r['created_at'].date())].append(r)
+
+        summaries = self.tables['score_daily_summaries']
+        for key, rows in groups.items():
+            batch = _summarize(rows)
+            existing = summaries.lookup(('user_id', 'difficulty', 'day'), *key)
+            if not existing:
+                summaries.insert(dict(batch, user_id=key[0], day=key[2]))
+                continue
+            current = existing[0]
+            changes = {column: current[column] + batch[column] for column in _SUMMED_COLUMNS}
+            changes.update(
+                best_score=max(current['best_score'], batch['best_score']),
+                best_time=min(current['best_time'], batch['best_time']),
+                longest_time=max(current['longest_time'], batch['longest_time']),
+                first_played_at=min(current['first_played_at'], batch['first_played_at']),
+                last_played_at=max(current['last_played_at'], batch['last_played_at']),
+            )
+            summaries.update(current, changes)
+
+    @_sql("""SELECT id FROM scores WHERE id > %s AND id <= %s AND created_at < CURRENT_TIMESTAMP - INTERVAL %s DAY
+        ORDER BY id LIMIT %s""")
+    def _archive_candidates(self, params, _):
+        low, high, days, limit = params
+        cutoff = _now() - datetime.timedelta(days=int(days))
+        ids = sorted(i for i, r in self.tables['scores'].rows.items()
+                     if low < i <= high and r['created_at'] < cutoff)
+        return [{'id': i} for i in ids[:int(limit)]]
+
+    @_sql("SELECT id FROM scores WHERE difficulty = %s ORDER BY score DESC, time_taken ASC LIMIT %s")
+    def _top_score_ids(self, params, _):
+        rows = self.tables['scores'].lookup(('difficulty',), params[0])
+        rows.sort(key=lambda s: (-s['score'], s['time_taken'], s['id']))
+        return [{'id': r['id']} for r in rows[:int(params[1])]]
+
+    @_sql_pattern(r"INSERT INTO scores_archive \(id, user_id, score, difficulty, time_taken, created_at\) "
+                  r"SELECT id, user_id, score, difficulty, time_taken, created_at FROM scores WHERE id IN \([%s, ]+\)")
+    def _archive_scores(self, params, _):
+        archive = self.tables['scores_archive']
+        for row_id in params:
+            row = self.tables['scores'].get(row_id)
+            if row:
+                archive.insert({column: row[column] for column in
+                                ('id', 'user_id', 'score', 'difficulty', 'time_taken', 'created_at')})
+
+    @_sql_pattern(r"DELETE FROM scores WHERE id IN \([%s, ]+\)")
+    def _delete_scores(self, params, _):
+        scores = self.tables['scores']
+        for row_id in params:
+            row = scores.get(row_id)
+            if row:
+                scores.delete(row)
+
+    # ------------------------------------------------------------------
+    # user_achievements
+    # ------------------------------------------------------------------
+
+    @_sql("SELECT achievement_id, completed_at FROM user_achievements WHERE user_id = %s")
+    def _user_achievements(self, params, _):
+        return [{'achievement_id': r['achievement_id'], 'completed_at': r['completed_at']}
+                for r in self.tables['user_achievements'].lookup(('user_id',), params[0])]
+
+    @_sql("SELECT id FROM user_achievements WHERE user_id = %s AND achievement_id = %s")
+    def _user_achievement(self, params, _):
+        return self.tables['user_achievements'].lookup(('user_id', 'achievement_id'), *params)
+
+    @_sql("INSERT INTO user_achievements (user_id, achievement_id) VALUES (%s, %s)")
+    def _insert_user_achievement(self, params, _):
+        return self.tables['user_achievements'].insert({'user_id': params[0], 'achievement_id': params[1]})
+
+    # ------------------------------------------------------------------
+    # matches
+    # ------------------------------------------------------------------
+
+    def _user_matches(self, user_id):
+        matches = self.tables['matches']
+        return matches.lookup(('challenger_id',), user_id) + matches.lookup(('opponent_id',), user_id)
+
+    @_sql("INSERT INTO matches (challenger_id, opponent_id, difficulty, image_source, status) "
+          "VALUES (%s, %s, %s, %s, 'pending')")
+    def _insert_match(self, params, _):
+        challenger_id, opponent_id, difficulty, image_source = params
+        return self.tables['matches'].insert({
+            'challenger_id': challenger_id, 'opponent_id': _int(opponent_id),
+            'difficulty': difficulty, 'image_source': image_source, 'status': 'pending',
+        })
+
+    @_sql("INSERT INTO matches (challenger_id, opponent_id, difficulty, image_source, status, started_at, layout_seed) "
+          "VALUES (%s, %s, %s, %s, 'in_progress', CURRENT_TIMESTAMP, %s)")
+    def _insert_started_match(self, params, _):
+        challenger_id, opponent_id, difficulty, image_source, layout_seed = params
+        return self.tables['matches'].insert({
+            'challenger_id': challenger_id, 'opponent_id': opponent_id, 'difficulty': difficulty,
+            'image_source': image_source, 'status': 'in_progress', 'started_at': _now(), 'layout_seed': layout_seed,
+        })
+
+    @_sql("SELECT * FROM matches WHERE id = %s AND opponent_id = %s AND status = 'pending'")
+    def _pending_match(self, params, _):
+        match = self.tables['matches'].get(params[0])
+        if match and match['opponent_id'] == _int(params[1]) and match['status'] == 'pending':
+            return [match]
+        return []
+
+    @_sql("SELECT * FROM matches WHERE id=%s", "SELECT * FROM matches WHERE id = %s")
+    def _match_by_id(self, params, _):
+        match = self.tables['matches'].get(params[0])
+        return [match] if match else []
+
+    @_sql("SELECT challenger_id, opponent_id, status FROM matches WHERE id = %s")
+    def _match_players(self, params, _):
+        match = self.tables['matches'].get(params[0])
+        if not match:
+            return []
+        return [{'challenger_id': match['challenger_id'], 'opponent_id': match['opponent_id'], 'status': match['status']}]
+
+    @_sql("UPDATE matches SET status='in_progress', started_at=CURRENT_TIMESTAMP, layout_seed=%s "
+          "WHERE id=%s AND status='pending'")
+    def _start_match(self, params, _):
+        layout_seed, match_id = params
+        match = self.tables['matches'].get(match_id)
+        if match and match['status'] == 'pending':
+            self.tables['matches'].update(match, {'status': 'in_progress', 'started_at': _now(), 'layout_seed': layout_seed})
+        return 0
+
+    @_sql("UPDATE matches SET status='declined' WHERE id=%s")
+    def _decline_match(self, params, _):
+        match = self.tables['matches'].get(params[0])
+        if match:
+            self.tables['matches'].update(match, {'status': 'declined'})
+        return 0
+
+    @_sql("SELECT id, challenger_id, opponent_id, status, created_at, started_at FROM matches "
+          "WHERE status IN ('pending', 'in_progress')")
+    def _unfinished_matches(self, params, _):
+        matches = self.tables['matches']
+        rows = matches.lookup(('status',), 'pending') + matches.lookup(('status',), 'in_progress')
+        return [{column: m[column] for column in
+                 ('id', 'challenger_id', 'opponent_id', 'status', 'created_at', 'started_at')} for m in rows]
+
+    @_sql_pattern(r"SELECT id, challenger_id, opponent_id FROM matches WHERE status = %s AND id IN \([%s, ]+\) FOR UPDATE")
+    def _lock_matches_in_status(self, params, _):
+        status, ids = params[0], params[1:]
+        rows = [self.tables['matches'].get(match_id) for match_id in ids]
+        return [{'id': m['id'], 'challenger_id': m['challenger_id'], 'opponent_id': m['opponent_id']}
+                for m in rows if m and m['status'] == status]
+
+    @_sql_pattern(r"SELECT \* FROM matches WHERE id IN \([%s, ]+\)")
+    def _matches_by_ids(self, params, _):
+        rows = [self.tables['matches'].get(match_id) for match_id in params]
+        return [m for m in rows if m]
+
+    @_sql_pattern(r"UPDATE matches SET status = 'cancelled', completed_at = CURRENT_TIMESTAMP "
+                  r"WHERE id IN \([%s, ]+\) AND status = %s")
+    def _cancel_matches(self, params, _):
+        *ids, status = params
+        updated = 0
+        for match_id in ids:
+            match = self.tables['matches'].get(match_id)
+            if match and match['status'] == status:
+                self.tables['matches'].update(match, {'status': 'cancelled', 'completed_at': _now()})
+                updated += 1
+        return updated
+
+    @_sql_pattern(r"UPDATE matches SET status = 'completed', completed_at = CURRENT_TIMESTAMP, "
+                  r"winner_id = CASE id (WHEN %s THEN %s ?)+END WHERE id IN \([%s, ]+\) AND status = 'in_progress'")
+    def _forfeit_matches(self, params, _):
+        count = len(params) // 3
+        winners = dict(zip(params[0:2 * count:2], params[1:2 * count:2]))
+        updated = 0
+        for match_id in params[2 * count:]:
+            match = self.tables['matches'].get(match_id)
+            if match and match['status'] == 'in_progress':
+                self.tables['matches'].update(match, {
+                    'status': 'completed', 'completed_at': _now(), 'winner_id': winners.get(match_id),
+                })
+                updated += 1
+        return updated
+
+    @_sql_pattern(r"UPDATE matches SET status = 'completed', winner_id = %s, completed_at = CURRENT_TIMESTAMP, "
+                  r"(challenger_time_ms|opponent_time_ms) = %s WHERE id = %s AND status = 'in_progress'")
+    def _complete_match(self, params, match):
+        winner_id, time_ms, match_id = params
+        row = self.tables['matches'].get(match_id)
+        if not row or row['status'] != 'in_progress':
+            return 0
+        self.tables['matches'].update(row, {
+            'status': 'completed', 'winner_id': winner_id, 'completed_at': _now(), match.group(1): time_ms,
+        })
+        return 1
+
+    @_sql("""SELECT COUNT(DISTINCT CASE WHEN challenger_id = %s THEN opponent_id ELSE challenger_id END) as unique_opponents,
+        COUNT(CASE WHEN winner_id = %s THEN 1 END) as matches_won, COUNT(*) as total_matches
+        FROM matches WHERE (challenger_id = %s OR opponent_id = %s) AND status = 'completed'""")
+    def _social_stats(self, params, _):
+        user_id = params[0]
+        completed = [m for m in self._user_matches(user_id) if m['status'] == 'completed']
+        opponents = {m['opponent_id'] if m['challenger_id'] == user_id else m['challenger_id'] for m in completed}
+        return [{
+            'unique_opponents': len(opponents),
+            'matches_won': sum(1 for m in completed if m['winner_id'] == user_id),
+            'total_matches': len(completed),
+        }]
+
+    @_sql("""(SELECT m.id, m.difficulty, m.completed_at, m.winner_id, opp.id as opponent_id,
+        opp.username as opponent_username FROM matches m JOIN users opp ON m.opponent_id = opp.id
+        WHERE m.challenger_id = %s AND m.status = 'completed' ORDER BY m.completed_at DESC LIMIT 50)
+        UNION ALL
+        (SELECT m.id, m.difficulty, m.completed_at, m.winner_id, chal.id as opponent_id,
+        chal.username as opponent_username FROM matches m JOIN users chal ON m.challenger_id = chal.id
+        WHERE m.opponent_id = %s AND m.status = 'completed' ORDER BY m.completed_at DESC LIMIT 50)
+        ORDER BY completed_at DESC LIMIT 50""")
+    def _match_history(self, params, _):
+        user_id = params[0]
+        rows = []
+        for m in self._user_matches(user_id):
+            if m['status'] != 'completed':
+                continue
+            other = self._user(m['opponent_id'] if m['challenger_id'] == user_id else m['challenger_id'])
+            if other:
+                rows.append({
+                    'id': m['id'], 'difficulty': m['difficulty'], 'completed_at': m['completed_at'],
+                    'winner_id': m['winner_id'], 'opponent_id': other['id'], 'opponent_username': other['username'],
+                })
+        rows.sort(key=lambda r: (r['completed_at'] or datetime.datetime.min, r['id']), reverse=True)
+        return rows[:50]
+
+    @_sql("""SELECT id, challenger_id, opponent_id, winner_id, completed_at FROM matches
+        WHERE status = 'completed' AND winner_id IS NOT NULL
+          AND (completed_at > %s OR (completed_at = %s AND id > %s))
+        ORDER BY completed_at, id
+        LIMIT %s""")
+    def _completed_matches_after(self, params, _):
+        completed_at, _, last_id, limit = params
+        rows = [m for m in self.tables['matches'].lookup(('status',), 'completed')
+                if m['winner_id'] is not None and (m['completed_at'], m['id']) > (completed_at, last_id)]
+        rows.sort(key=lambda m: (m['completed_at'], m['id']))
+        return [{column: m[column] for column in ('id', 'challenger_id', 'opponent_id', 'winner_id', 'completed_at')}
+                for m in rows[:int(limit)]]
+
+    # ------------------------------------------------------------------
+    # user_ratings / rating_history
+    # ------------------------------------------------------------------
+
+    def _upsert_rating(self, user_id, rating, games, wins, increment):
+        ratings = self.tables['user_ratings']
+        existing = ratings.lookup(('user_id',), user_id)
+        if not existing:
+            return ratings.insert({'user_id': user_id, 'rating': rating, 'games': games, 'wins': wins})
+        row = existing[0]
+        if increment:
+            games, wins = row['games'] + games, row['wins'] + wins
+        ratings.update(row, {'rating': rating, 'games': games, 'wins': wins})
+        return row['id']
+
+    @_sql_pattern(r"INSERT INTO user_ratings \(user_id, rating, games, wins\) VALUES \(%s, %s, 1, %s\)(, \(%s, %s, 1, %s\))* "
+                  r"ON DUPLICATE KEY UPDATE rating = VALUES\(rating\), games = games \+ 1, wins = wins \+ VALUES\(wins\)")
+    def _record_ratings(self, params, _):
+        for i in range(0, len(params), 3):
+            user_id, rating, won = params[i:i + 3]
+            self._upsert_rating(user_id, rating, 1, won, increment=True)
+        return 0
+
+    @_sql_pattern(r"INSERT INTO user_ratings \(user_id, rating, games, wins\) VALUES \(%s, %s, %s, %s\)(, \(%s, %s, %s, %s\))* "
+                  r"ON DUPLICATE KEY UPDATE rating = VALUES\(rating\), games = VALUES\(games\), wins = VALUES\(wins\)")
+    def _replace_ratings(self, params, _):
+        for i in range(0, len(params), 4):
+            user_id, rating, games, wins = params[i:i + 4]
+            self._upsert_rating(user_id, rating, games, wins, increment=False)
+        return 0
+
+    @_sql("SELECT user_id, rating, games, wins FROM user_ratings")
+    def _all_ratings(self, params, _):
+        return [{column: r[column] for column in ('user_id', 'rating', 'games', 'wins')}
+                for r in self.tables['user_ratings'].rows.values()]
+
+    @_sql_pattern(r"INSERT INTO rating_history \(user_id, match_id, rating_before, rating_after\) "
+                  r"VALUES \(%s, %s, %s, %s\)(, \(%s, %s, %s, %s\))*")
+    def _insert_rating_history(self, params, _):
+        last_id = None
+        for i in range(0, len(params), 4):
+            user_id, match_id, before, after = params[i:i + 4]
+            last_id = self.tables['rating_history'].insert({
+                'user_id': user_id, 'match_id': match_id, 'rating_before': before, 'rating_after': after,
+            })
+        return last_id
+
+    @_sql("SELECT match_id, rating_before, rating_after, created_at FROM rating_history "
+          "WHERE user_id = %s ORDER BY id DESC LIMIT 20")
+    def _rating_history(self, params, _):
+        rows = self.tables['rating_history'].lookup(('user_id',), params[0])
+        return [{column: r[column] for column in ('match_id', 'rating_before', 'rating_after', 'created_at')}
+                for r in reversed(rows[-20:])]
+
+    # ------------------------------------------------------------------
+    # friendships
+    # ------------------------------------------------------------------
+
+    def _user_friendships(self, user_id):
+        friendships = self.tables['friendships']
+        return friendships.lookup(('user_one_id',), user_id) + friendships.lookup(('user_two_id',), user_id)
+
+    @_sql("SELECT id FROM friendships WHERE user_one_id = %s AND user_two_id = %s")
+    def _friendship_by_pair(self, params, _):
+        return self.tables['friendships'].lookup(('user_one_id', 'user_two_id'), *params)
+
+    @_sql("INSERT INTO friendships (user_one_id, user_two_id, action_user_id, status) VALUES (%s, %s, %s, 'pending')")
+    def _insert_friendship(self, params, _):
+        user_one_id, user_two_id, action_user_id = params
+        return self.tables['friendships'].insert({
+            'user_one_id': user_one_id, 'user_two_id': user_two_id,
+            'action_user_id': action_user_id, 'status': 'pending',
+        })
+
+    @_sql("""SELECT u.id, u.username FROM friendships f
+        JOIN users u ON u.id = CASE WHEN f.user_one_id = %s THEN f.user_two_id ELSE f.user_one_id END
+        WHERE (f.user_one_id = %s OR f.user_two_id = %s) AND f.status = 'accepted'""")
+    def _friends(self, params, _):
+        user_id = params[0]
+        rows = []
+        for f in self._user_friendships(user_id):
+            if f['status'] != 'accepted':
+                continue
+            other = self._user(f['user_two_id'] if f['user_one_id'] == user_id else f['user_one_id'])
+            if other:
+                rows.append({'id': other['id'], 'username': other['username']})
+        return rows
+
+    @_sql("""SELECT f.id as friendship_id, u.id as user_id, u.username FROM friendships f
+        JOIN users u ON u.id = f.action_user_id
+        WHERE (f.user_one_id = %s OR f.user_two_id = %s) AND f.status = 'pending' AND f.action_user_id != %s""")
+    def _friend_requests(self, params, _):
+        user_id = params[0]
+        rows = []
+        for f in self._user_friendships(user_id):
+            if f['status'] != 'pending' or f['action_user_id'] == user_id:
+                continue
+            sender = self._user(f['action_user_id'])
+            if sender:
+                rows.append({'friendship_id': f['id'], 'user_id': sender['id'], 'username': sender['username']})
+        return rows
+
+    @_sql("SELECT * FROM friendships WHERE id = %s AND (user_one_id = %s OR user_two_id = %s) AND action_user_id != %s")
+    def _friendship_for_receiver(self, params, _):
+        friendship_id, user_id, _, _ = params
+        f = self.tables['friendships'].get(friendship_id)
+        if f and user_id in (f['user_one_id'], f['user_two_id']) and f['action_user_id'] != user_id:
+            return [f]
+        return []
+
+    @_sql("UPDATE friendships SET status = 'accepted', action_user_id = %s WHERE id = %s")
+    def _accept_friendship(self, params, _):
+        f = self.tables['friendships'].get(params[1])
+        if f:
+            self.tables['friendships'].update(f, {'status': 'accepted', 'action_user_id': params[0]})
+        return 0
+
+    @_sql("DELETE FROM friendships WHERE id = %s")
+    def _delete_friendship(self, params, _):
+        f = self.tables['friendships'].get(params[0])
+        if f:
+            self.tables['friendships'].delete(f)
+        return 0
+
+    # ------------------------------------------------------------------
+    # game_saves
+    # ------------------------------------------------------------------
+
+    def _saves_where(self, conditions, values):
+        rows = self.tables['game_saves'].lookup(('user_id',), values[0])
+        for column, value in zip(conditions[1:], values[1:]):
+            rows = [r for r in rows if r[column] == value]
+        return rows
+
+    @_sql("SELECT id FROM game_saves WHERE user_id = %s AND game_mode = %s AND difficulty = %s")
+    def _save_id(self, params, _):
+        return [{'id': r['id']} for r in self._saves_where(('user_id', 'game_mode', 'difficulty'), params)]
+
+    @_sql("DELETE FROM game_saves WHERE user_id = %s AND game_mode = %s AND difficulty = %s",
+          "DELETE FROM game_saves WHERE user_id = %s AND difficulty = %s")
+    def _delete_saves(self, params, _):
+        columns = ('user_id', 'game_mode', 'difficulty') if len(params) == 3 else ('user_id', 'difficulty')
+        for row in self._saves_where(columns, params):
+            self.tables['game_saves'].delete(row)
+        return 0
+
+    @_sql("""UPDATE game_saves SET elapsed_seconds = %s, current_score = %s, image_source = %s,
+        placed_pieces_ids = %s, available_pieces_ids = %s, master_pieces = %s,
+        progress = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = %s AND game_mode = %s AND difficulty = %s""")
+    def _update_save(self, params, _):
+        changes = dict(zip(('elapsed_seconds', 'current_score', 'image_source', 'placed_pieces_ids',
+                            'available_pieces_ids', 'master_pieces', 'progress'), params[:7]))
+        changes['progress'] = Decimal(str(changes['progress'])).quantize(Decimal('0.01'))
+        changes['updated_at'] = _now()
+        for row in self._saves_where(('user_id', 'game_mode', 'difficulty'), params[7:]):
+            self.tables['game_saves'].update(row, changes)
+        return 0
+
+    @_sql("""INSERT INTO game_saves (user_id, save_name, game_mode, difficulty, elapsed_seconds,
+        current_score, image_source, placed_pieces_ids, available_pieces_ids,
+        master_pieces, progress) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""")
+    def _insert_save(self, params, _):
+        values = dict(zip(('user_id', 'save_name', 'game_mode', 'difficulty', 'elapsed_seconds',
+                           'current_score', 'image_source', 'placed_pieces_ids', 'available_pieces_ids',
+                           'master_pieces', 'progress'), params))
+        values['progress'] = Decimal(str(values['progress'])).quantize(Decimal('0.01'))
+        return self.tables['game_saves'].insert(values)
+
+    @_sql("""SELECT id, save_name, game_mode, difficulty, elapsed_seconds, current_score,
+        image_source, progress, created_at, updated_at FROM game_saves WHERE user_id = %s ORDER BY updated_at DESC""")
+    def _list_saves(self, params, _):
+        columns = ('id', 'save_name', 'game_mode', 'difficulty', 'elapsed_seconds', 'current_score',
+                   'image_source', 'progress', 'created_at', 'updated_at')
+        rows = sorted(self.tables['game_saves'].lookup(('user_id',), params[0]),
+                      key=lambda r: (r['updated_at'], r['id']), reverse=True)
+        return [{c: r[c] for c in columns} for r in rows]
+
+    @_sql_pattern(r"SELECT id, save_name, game_mode, difficulty, elapsed_seconds, current_score, image_source, "
+                  r"placed_pieces_ids, available_pieces_ids, master_pieces, progress, created_at, updated_at "
+                  r"FROM game_saves WHERE (user_id = %s(?: AND \w+ = %s)*) ORDER BY updated_at DESC LIMIT 1")
+    def _load_save(self, params, match):
+        conditions = [c.split(' = ')[0] for c in match.group(1).split(' AND ')]
+        rows = sorted(self._saves_where(conditions, params), key=lambda r: (r['updated_at'], r['id']), reverse=True)
+        return [{k: v for k, v in rows[0].items() if k != 'user_id'}] if rows else []
@@ -0,0 +1,196 @@
+"""
+运行指标（Prometheus 文本格式）
+计数器和直方图按线程分片：热路径只修改当前线程自己的字典，不加锁；
+采集时汇总所有分片，已退出线程的分片合并进公共分片后释放，
+因此每请求一线程的服务器模型下分片数量不会无限增长
+
+仪表盘类指标（在线人数、连接池使用量等）在采集时通过回调读取
+"""
+
+import bisect
+import math
+import threading
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _ShardedMetric:
+    """按线程分片的指标基类"""
+
+    type_name = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []      # [(thread, values)]
+        self._retired = {}     # 已退出线程的累计值
+
+    def _values(self):
+        values = getattr(self._local, 'values', None)
+        if values is None:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+        return values
+
+    def _collect(self):
+        """汇总所有分片，返回 {labels: value}"""
+        with self._lock:
+            alive = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, values))
+                else:
+                    for labels, value in list(values.items()):
+                        self._merge_into(self._retired, labels, value)
+            self._shards = alive
+
+            total = {}
+            for labels, value in self._retired.items():
+                self._merge_into(total, labels, value)
+            for _, values in alive:
+                # 其他线程可能同时写入，复制一份快照再合并
+                for labels, value in list(values.items()):
+                    self._merge_into(total, labels, value)
+        return total
+
+    def _merge_into(self, target, labels, value):
+        raise NotImplementedError
+
+    def _label_text(self, labels, extra=()):
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter(_ShardedMetric):
+    """单调递增计数器"""
+
+    type_name = 'counter'
+
+    def inc(self, *labels, amount=1):
+        values = self._values()
+        values[labels] = values.get(labels, 0) + amount
+
+    def _merge_into(self, target, labels, value):
+        target[labels] = target.get(labels, 0) + value
+
+    def render(self):
+        return [f'{self.name}{self._label_text(labels)} {_number(value)}'
+                for labels, value in sorted(self._collect().items())]
+
+
+class Histogram(_ShardedMetric):
+    """固定分桶的直方图（秒）"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        values = self._values()
+        entry = values.get(labels)
+        if entry is None:
+            # [各桶计数（非累积，最后一个为 +Inf）, 总和, 次数]
+            entry = values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def _merge_into(self, target, labels, value):
+        entry = target.get(labels)
+        if entry is None:
+            target[labels] = [list(value[0]), value[1], value[2]]
+            return
+        for i, count in enumerate(value[0]):
+            entry[0][i] += count
+        entry[1] += value[1]
+        entry[2] += value[2]
+
+    def render(self):
+        lines = []
+        for labels, (counts, total, count) in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == math.inf else _number(bound)
+                lines.append(f'{self.name}_bucket{self._label_text(labels, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{self._label_text(labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{self._label_text(labels)} {count}')
+        return lines
+
+
+class Gauge:
+    """采集时通过回调读取的仪表盘指标，回调返回数值或 {labels: value}"""
+
+    type_name = 'gauge'
+
+    def __init__(self, name, help_text, callback, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self):
+        value = self.callback()
+        if not isinstance(value, dict):
+            return [f'{self.name} {_number(value)}']
+        lines = []
+        for labels, v in sorted(value.items()):
+            pairs = ','.join(f'{k}="{_escape(l)}"' for k, l in zip(self.labelnames, labels))
+            lines.append(f'{self.name}{{{pairs}}} {_number(v)}')
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, callback, labelnames=()):
+        return self._register(Gauge(name, help_text, callback, labelnames))
+
+    def render(self):
+        """生成 Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = metric.render()
+            except Exception as e:
+                print(f"指标采集失败 {metric.name}: {e}")
+                continue
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
@@ -0,0 +1,165 @@
+"""
+数据库结构迁移
+migrations/ 目录下的 NNNN_描述.sql 按版本号顺序执行，已执行的版本记录在 schema_migrations 表中
+（版本号、名称、文件内容的 SHA-256、执行时间），重复运行只会执行尚未执行的版本
+
+MySQL 的 DDL 会隐式提交，一个迁移文件执行到一半失败时无法回滚，
+因此每个文件尽量只包含一条 ALTER / CREATE 语句；失败后修正文件再重新运行即可
+"""
+
+import hashlib
+import os
+import re
+import time
+
+MIGRATION_FILE_PATTERN = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+# 多个进程同时运行迁移时用 MySQL 命名锁串行化
+MIGRATION_LOCK_NAME = 'jigsaw_schema_migrations'
+MIGRATION_LOCK_TIMEOUT = 30
+
+
+class MigrationError(Exception):
+    """迁移文件无效或执行失败"""
+
+
+def split_statements(sql):
+    """去掉 -- 注释后按分号拆分语句（迁移文件中的字符串字面量不能包含分号）"""
+    sql = re.sub(r'--[^\n]*', '', sql)
+    return [statement.strip() for statement in sql.split(';') if statement.strip()]
+
+
+class Migration:
+    """一个迁移文件"""
+
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path, encoding='utf-8') as f:
+            self.sql = f.read()
+        self.checksum = hashlib.sha256(self.sql.encode('utf-8')).hexdigest()
+
+    def statements(self):
+        return split_statements(self.sql)
+
+
+def load_migrations(directory):
+    """读取目录下的迁移文件，按版本号排序"""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE_PATTERN.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+
+    versions = [m.version for m in migrations]
+    duplicates = sorted({v for v in versions if versions.count(v) > 1})
+    if duplicates:
+        raise MigrationError(f'迁移版本号重复: {duplicates}')
+    return sorted(migrations, key=lambda m: m.version)
+
+
+class Migrator:
+    """迁移执行器，connect 为返回 mysql.connector 连接的函数"""
+
+    def __init__(self, connect, directory):
+        self.connect = connect
+        self.directory = directory
+
+    def status(self):
+        """每个版本的状态：applied / pending / changed（已执行后文件被修改）/ missing（已执行但文件不存在）"""
+        migrations = load_migrations(self.directory)
+        conn = self.connect()
+        try:
+            applied = self._applied(conn)
+        finally:
+            conn.close()
+
+        rows = []
+        for m in migrations:
+            record = applied.pop(m.version, None)
+            if record is None:
+                state = 'pending'
+            elif record['checksum'] != m.checksum:
+                state = 'changed'
+            else:
+                state = 'applied'
+            rows.append({'version': m.version, 'name': m.name, 'state': state,
+                         'applied_at': record['applied_at'] if record else None})
+        for version, record in sorted(applied.items()):
+            rows.append({'version': version, 'name': record['name'], 'state': 'missing',
+                         'applied_at': record['applied_at']})
+        return rows
+
+    def migrate(self, target=None, dry_run=False):
+        """执行所有版本号不超过 target 的待执行迁移，返回执行的版本列表"""
+        migrations = [m for m in load_migrations(self.directory) if target is None or m.version <= target]
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT))
+            if cursor.fetchone()[0] != 1:
+                raise MigrationError('等待迁移锁超时，可能有其他进程正在执行迁移')
+            try:
+                return self._apply_pending(conn, migrations, dry_run)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+                cursor.fetchall()
+                cursor.close()
+        finally:
+            conn.close()
+
+    def _apply_pending(self, conn, migrations, dry_run):
+        applied = self._applied(conn)
+        for m in migrations:
+            if m.version in applied and applied[m.version]['checksum'] != m.checksum:
+                print(f"警告: 迁移 {m.version:04d}_{m.name} 执行后文件已被修改，不会重新执行")
+
+        pending = [m for m in migrations if m.version not in applied]
+        done = []
+        for m in pending:
+            if dry_run:
+                print(f"[dry-run] {m.version:04d}_{m.name}")
+                for statement in m.statements():
+                    print(f"    {statement};")
+                done.append(m.version)
+                continue
+
+            start = time.perf_counter()
+            cursor = conn.cursor()
+            try:
+                for statement in m.statements():
+                    cursor.execute(statement)
+                    if cursor.with_rows:
+                        cursor.fetchall()
+                duration_ms = int((time.perf_counter() - start) * 1000)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name, checksum, duration_ms) VALUES (%s, %s, %s, %s)",
+                    (m.version, m.name, m.checksum, duration_ms)
+                )
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise MigrationError(f'迁移 {m.version:04d}_{m.name} 执行失败: {e}') from e
+            finally:
+                cursor.close()
+            print(f"已执行迁移 {m.version:04d}_{m.name} ({duration_ms} ms)")
+            done.append(m.version)
+        return done
+
+    def _applied(self, conn):
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT NOT NULL PRIMARY KEY,
+                    name VARCHAR(255) NOT NULL,
+                    checksum CHAR(64) NOT NULL,
+                    duration_ms INT NOT NULL DEFAULT 0,
+                    applied_at TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+            """)
+            cursor.execute("SELECT version, name, checksum, applied_at FROM schema_migrations")
+            return {row['version']: row for row in cursor.fetchall()}
+        finally:
+            cursor.close()
@@ -0,0 +1,142 @@
+"""
+密码哈希服务
+在有界线程池中执行 scrypt 慢哈希，避免在请求线程中长时间占用 CPU，
+并兼容旧版无盐 SHA-256 哈希（登录成功后透明升级）
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+SCHEME = 'scrypt'
+LEGACY_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class HasherBusyError(Exception):
+    """哈希任务队列已满或等待超时"""
+
+
+class PasswordHasher:
+    """基于 scrypt 的密码哈希器，哈希计算在后台线程池中进行"""
+
+    def __init__(self, max_workers=4, max_queue=32, wait_timeout=5.0,
+                 target_ms=100, min_cost=2 ** 12, max_cost=2 ** 16,
+                 block_size=8, parallelism=1, salt_bytes=16):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.wait_timeout = wait_timeout
+        self.target_ms = target_ms
+        self.min_cost = min_cost
+        self.max_cost = max_cost
+        self.block_size = block_size
+        self.parallelism = parallelism
+        self.salt_bytes = salt_bytes
+
+        self.cost = min_cost
+        self._calibrated = False
+        self._calibrate_lock = threading.Lock()
+        # 执行中 + 排队中的任务总数上限
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pwhash')
+
+    def calibrate(self):
+        """选取耗时不超过目标延迟的最大成本参数（2 的幂）"""
+        with self._calibrate_lock:
+            if self._calibrated:
+                return self.cost
+            cost = self.min_cost
+            while cost < self.max_cost:
+                start = time.perf_counter()
+                self._derive(b'calibration', os.urandom(self.salt_bytes), cost * 2)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if elapsed_ms > self.target_ms:
+                    break
+                cost *= 2
+            self.cost = cost
+            self._calibrated = True
+            print(f"密码哈希成本参数已校准为 N={cost}")
+            return cost
+
+    def hash(self, password):
+        """生成新的密码哈希字符串"""
+        if not self._calibrated:
+            self.calibrate()
+        return self._run(self._hash_sync, password, self.cost)
+
+    def verify(self, password, stored_hash):
+        """
+        验证密码
+        返回 (是否匹配, 是否需要重新哈希)
+        """
+        if not stored_hash:
+            return False, False
+
+        if LEGACY_SHA256_RE.match(stored_hash):
+            legacy = hashlib.sha256(password.encode()).hexdigest()
+            matched = hmac.compare_digest(legacy, stored_hash)
+            return matched, matched
+
+        if not self._calibrated:
+            self.calibrate()
+        matched, cost = self._run(self._verify_sync, password, stored_hash)
+        return matched, matched and cost < self.cost
+
+    def stats(self):
+        """当前线程池负载情况"""
+        return {
+            'cost': self.cost,
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'available_slots': self._slots._value,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusyError('密码哈希队列已满')
+        try:
+            future = self._executor.submit(fn, *args)
+        except RuntimeError:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.wait_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise HasherBusyError('密码哈希等待超时')
+
+    def _derive(self, password_bytes, salt, cost, block_size=None, parallelism=None):
+        block_size = block_size or self.block_size
+        parallelism = parallelism or self.parallelism
+        return hashlib.scrypt(
+            password_bytes, salt=salt, n=cost, r=block_size, p=parallelism,
+            maxmem=256 * block_size * cost, dklen=32
+        )
+
+    def _hash_sync(self, password, cost):
+        salt = os.urandom(self.salt_bytes)
+        digest = self._derive(password.encode(), salt, cost)
+        return '$'.join([
+            SCHEME, str(cost), str(self.block_size), str(self.parallelism),
+            base64.b64encode(salt).decode(), base64.b64encode(digest).decode()
+        ])
+
+    def _verify_sync(self, password, stored_hash):
+        try:
+            scheme, cost, block_size, parallelism, salt, digest = stored_hash.split('$')
+            if scheme != SCHEME:
+                return False, 0
+            cost, block_size, parallelism = int(cost), int(block_size), int(parallelism)
+            expected = base64.b64decode(salt), base64.b64decode(digest)
+        except ValueError:
+            return False, 0
+        actual = self._derive(password.encode(), expected[0], cost, block_size, parallelism)
+        return hmac.compare_digest(actual, expected[1]), cost
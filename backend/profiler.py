@@ -0,0 +1,237 @@
+"""
+按需采样分析器
+运行时开启后，按采样比例（或指定的路由 / SocketIO 事件）挑选请求，
+后台线程定期通过 sys._current_frames() 读取这些请求所在线程的调用栈，
+结束时输出 collapsed stack（可直接交给 flamegraph.pl / speedscope）和按函数的累计耗时
+
+开销控制：
+- 每次采样的耗时计入开销，采样间隔自动拉长，保证采样线程占用不超过 max_overhead
+- 到达截止时间自动关闭并写出结果，开启时长有上限
+"""
+
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+
+class ProfilerBusyError(Exception):
+    """已有分析会话在运行"""
+
+
+class ProfileSession:
+    """一次分析会话的配置和采样结果"""
+
+    def __init__(self, duration, sample_rate, targets, interval, include_async):
+        self.started_at = datetime.datetime.now()
+        self.deadline = time.monotonic() + duration
+        self.duration = duration
+        self.sample_rate = sample_rate
+        self.targets = frozenset(targets or ())
+        self.interval = interval
+        self.include_async = include_async
+
+        self.stacks = Counter()        # (请求名, 栈帧...) -> 采样次数
+        self.stack_seconds = Counter() # (请求名, 栈帧...) -> 这些采样代表的墙钟秒数
+        self.samples = 0
+        self.profiled_requests = 0
+        self.sampling_seconds = 0.0
+        self.effective_interval = interval
+        self.stop_reason = None
+
+    def wants(self, name):
+        if self.targets and name not in self.targets:
+            return False
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def status(self):
+        elapsed = max(1e-9, time.monotonic() - (self.deadline - self.duration))
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'remaining_seconds': max(0.0, round(self.deadline - time.monotonic(), 1)),
+            'sample_rate': self.sample_rate,
+            'targets': sorted(self.targets),
+            'interval_ms': self.interval * 1000,
+            'effective_interval_ms': round(self.effective_interval * 1000, 3),
+            'samples': self.samples,
+            'profiled_requests': self.profiled_requests,
+            'overhead': round(self.sampling_seconds / elapsed, 4),
+        }
+
+
+class SamplingProfiler:
+    """采样分析器"""
+
+    def __init__(self, output_dir, max_overhead=0.02, max_duration=600, async_thread_name='async-db'):
+        self.output_dir = output_dir
+        self.max_overhead = max_overhead
+        self.max_duration = max_duration
+        self.async_thread_name = async_thread_name
+
+        self._session = None
+        self._watched = {}   # 线程ID -> 请求名
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._labels = {}    # code 对象 -> 帧标签
+        self.last_result = None
+
+    @property
+    def active(self):
+        return self._session is not None
+
+    def start(self, duration=60, sample_rate=0.1, targets=None, interval=0.005, include_async=False):
+        """开启分析会话，到期自动关闭"""
+        duration = min(float(duration), self.max_duration)
+        if duration <= 0 or not 0 < sample_rate <= 1 or interval <= 0:
+            raise ValueError('duration、interval 必须为正数，sample_rate 必须在 (0, 1] 之间')
+
+        with self._lock:
+            if self._session is not None:
+                raise ProfilerBusyError('分析会话已在运行')
+            self._session = ProfileSession(duration, sample_rate, targets, interval, include_async)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(self._session,),
+                                            name='sampling-profiler', daemon=True)
+            self._thread.start()
+        print(f"采样分析已开启: {duration}s, 采样比例 {sample_rate}, 目标 {sorted(targets or []) or '全部'}")
+        return self._session.status()
+
+    def stop(self):
+        """手动关闭当前会话并等待结果写出"""
+        thread = self._thread
+        if thread is None:
+            return self.last_result
+        self._stop.set()
+        thread.join(10)
+        return self.last_result
+
+    def begin(self, name):
+        """请求开始时调用：被选中时登记当前线程，返回 end() 所需的令牌"""
+        session = self._session
+        if session is None or not session.wants(name):
+            return None
+        ident = threading.get_ident()
+        with self._lock:
+            if self._session is not session:
+                return None
+            self._watched[ident] = name
+            session.profiled_requests += 1
+        return ident
+
+    def end(self, token):
+        if token is None:
+            return
+        with self._lock:
+            self._watched.pop(token, None)
+
+    def status(self):
+        session = self._session
+        return {
+            'active': session is not None,
+            'session': session.status() if session else None,
+            'last_result': self.last_result,
+        }
+
+    def _run(self, session):
+        async_ident = None
+        if session.include_async:
+            async_ident = next((t.ident for t in threading.enumerate() if t.name == self.async_thread_name), None)
+
+        # 每个采样代表距上一次采样的实际时间（首个采样按配置的间隔计）
+        last_sample = time.perf_counter() - session.interval
+        while not self._stop.is_set() and time.monotonic() < session.deadline:
+            start = time.perf_counter()
+            self._sample(session, async_ident, start - last_sample)
+            last_sample = start
+            cost = time.perf_counter() - start
+            session.sampling_seconds += cost
+            # 保证 cost / (cost + sleep) <= max_overhead
+            session.effective_interval = max(session.interval, cost / self.max_overhead - cost)
+            self._stop.wait(session.effective_interval)
+
+        session.stop_reason = 'stopped' if self._stop.is_set() else 'expired'
+        with self._lock:
+            self._session = None
+            self._watched.clear()
+            self._thread = None
+        self.last_result = self._write(session)
+        print(f"采样分析已结束（{session.stop_reason}），结果: {self.last_result['collapsed']}")
+
+    def _sample(self, session, async_ident, weight):
+        with self._lock:
+            watched = dict(self._watched)
+        if async_ident is not None:
+            watched.setdefault(async_ident, self.async_thread_name)
+        if not watched:
+            return
+
+        frames = sys._current_frames()
+        for ident, name in watched.items():
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(name)
+            stack.reverse()
+            stack = tuple(stack)
+            session.stacks[stack] += 1
+            session.stack_seconds[stack] += weight
+            session.samples += 1
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+        return label
+
+    def _write(self, session):
+        """写出 collapsed stack 和按函数的累计/自身耗时"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        # 同一秒内结束的多个会话（或多个进程）不互相覆盖
+        stamp = f"{session.started_at.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        collapsed_path = os.path.join(self.output_dir, f'profile-{stamp}.collapsed')
+        functions_path = os.path.join(self.output_dir, f'profile-{stamp}-functions.json')
+
+        with open(collapsed_path, 'w', encoding='utf-8') as f:
+            for stack, count in session.stacks.most_common():
+                f.write(';'.join(frame.replace(';', ',') for frame in stack) + f' {count}\n')
+
+        # 耗时按每个采样实际代表的间隔累加，采样间隔在会话中被拉长时也不会高估或低估
+        cumulative = Counter()
+        own = Counter()
+        cumulative_seconds = Counter()
+        own_seconds = Counter()
+        for stack, count in session.stacks.items():
+            seconds = session.stack_seconds[stack]
+            frames = stack[1:]
+            for frame in set(frames):
+                cumulative[frame] += count
+                cumulative_seconds[frame] += seconds
+            if frames:
+                own[frames[-1]] += count
+                own_seconds[frames[-1]] += seconds
+        functions = [
+            {
+                'function': frame,
+                'cumulative_samples': count,
+                'cumulative_seconds': round(cumulative_seconds[frame], 4),
+                'self_samples': own[frame],
+                'self_seconds': round(own_seconds[frame], 4),
+            }
+            for frame, count in cumulative.most_common()
+        ]
+        summary = dict(session.status(), stop_reason=session.stop_reason)
+        with open(functions_path, 'w', encoding='utf-8') as f:
+            json.dump({'session': summary, 'functions': functions}, f, indent=2, ensure_ascii=False)
+
+        return {'collapsed': collapsed_path, 'functions': functions_path,
+                'samples': session.samples, 'stop_reason': session.stop_reason}
@@ -0,0 +1,105 @@
+"""
+对战拼图布局（与客户端 lib/services/puzzle_generate_service.dart 保持一致的参考实现）
+服务器在对战开始时为每场对战生成一个种子，随 match_started 下发；
+双方客户端用同一种子在本地生成相同的网格图和边缘凹凸，线上不需要传输布局本身
+
+随机数使用 xorshift32，初始状态由种子经 Jenkins one-at-a-time 散列得到（相邻种子的序列互不相关）；
+只用到移位、异或和 32 位加法，Dart（含 Web 平台）与 Python 的结果逐位相同。
+网格图的节点 / 边编号规则与客户端 generateGridGraph 相同：节点 id = row * cols + col，
+按行优先遍历，每个节点先连右边再连下边，边 id 依次递增
+"""
+
+import secrets
+
+DEFAULT_PUZZLE_IMAGE = 'assets/images/default_puzzle.jpg'
+DEFAULT_IMAGES = tuple(f'assets/images/{i}.jpg' for i in range(1, 12))
+
+# 与客户端 _getDifficultySize 一致，未知难度按 3x3 处理
+GRID_SIZES = {'easy': 3, 'medium': 4, 'hard': 5}
+
+_MASK32 = 0xFFFFFFFF
+_ZERO_STATE = 0x9E3779B9  # xorshift 的状态不能为 0
+
+
+def new_layout_seed():
+    """生成对战种子（31 位正整数，客户端各平台都能精确表示）"""
+    return secrets.randbits(31) or 1
+
+
+def grid_size(difficulty):
+    return GRID_SIZES.get(difficulty, 3)
+
+
+def _hash_seed(seed):
+    """Jenkins one-at-a-time 散列（按小端逐字节）"""
+    h = 0
+    for i in range(4):
+        h = (h + ((seed >> (8 * i)) & 0xFF)) & _MASK32
+        h = (h + ((h << 10) & _MASK32)) & _MASK32
+        h ^= h >> 6
+    h = (h + ((h << 3) & _MASK32)) & _MASK32
+    h ^= h >> 11
+    h = (h + ((h << 15) & _MASK32)) & _MASK32
+    return h
+
+
+class LayoutRandom:
+    """xorshift32 伪随机数生成器"""
+
+    def __init__(self, seed):
+        self.state = _hash_seed(seed & _MASK32) or _ZERO_STATE
+
+    def next_uint32(self):
+        x = self.state
+        x ^= (x << 13) & _MASK32
+        x ^= x >> 17
+        x ^= (x << 5) & _MASK32
+        self.state = x
+        return x
+
+    def next_bool(self):
+        # 取最高位，xorshift 的低位质量较差
+        return (self.next_uint32() >> 31) == 1
+
+
+def generate_grid_graph(rows, cols):
+    """返回边列表 [(edge_id, node_a, node_b)]，编号与客户端一致"""
+    edges = []
+    for row in range(rows):
+        for col in range(cols):
+            node = row * cols + col
+            if col < cols - 1:
+                edges.append((len(edges), node, node + 1))
+            if row < rows - 1:
+                edges.append((len(edges), node, node + cols))
+    return edges
+
+
+def generate_layout(seed, size):
+    """按边 id 顺序返回每条边的 isConvexOnA"""
+    random = LayoutRandom(seed)
+    return [random.next_bool() for _ in generate_grid_graph(size, size)]
+
+
+def resolve_image(image_source, seed):
+    """默认图片由种子决定，双方看到同一张图"""
+    if image_source == DEFAULT_PUZZLE_IMAGE:
+        return DEFAULT_IMAGES[seed % len(DEFAULT_IMAGES)]
+    return image_source
+
+
+def layout_signature(layout):
+    """布局签名：每 4 条边组成一个十六进制字符（第 j 条边为第 j 位）"""
+    chars = []
+    for start in range(0, len(layout), 4):
+        nibble = 0
+        for bit, convex in enumerate(layout[start:start + 4]):
+            if convex:
+                nibble |= 1 << bit
+        chars.append('0123456789abcdef'[nibble])
+    return ''.join(chars)
+
+
+def verify_layout(seed, difficulty, signature):
+    """校验客户端上报的布局签名"""
+    return layout_signature(generate_layout(seed, grid_size(difficulty))) == signature
@@ -0,0 +1,441 @@
+"""
+服务端拼图切割
+与客户端 PuzzleGenerateService（_cropToSquare / _sliceImage）相同的几何：图片按中心裁剪为正方形，
+按网格和种子决定的边缘凹凸（backend/puzzle_layout.py）生成每块的轮廓，把所有拼图块打包到一张图集，
+并输出每块在图集中的位置、在原图中的中心、邻居和边缘类型，客户端只需下载两张图片和一份 JSON
+
+结果按内容散列缓存在磁盘上，分两级：
+    正方形图片   键 = 图片内容散列 + 最大边长，与网格和种子无关，部署时可预先生成
+    图集 + 元数据 键 = 正方形图片的键 + 网格大小 + 种子
+缓存目录总大小超过上限时按最近使用时间（LRU，以目录的修改时间持久化）淘汰；
+同一个键的并发请求只计算一次
+
+依赖 Pillow 和 NumPy，未安装时 PuzzleSlicer 抛出 SlicerUnavailableError
+"""
+
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+try:
+    import numpy as np
+    from PIL import Image, ImageDraw, features
+except ImportError:
+    np = None
+    Image = ImageDraw = features = None
+
+from backend.puzzle_layout import generate_grid_graph, generate_layout, layout_signature
+from backend.singleflight import SingleFlight
+
+# 几何或输出格式变化时递增，使旧的缓存条目不再被引用
+SLICER_VERSION = 1
+
+# 与客户端 generatePuzzleEdgePath / _sliceImage 一致
+BUMP_RATIO = 0.35
+BUMP_HEIGHT = 0.2
+
+CURVE_STEPS = 16   # 每段贝塞尔曲线折线化的段数
+SUPERSAMPLE = 4    # 轮廓按 4 倍分辨率绘制后缩小，得到抗锯齿的边缘
+ATLAS_PADDING = 2  # 图集中拼图块之间的间隔，避免纹理过滤时相邻块互相渗色
+
+SQUARE_IMAGE = 'image.jpg'
+# 图集优先使用 WebP（带透明通道，体积约为 PNG 的 1/8），Pillow 未编译 WebP 支持时退回 PNG
+ATLAS_IMAGES = {'webp': 'atlas.webp', 'png': 'atlas.png'}
+PIECES_JSON = 'pieces.json'
+CACHE_FILES = (SQUARE_IMAGE, PIECES_JSON) + tuple(ATLAS_IMAGES.values())
+
+
+class SlicerUnavailableError(Exception):
+    """未安装 Pillow / NumPy"""
+
+
+class InvalidImageError(Exception):
+    """图片无法解码"""
+
+
+def _cubic(p0, p1, p2, p3, steps):
+    """三次贝塞尔曲线折线化（不含起点）"""
+    t = np.linspace(0.0, 1.0, steps + 1)[1:, None]
+    u = 1.0 - t
+    return (u ** 3) * p0 + 3 * (u ** 2) * t * p1 + 3 * u * (t ** 2) * p2 + (t ** 3) * p3
+
+
+def edge_outline(length, bump, convex):
+    """
+    一条边在局部坐标系中的折线（从 (0,0) 到 (length,0)，不含起点），
+    与客户端 generatePuzzleEdgePath 相同：convex 时凸起朝 +y
+    """
+    if convex is None:
+        return np.array([[length, 0.0]])
+    height = bump if convex else -bump
+    p = lambda x, y: np.array([x, y], dtype=float)
+    return np.concatenate([
+        [p(length * BUMP_RATIO, 0)],
+        _cubic(p(length * BUMP_RATIO, 0), p(length * 0.40, 0), p(length * 0.35, height), p(length * 0.50, height),
+               CURVE_STEPS),
+        _cubic(p(length * 0.50, height), p(length * 0.65, height), p(length * 0.60, 0),
+               p(length * (1 - BUMP_RATIO), 0), CURVE_STEPS),
+        [p(length, 0)],
+    ])
+
+
+def piece_outline(piece_size, bump, edge_types):
+    """拼图块轮廓（相对方形部分左上角），四条边按 上、右、下、左 的顺序旋转拼接"""
+    size = piece_size
+    top = edge_outline(size, bump, edge_types['top'])
+    right = edge_outline(size, bump, edge_types['right'])
+    bottom = edge_outline(size, bump, edge_types['bottom'])
+    left = edge_outline(size, bump, edge_types['left'])
+    return np.concatenate([
+        [[0.0, 0.0]],
+        top,
+        np.stack([size - right[:, 1], right[:, 0]], axis=1),
+        np.stack([size - bottom[:, 0], size - bottom[:, 1]], axis=1),
+        np.stack([left[:, 1], size - left[:, 0]], axis=1),
+    ])
+
+
+def square_crop(image, max_side=None):
+    """按中心裁剪为正方形（与客户端 _cropToSquare 一致），边长超过 max_side 时缩小"""
+    side = min(image.width, image.height)
+    left = (image.width - side) // 2
+    top = (image.height - side) // 2
+    image = image.crop((left, top, left + side, top + side))
+    if max_side and side > max_side:
+        image = image.resize((max_side, max_side), Image.LANCZOS)
+    return image
+
+
+def _piece_edges(grid_size, seed):
+    """每块拼图四个方向的邻居和边缘类型（True 表示在本块视角为凸起）"""
+    convex = generate_layout(seed, grid_size)
+    edge_ids = {(a, b): edge_id for edge_id, a, b in generate_grid_graph(grid_size, grid_size)}
+    pieces = []
+    for node in range(grid_size * grid_size):
+        row, col = divmod(node, grid_size)
+        neighbors = {
+            'top': node - grid_size if row > 0 else None,
+            'right': node + 1 if col < grid_size - 1 else None,
+            'bottom': node + grid_size if row < grid_size - 1 else None,
+            'left': node - 1 if col > 0 else None,
+        }
+        edge_types = {}
+        for side, neighbor in neighbors.items():
+            if neighbor is None:
+                edge_types[side] = None
+            elif (node, neighbor) in edge_ids:
+                edge_types[side] = convex[edge_ids[(node, neighbor)]]
+            else:
+                edge_types[side] = not convex[edge_ids[(neighbor, node)]]
+        pieces.append((node, row, col, neighbors, edge_types))
+    return pieces
+
+
+def _shelf_pack(sizes, padding):
+    """简单的货架打包：按高度从大到小逐行放置，返回每块的 (x, y) 和图集尺寸"""
+    # 每行能放下 ceil(sqrt(n)) 个最宽的块，图集接近正方形
+    per_row = int(math.ceil(math.sqrt(len(sizes))))
+    width = per_row * (max(w for w, _ in sizes) + padding) - padding
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+    positions = [None] * len(sizes)
+    x = y = shelf_height = 0
+    for i in order:
+        w, h = sizes[i]
+        if x + w > width:
+            x = 0
+            y += shelf_height + padding
+            shelf_height = 0
+        positions[i] = (x, y)
+        x += w + padding
+        shelf_height = max(shelf_height, h)
+    return positions, width, y + shelf_height
+
+
+def slice_image(square, grid_size, seed):
+    """
+    把正方形图片切割为拼图块，返回 (图集 RGBA 图片, 元数据)
+    坐标单位均为正方形图片的像素
+    """
+    side = square.width
+    piece_size = side / grid_size
+    bump = piece_size * BUMP_HEIGHT
+    pixels = np.asarray(square.convert('RGB'))
+
+    pieces = []
+    for node, row, col, neighbors, edge_types in _piece_edges(grid_size, seed):
+        outline = piece_outline(piece_size, bump, edge_types) + (col * piece_size, row * piece_size)
+        x0, y0 = (max(0, int(math.floor(v))) for v in outline.min(axis=0))
+        x1, y1 = (min(side, int(math.ceil(v))) for v in outline.max(axis=0))
+        w, h = x1 - x0, y1 - y0
+
+        mask = Image.new('L', (w * SUPERSAMPLE, h * SUPERSAMPLE), 0)
+        points = ((outline - (x0, y0)) * SUPERSAMPLE).ravel().tolist()
+        ImageDraw.Draw(mask).polygon(points, fill=255)
+        mask = mask.resize((w, h), Image.BOX)
+
+        rgba = np.empty((h, w, 4), dtype=np.uint8)
+        rgba[..., :3] = pixels[y0:y1, x0:x1]
+        rgba[..., 3] = np.asarray(mask)
+        center = ((col + 0.5) * piece_size, (row + 0.5) * piece_size)
+        pieces.append({
+            'node_id': node,
+            'row': row,
+            'col': col,
+            'origin': [x0, y0],
+            'position': [round(center[0], 3), round(center[1], 3)],
+            'pivot': [round(center[0] - x0, 3), round(center[1] - y0, 3)],
+            'neighbors': neighbors,
+            'edge_types': edge_types,
+            '_pixels': rgba,
+        })
+
+    positions, width, height = _shelf_pack([(p['_pixels'].shape[1], p['_pixels'].shape[0]) for p in pieces],
+                                           ATLAS_PADDING)
+    atlas = np.zeros((height, width, 4), dtype=np.uint8)
+    for piece, (x, y) in zip(pieces, positions):
+        block = piece.pop('_pixels')
+        h, w = block.shape[:2]
+        atlas[y:y + h, x:x + w] = block
+        piece['atlas'] = [x, y, w, h]
+
+    metadata = {
+        'version': SLICER_VERSION,
+        'grid_size': grid_size,
+        'seed': seed,
+        'layout_signature': layout_signature(generate_layout(seed, grid_size)),
+        'side': side,
+        'piece_size': round(piece_size, 3),
+        'bump_size': round(bump, 3),
+        'atlas_size': [width, height],
+        'pieces': pieces,
+    }
+    return Image.fromarray(atlas, 'RGBA'), metadata
+
+
+class SliceCache:
+    """
+    磁盘缓存：每个条目是 directory/<键前两位>/<键>/ 下的若干文件
+    写入先落到临时目录再整体改名，读取方不会看到写了一半的条目
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # 键 -> 字节数，按最近使用排序
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key, name=None):
+        entry = os.path.join(self.directory, key[:2], key)
+        return entry if name is None else os.path.join(entry, name)
+
+    def get(self, key):
+        """命中时返回条目目录（并记为最近使用），否则返回 None"""
+        entry = self.path(key)
+        with self._lock:
+            if key not in self._entries:
+                if not os.path.isdir(entry):
+                    self.misses += 1
+                    return None
+                # 其它进程（如预生成脚本）写入的条目
+                self._adopt(key, entry)
+            self._entries.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, files):
+        """写入条目 {文件名: 内容}，返回条目目录"""
+        entry = self.path(key)
+        staging = os.path.join(self.directory, 'tmp', uuid.uuid4().hex)
+        os.makedirs(staging)
+        try:
+            for name, data in files.items():
+                with open(os.path.join(staging, name), 'wb') as f:
+                    f.write(data)
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            try:
+                os.rename(staging, entry)
+            except OSError:
+                # 已有相同内容的条目（并发写入），保留先到的
+                if not os.path.isdir(entry):
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        with self._lock:
+            if key not in self._entries:
+                self._adopt(key, entry)
+            self._entries.move_to_end(key)
+            self._evict(keep=key)
+        return entry
+
+    def load(self):
+        """扫描缓存目录，按修改时间恢复 LRU 顺序，并清理上次退出时残留的临时目录"""
+        shutil.rmtree(os.path.join(self.directory, 'tmp'), ignore_errors=True)
+        found = []
+        if os.path.isdir(self.directory):
+            for prefix in os.listdir(self.directory):
+                parent = os.path.join(self.directory, prefix)
+                if len(prefix) != 2 or not os.path.isdir(parent):
+                    continue
+                for key in os.listdir(parent):
+                    entry = os.path.join(parent, key)
+                    try:
+                        found.append((os.stat(entry).st_mtime, key, entry))
+                    except OSError:
+                        continue
+        found.sort()
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            for _, key, entry in found:
+                self._adopt(key, entry)
+            self._evict()
+        print(f"拼图切割缓存: {len(self._entries)} 个条目, {self._bytes / 1024 / 1024:.1f} MB")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _adopt(self, key, entry):
+        size = 0
+        for name in os.listdir(entry):
+            try:
+                size += os.path.getsize(os.path.join(entry, name))
+            except OSError:
+                pass
+        self._entries[key] = size
+        self._bytes += size
+
+    def _evict(self, keep=None):
+        while self._bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            self._bytes -= self._entries.pop(key)
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            self.evictions += 1
+
+
+def content_key(*parts):
+    return hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+class PuzzleSlicer:
+    """按 (图片内容, 网格大小, 种子) 生成并缓存切割结果"""
+
+    def __init__(self, cache, max_side=1024, jpeg_quality=90, webp_quality=90):
+        self.cache = cache
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self.webp_quality = webp_quality
+        self.atlas_format = 'webp' if self.available() and features.check('webp') else 'png'
+        self._flights = SingleFlight()
+        self._digests = {}   # 文件路径 -> ((修改时间, 大小), 内容散列)
+
+        self.computed = 0
+        self.compute_seconds = 0.0
+
+    @staticmethod
+    def available():
+        return np is not None and Image is not None
+
+    def file_digest(self, path):
+        """图片文件的内容散列（按修改时间和大小缓存，避免每次重新读取）"""
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._digests.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self._digests[path] = (signature, digest)
+        return digest
+
+    def slice_file(self, path, grid_size, seed):
+        return self._slice(self.file_digest(path), lambda: path, grid_size, seed)
+
+    def slice_bytes(self, data, grid_size, seed):
+        return self._slice(hashlib.sha256(data).hexdigest(), lambda: io.BytesIO(data), grid_size, seed)
+
+    def square(self, digest, open_source):
+        """正方形图片的缓存键（未缓存时解码、裁剪并写入缓存）"""
+        if not self.available():
+            raise SlicerUnavailableError('服务器未安装 Pillow / NumPy')
+        key = content_key('square', SLICER_VERSION, digest, self.max_side)
+        if self.cache.get(key) is None:
+            self._flights.do(key, self._build_square, key, open_source)
+        return key
+
+    def stats(self):
+        return dict(self.cache.stats(), computed=self.computed,
+                    avg_compute_ms=round(self.compute_seconds / self.computed * 1000, 1) if self.computed else 0)
+
+    def _slice(self, digest, open_source, grid_size, seed):
+        """返回 (切割结果的缓存键, 正方形图片的缓存键)"""
+        square_key = self.square(digest, open_source)
+        key = content_key('slice', SLICER_VERSION, square_key, grid_size, seed, self.atlas_format)
+        if self.cache.get(key) is None:
+            self._flights.do(key, self._build_slice, key, square_key, open_source, grid_size, seed)
+        return key, square_key
+
+    def _build_square(self, key, open_source):
+        if self.cache.get(key) is not None:
+            return
+        try:
+            with Image.open(open_source()) as source:
+                image = square_crop(source.convert('RGB'), self.max_side)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise InvalidImageError('无法解码图片') from e
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=self.jpeg_quality)
+        self.cache.put(key, {SQUARE_IMAGE: buffer.getvalue()})
+
+    def _build_slice(self, key, square_key, open_source, grid_size, seed):
+        if self.cache.get(key) is not None:
+            return
+        started = time.perf_counter()
+        try:
+            source = Image.open(self.cache.path(square_key, SQUARE_IMAGE))
+        except FileNotFoundError:
+            # 正方形图片恰好被淘汰，重新生成
+            self._build_square(square_key, open_source)
+            source = Image.open(self.cache.path(square_key, SQUARE_IMAGE))
+        with source:
+            square = source.convert('RGB')
+        atlas, metadata = slice_image(square, grid_size, seed)
+        buffer = io.BytesIO()
+        if self.atlas_format == 'webp':
+            atlas.save(buffer, 'WEBP', quality=self.webp_quality)
+        else:
+            atlas.save(buffer, 'PNG', compress_level=3)
+        metadata['key'] = key
+        metadata['image_key'] = square_key
+        metadata['atlas_file'] = ATLAS_IMAGES[self.atlas_format]
+        self.cache.put(key, {
+            ATLAS_IMAGES[self.atlas_format]: buffer.getvalue(),
+            PIECES_JSON: json.dumps(metadata, separators=(',', ':')).encode(),
+        })
+        self.computed += 1
+        self.compute_seconds += time.perf_counter() - started
@@ -0,0 +1,103 @@
+"""
+内存滑动窗口限流器
+按 用户 / IP / 会话sid 对接口和 SocketIO 事件计数，每个键只保存常数大小的状态，
+长时间未访问的键会被自动淘汰
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class RatePolicy:
+    """限流策略：window 秒内最多 limit 次，按 scopes 中的每个维度分别计数"""
+
+    def __init__(self, limit, window, scopes=('ip',)):
+        self.limit = limit
+        self.window = float(window)
+        self.scopes = tuple(scopes)
+
+
+class RateLimiter:
+    """
+    滑动窗口计数器（双窗口近似）
+    每个键只保存 [当前窗口起点, 上一窗口计数, 当前窗口计数, 最近访问时间]
+    """
+
+    def __init__(self, policies, idle_ttl=600, max_keys=100000, clock=time.monotonic):
+        self.policies = dict(policies)
+        self.idle_ttl = idle_ttl
+        self.max_keys = max_keys
+        self._clock = clock
+        self._counters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, policy_name, identities):
+        """
+        记录一次访问
+        identities: { 'ip': ..., 'user': ..., 'sid': ... }
+        返回 (是否允许, 建议重试等待秒数)
+        """
+        policy = self.policies.get(policy_name)
+        if policy is None:
+            return True, 0
+
+        now = self._clock()
+        with self._lock:
+            self._evict(now)
+
+            counters = []
+            retry_after = 0.0
+            for scope in policy.scopes:
+                identity = identities.get(scope)
+                if identity is None:
+                    continue
+                counter = self._counter((policy_name, scope, identity), policy.window, now)
+                counters.append(counter)
+
+                elapsed = now - counter[0]
+                weight = max(0.0, (policy.window - elapsed) / policy.window)
+                estimated = counter[1] * weight + counter[2]
+                if estimated + 1 > policy.limit:
+                    retry_after = max(retry_after, policy.window - elapsed)
+
+            if retry_after > 0:
+                return False, max(1, math.ceil(retry_after))
+
+            for counter in counters:
+                counter[2] += 1
+            return True, 0
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+    def __len__(self):
+        return len(self._counters)
+
+    def _counter(self, key, window, now):
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = [now, 0, 0, now]
+            self._counters[key] = counter
+        else:
+            self._counters.move_to_end(key)
+
+        # 滚动窗口：跨过一个窗口时当前计数变为上一窗口计数，跨过两个及以上窗口时清零
+        elapsed = now - counter[0]
+        if elapsed >= window:
+            windows_passed = int(elapsed // window)
+            counter[1] = counter[2] if windows_passed == 1 else 0
+            counter[2] = 0
+            counter[0] += windows_passed * window
+        counter[3] = now
+        return counter
+
+    def _evict(self, now):
+        # OrderedDict 按最近访问排序，队首即最久未访问的键
+        while self._counters:
+            key, counter = next(iter(self._counters.items()))
+            if now - counter[3] < self.idle_ttl and len(self._counters) < self.max_keys:
+                break
+            del self._counters[key]
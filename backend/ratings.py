@@ -0,0 +1,230 @@
+"""
+对战等级分（Elo）
+每场有胜者的对战结束时增量更新双方等级分：内存中的天梯提供当前分数和名次，
+数据库只追加写入（user_ratings 当前值 + rating_history 变化记录），读取时不需要重算历史
+
+天梯以整数分数为下标维护一棵树状数组（Fenwick tree）记录每个分数的人数，
+名次 = 分数更高的人数 + 1，按名次分页时用树状数组定位第 k 名所在的分数，均为 O(log 分数范围)
+
+启动时按完成时间顺序分批流式读取已完成的对战并重放，得到与增量更新相同的结果
+"""
+
+import datetime
+import threading
+from collections import OrderedDict
+
+INITIAL_RATING = 1500
+MIN_RATING = 0
+MAX_RATING = 4000
+
+# K 系数：新玩家等级分变化更快，尽快收敛到真实水平
+PROVISIONAL_GAMES = 30
+PROVISIONAL_K = 40
+ESTABLISHED_K = 20
+
+# 去重：同一场对战可能被完成事件和过期清理同时结算，只记录一次
+RECENT_MATCHES = 10000
+
+
+def expected_score(rating, opponent_rating):
+    """rating 一方对 opponent_rating 一方的期望得分"""
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def k_factor(games):
+    return PROVISIONAL_K if games < PROVISIONAL_GAMES else ESTABLISHED_K
+
+
+def _clamp(rating):
+    return max(MIN_RATING, min(MAX_RATING, rating))
+
+
+class _Fenwick:
+    """树状数组：下标为分数，值为该分数的人数"""
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self._top_bit = 1 << (size.bit_length() - 1)
+
+    def add(self, index, delta):
+        index += 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index):
+        """下标 0..index 的人数之和"""
+        total = 0
+        index += 1
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, k):
+        """前缀和首次达到 k（k 从 1 开始）的下标"""
+        position = 0
+        step = self._top_bit
+        while step:
+            nxt = position + step
+            if nxt <= self.size and self.tree[nxt] < k:
+                position = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return position
+
+
+class RatingLadder:
+    """内存天梯：user_id -> (等级分, 场次, 胜场)，按等级分排名"""
+
+    def __init__(self):
+        self._ratings = {}
+        self._games = {}
+        self._wins = {}
+        self._members = {}      # 等级分 -> {user_id}
+        self._counts = _Fenwick(MAX_RATING - MIN_RATING + 1)
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ratings)
+
+    def rating(self, user_id):
+        return self._ratings.get(user_id, INITIAL_RATING)
+
+    def get(self, user_id):
+        """等级分、名次（未参加过对战时为 None）、场次、胜场"""
+        with self._lock:
+            if user_id not in self._ratings:
+                return {'rating': INITIAL_RATING, 'rank': None, 'games': 0, 'wins': 0}
+            return {
+                'rating': self._ratings[user_id],
+                'rank': self._rank(self._ratings[user_id]),
+                'games': self._games[user_id],
+                'wins': self._wins[user_id],
+            }
+
+    def page(self, offset, limit):
+        """按名次分页（同分按 user_id），返回 [{'user_id', 'rating', 'rank', 'games', 'wins'}]"""
+        rows = []
+        with self._lock:
+            total = len(self._ratings)
+            position = offset
+            while len(rows) < limit and position < total:
+                # 第 position+1 名在升序中的位置
+                rating = MIN_RATING + self._counts.find(total - position)
+                rank = self._rank(rating)
+                members = sorted(self._members[rating])
+                # 同分的人共享名次，跳过已在前一页出现的部分
+                for user_id in members[position - (rank - 1):]:
+                    if len(rows) >= limit:
+                        break
+                    rows.append({'user_id': user_id, 'rating': rating, 'rank': rank,
+                                 'games': self._games[user_id], 'wins': self._wins[user_id]})
+                position = rank - 1 + len(members)
+        return rows
+
+    def record(self, match_id, winner_id, loser_id):
+        """
+        结算一场对战，返回双方的变化 [(user_id, 结算前, 结算后, 是否获胜)]
+        已结算过的对战返回空列表
+        """
+        with self._lock:
+            if match_id in self._recent:
+                return []
+            self._recent[match_id] = None
+            if len(self._recent) > RECENT_MATCHES:
+                self._recent.popitem(last=False)
+
+            winner_before = self._ratings.get(winner_id, INITIAL_RATING)
+            loser_before = self._ratings.get(loser_id, INITIAL_RATING)
+            expected = expected_score(winner_before, loser_before)
+            winner_after = _clamp(round(winner_before + k_factor(self._games.get(winner_id, 0)) * (1 - expected)))
+            loser_after = _clamp(round(loser_before - k_factor(self._games.get(loser_id, 0)) * (1 - expected)))
+
+            self._set(winner_id, winner_after, won=True)
+            self._set(loser_id, loser_after, won=False)
+        return [(winner_id, winner_before, winner_after, True), (loser_id, loser_before, loser_after, False)]
+
+    def snapshot(self):
+        with self._lock:
+            return {user_id: (rating, self._games[user_id], self._wins[user_id])
+                    for user_id, rating in self._ratings.items()}
+
+    def _rank(self, rating):
+        return len(self._ratings) - self._counts.prefix(rating - MIN_RATING) + 1
+
+    def _set(self, user_id, rating, won):
+        previous = self._ratings.get(user_id)
+        if previous is not None:
+            self._members[previous].discard(user_id)
+            if not self._members[previous]:
+                del self._members[previous]
+            self._counts.add(previous - MIN_RATING, -1)
+        self._ratings[user_id] = rating
+        self._members.setdefault(rating, set()).add(user_id)
+        self._counts.add(rating - MIN_RATING, 1)
+        self._games[user_id] = self._games.get(user_id, 0) + 1
+        self._wins[user_id] = self._wins.get(user_id, 0) + (1 if won else 0)
+
+
+def rating_writes(match_id, changes):
+    """把一次结算的变化转换为两条批量写入语句 [(query, params)]"""
+    if not changes:
+        return []
+    rating_rows = ', '.join(['(%s, %s, 1, %s)'] * len(changes))
+    rating_params = [value for user_id, _, after, won in changes for value in (user_id, after, int(won))]
+    history_rows = ', '.join(['(%s, %s, %s, %s)'] * len(changes))
+    history_params = [value for user_id, before, after, _ in changes for value in (user_id, match_id, before, after)]
+    return [
+        (
+            f"INSERT INTO user_ratings (user_id, rating, games, wins) VALUES {rating_rows} "
+            "ON DUPLICATE KEY UPDATE rating = VALUES(rating), games = games + 1, wins = wins + VALUES(wins)",
+            rating_params,
+        ),
+        (
+            f"INSERT INTO rating_history (user_id, match_id, rating_before, rating_after) VALUES {history_rows}",
+            history_params,
+        ),
+    ]
+
+
+def rebuild_ladder(ladder, storage, batch_size=5000):
+    """
+    按 (completed_at, id) 顺序分批读取所有有胜者的对战，在空天梯上重放，返回重放的场数；
+    然后把与 user_ratings 不一致的记录（例如首次部署时）写回数据库
+    """
+    cursor = (datetime.datetime(1970, 1, 2), 0)
+    replayed = 0
+    while True:
+        rows = storage.execute_query(
+            """
+            SELECT id, challenger_id, opponent_id, winner_id, completed_at FROM matches
+            WHERE status = 'completed' AND winner_id IS NOT NULL
+              AND (completed_at > %s OR (completed_at = %s AND id > %s))
+            ORDER BY completed_at, id
+            LIMIT %s
+            """,
+            (cursor[0], cursor[0], cursor[1], batch_size), fetch='all'
+        ) or []
+        for row in rows:
+            loser_id = row['opponent_id'] if row['winner_id'] == row['challenger_id'] else row['challenger_id']
+            ladder.record(row['id'], row['winner_id'], loser_id)
+        replayed += len(rows)
+        if len(rows) < batch_size:
+            break
+        cursor = (rows[-1]['completed_at'], rows[-1]['id'])
+
+    stored = {row['user_id']: (row['rating'], row['games'], row['wins']) for row in storage.execute_query(
+        "SELECT user_id, rating, games, wins FROM user_ratings", fetch='all') or []}
+    stale = [(user_id, value) for user_id, value in ladder.snapshot().items() if stored.get(user_id) != value]
+    for i in range(0, len(stale), batch_size):
+        batch = stale[i:i + batch_size]
+        storage.execute_query(
+            f"INSERT INTO user_ratings (user_id, rating, games, wins) VALUES {', '.join(['(%s, %s, %s, %s)'] * len(batch))} "
+            "ON DUPLICATE KEY UPDATE rating = VALUES(rating), games = VALUES(games), wins = VALUES(wins)",
+            [value for user_id, (rating, games, wins) in batch for value in (user_id, rating, games, wins)]
+        )
+    print(f"等级分天梯: 重放 {replayed} 场对战, {len(ladder)} 名玩家, 同步 {len(stale)} 条等级分记录")
+    return replayed
@@ -0,0 +1,217 @@
+"""
+成绩汇总与归档
+后台线程定期执行两步：
+
+1. 汇总：把 id 大于水位的新成绩按 (用户, 难度, 日期) 累加到 score_daily_summaries，
+   并在同一事务中推进 score_rollup_state 的水位。读取统计时合并“汇总表 + 水位之后的成绩”，
+   因此结果始终精确，不受汇总间隔影响
+2. 归档：把已汇总且超过保留期的成绩移到 scores_archive。每个难度排行榜前 keep_top 名
+   永远留在 scores 中，排行榜查询不需要读归档表
+
+只汇总写入超过 settle_seconds 的成绩：自增 id 在插入时分配、提交时才可见，
+留出时间窗口避免较小的 id 在水位推进之后才提交而被漏掉
+"""
+
+import threading
+
+ROLLUP_NAME = 'daily'
+
+
+class ScoreRollup:
+    """成绩汇总 / 归档任务"""
+
+    def __init__(self, storage, difficulties, interval=60, batch_size=5000, settle_seconds=10,
+                 retention_days=90, keep_top=100, archive_batch_size=1000):
+        self.storage = storage
+        self.difficulties = tuple(difficulties)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.settle_seconds = settle_seconds
+        self.retention_days = retention_days
+        self.keep_top = keep_top
+        self.archive_batch_size = archive_batch_size
+
+        self.rolled_up = 0
+        self.archived = 0
+        self.last_error = None
+        self._archive_cursor = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='score-rollup', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        return {
+            'rolled_up': self.rolled_up,
+            'archived': self.archived,
+            'last_error': self.last_error,
+        }
+
+    def run_once(self):
+        """汇总所有待汇总的成绩，然后归档一批，返回 (汇总条数, 归档条数)"""
+        rolled_up = 0
+        while True:
+            count = self.roll_up()
+            rolled_up += count
+            if count < self.batch_size:
+                break
+        return rolled_up, self.archive()
+
+    def roll_up(self):
+        """汇总一批成绩，返回汇总的条数"""
+        with self.storage.transaction() as tx:
+            # 锁住水位行，多个服务进程同时汇总时串行执行
+            state = tx.execute_query(
+                "SELECT last_score_id FROM score_rollup_state WHERE name = %s FOR UPDATE",
+                (ROLLUP_NAME,), fetch='one'
+            )
+            if state is None:
+                return 0
+            low = state['last_score_id']
+            batch = tx.execute_query(
+                """
+                SELECT COUNT(*) as count, MAX(id) as max_id FROM (
+                    SELECT id FROM scores
+                    WHERE id > %s AND created_at <= CURRENT_TIMESTAMP - INTERVAL %s SECOND
+                    ORDER BY id
+                    LIMIT %s
+                ) batch
+                """,
+                (low, self.settle_seconds, self.batch_size), fetch='one'
+            )
+            if not batch or not batch['count']:
+                return 0
+            high = batch['max_id']
+
+            tx.execute_query(
+                """
+                INSERT INTO score_daily_summaries (
+                    user_id, difficulty, day, games, best_score, total_score, best_time, longest_time, total_time,
+                    games_under_15s, games_under_30s, games_under_60s, games_under_120s,
+                    games_over_5min, games_over_10min, scores_over_1000, scores_over_5000, scores_over_10000,
+                    first_played_at, last_played_at
+                )
+                SELECT * FROM (
+                    SELECT
+                        user_id, difficulty, DATE(created_at) as b_day,
+                        COUNT(*) as b_games,
+                        MAX(score) as b_best_score,
+                        SUM(score) as b_total_score,
+                        MIN(time_taken) as b_best_time,
+                        MAX(time_taken) as b_longest_time,
+                        SUM(time_taken) as b_total_time,
+                        SUM(time_taken <= 15) as b_under_15s,
+                        SUM(time_taken <= 30) as b_under_30s,
+                        SUM(time_taken <= 60) as b_under_60s,
+                        SUM(time_taken <= 120) as b_under_120s,
+                        SUM(time_taken >= 300) as b_over_5min,
+                        SUM(time_taken >= 600) as b_over_10min,
+                        SUM(score >= 1000) as b_over_1000,
+                        SUM(score >= 5000) as b_over_5000,
+                        SUM(score >= 10000) as b_over_10000,
+                        MIN(created_at) as b_first,
+                        MAX(created_at) as b_last
+                    FROM scores
+                    WHERE id > %s AND id <= %s
+                    GROUP BY user_id, difficulty, DATE(created_at)
+                ) batch
+                ON DUPLICATE KEY UPDATE
+                    games = games + b_games,
+                    best_score = GREATEST(best_score, b_best_score),
+                    total_score = total_score + b_total_score,
+                    best_time = LEAST(best_time, b_best_time),
+                    longest_time = GREATEST(longest_time, b_longest_time),
+                    total_time = total_time + b_total_time,
+                    games_under_15s = games_under_15s + b_under_15s,
+                    games_under_30s = games_under_30s + b_under_30s,
+                    games_under_60s = games_under_60s + b_under_60s,
+                    games_under_120s = games_under_120s + b_under_120s,
+                    games_over_5min = games_over_5min + b_over_5min,
+                    games_over_10min = games_over_10min + b_over_10min,
+                    scores_over_1000 = scores_over_1000 + b_over_1000,
+                    scores_over_5000 = scores_over_5000 + b_over_5000,
+                    scores_over_10000 = scores_over_10000 + b_over_10000,
+                    first_played_at = LEAST(first_played_at, b_first),
+                    last_played_at = GREATEST(last_played_at, b_last)
+                """,
+                (low, high)
+            )
+            tx.execute_query(
+                "UPDATE score_rollup_state SET last_score_id = %s WHERE name = %s",
+                (high, ROLLUP_NAME)
+            )
+
+        count = int(batch['count'])
+        self.rolled_up += count
+        return count
+
+    def archive(self):
+        """把一批已汇总且超过保留期的成绩移到归档表，返回归档的条数"""
+        state = self.storage.execute_query(
+            "SELECT last_score_id FROM score_rollup_state WHERE name = %s",
+            (ROLLUP_NAME,), fetch='one'
+        )
+        if not state:
+            return 0
+
+        candidates = self.storage.execute_query(
+            """
+            SELECT id FROM scores
+            WHERE id > %s AND id <= %s AND created_at < CURRENT_TIMESTAMP - INTERVAL %s DAY
+            ORDER BY id
+            LIMIT %s
+            """,
+            (self._archive_cursor, state['last_score_id'], self.retention_days, self.archive_batch_size),
+            fetch='all'
+        )
+        if not candidates:
+            # 扫描到末尾后从头开始，下一轮重新检查之前因进入排行榜而保留的成绩
+            self._archive_cursor = 0
+            return 0
+        self._archive_cursor = candidates[-1]['id']
+
+        # 分数只会被新成绩挤出排行榜，不会重新进入，因此这里读到的前 N 名在归档期间不会失效
+        protected = set()
+        for difficulty in self.difficulties:
+            rows = self.storage.execute_query(
+                "SELECT id FROM scores WHERE difficulty = %s ORDER BY score DESC, time_taken ASC LIMIT %s",
+                (difficulty, self.keep_top), fetch='all'
+            )
+            protected.update(row['id'] for row in rows or [])
+
+        ids = [row['id'] for row in candidates if row['id'] not in protected]
+        if not ids:
+            return 0
+
+        placeholders = ', '.join(['%s'] * len(ids))
+        with self.storage.transaction() as tx:
+            tx.execute_query(
+                f"""
+                INSERT INTO scores_archive (id, user_id, score, difficulty, time_taken, created_at)
+                SELECT id, user_id, score, difficulty, time_taken, created_at FROM scores WHERE id IN ({placeholders})
+                """,
+                ids
+            )
+            tx.execute_query(f"DELETE FROM scores WHERE id IN ({placeholders})", ids)
+
+        self.archived += len(ids)
+        return len(ids)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                rolled_up, archived = self.run_once()
+                self.last_error = None
+                if rolled_up or archived:
+                    print(f"成绩汇总: 新增汇总 {rolled_up} 条, 归档 {archived} 条")
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"成绩汇总失败: {e}")
@@ -0,0 +1,77 @@
+"""
+单飞（single-flight）请求合并
+相同键的并发调用只执行一次，其余调用等待并共享同一结果；
+调用完成后立即移除，不会缓存旧数据
+"""
+
+import threading
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """按键合并并发调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """执行 fn，若同键调用正在进行则等待其结果"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {'inflight': len(self._calls), 'executed': self.executed, 'shared': self.shared}
+
+
+def make_key(route, *args, **kwargs):
+    """由路由名和规范化后的参数生成合并键"""
+    normalized = tuple(_normalize(a) for a in args)
+    normalized_kwargs = tuple(sorted((k, _normalize(v)) for k, v in kwargs.items()))
+    return (route, normalized, normalized_kwargs)
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    return value
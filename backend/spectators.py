@@ -0,0 +1,171 @@
+"""
+对战观战
+有观众的对战在内存中保留一份双方进度快照：第一名观众加入时创建，最后一名观众离开时删除，
+没有观众的对战不占用内存。玩家的进度事件只覆盖快照中的数值（O(1)，不发送消息）。
+后台线程按固定间隔检查快照版本，对有变化的对战向观战房间发送一次合并后的快照，
+广播次数只与观战中的对战数量和间隔有关，与玩家发送进度的频率无关；
+一对多的投递由 SocketIO 房间完成。新加入的观众直接从内存拿到当前快照
+（快照创建之前的进度未被记录，从双方的下一次进度开始显示）
+"""
+
+import math
+import threading
+import time
+
+
+class SpectatorLimitError(Exception):
+    """观战人数已达上限"""
+
+
+def spectator_room(match_id):
+    return f'match:{match_id}'
+
+
+class _MatchFeed:
+    __slots__ = ('match_id', 'players', 'progress', 'version', 'sent_version', 'spectators')
+
+    def __init__(self, match_id, players):
+        self.match_id = match_id
+        self.players = players
+        self.progress = {user_id: 0 for user_id in players}
+        self.version = 0
+        self.sent_version = 0
+        self.spectators = set()
+
+    def snapshot(self):
+        return {
+            'match_id': self.match_id,
+            'players': [{'user_id': user_id, 'progress': self.progress.get(user_id, 0)} for user_id in self.players],
+            'seq': self.version,
+            'spectators': len(self.spectators),
+        }
+
+
+class SpectatorHub:
+    """
+    观战管理：broadcast(event, data, room) 向房间发送消息，close_room(room) 关闭房间
+    """
+
+    def __init__(self, broadcast, close_room, tick_interval=0.5, max_spectators=5000):
+        self.broadcast = broadcast
+        self.close_room = close_room
+        self.tick_interval = tick_interval
+        self.max_spectators = max_spectators
+
+        self._feeds = {}      # match_id -> _MatchFeed
+        self._watching = {}   # sid -> match_id
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.snapshots_sent = 0
+
+    def update(self, match_id, user_id, progress):
+        """
+        记录玩家进度（热路径：只修改内存）
+        只更新已有观众的对战；进度不是有限数值时忽略。返回是否记录
+        """
+        feed = self._feeds.get(match_id)
+        if feed is None or user_id not in feed.progress or not _is_finite_number(progress):
+            return False
+        feed.progress[user_id] = progress
+        feed.version += 1
+        return True
+
+    def join(self, match_id, players, sid):
+        """加入观战，返回当前快照；人数已满时抛出 SpectatorLimitError"""
+        with self._lock:
+            previous = self._watching.get(sid)
+            if previous is not None and previous != match_id:
+                self._discard(previous, sid)
+            feed = self._feeds.setdefault(match_id, _MatchFeed(match_id, players))
+            if sid not in feed.spectators and len(feed.spectators) >= self.max_spectators:
+                raise SpectatorLimitError(f'观战人数已达上限 {self.max_spectators}')
+            feed.spectators.add(sid)
+            self._watching[sid] = match_id
+            return feed.snapshot(), previous
+
+    def leave(self, sid):
+        """离开观战（断开连接时也调用），返回之前观看的对战"""
+        with self._lock:
+            match_id = self._watching.pop(sid, None)
+            if match_id is not None:
+                self._discard(match_id, sid)
+        return match_id
+
+    def end(self, match_id, result):
+        """对战结束：向观众发送最终结果并关闭观战房间"""
+        with self._lock:
+            feed = self._feeds.pop(match_id, None)
+            if feed is None:
+                return
+            for sid in feed.spectators:
+                self._watching.pop(sid, None)
+        if feed.spectators:
+            self.broadcast('spectate_match_over', {'match_id': match_id, 'snapshot': feed.snapshot(), 'result': result},
+                           spectator_room(match_id))
+            self.close_room(spectator_room(match_id))
+
+    def spectators(self, match_id):
+        feed = self._feeds.get(match_id)
+        return len(feed.spectators) if feed else 0
+
+    def status(self):
+        with self._lock:
+            feeds = list(self._feeds.values())
+        return {
+            'watched_matches': len(feeds),
+            'spectators': sum(len(feed.spectators) for feed in feeds),
+            'snapshots_sent': self.snapshots_sent,
+        }
+
+    def tick(self):
+        """向有变化且有观众的对战发送一次快照，返回发送的数量"""
+        with self._lock:
+            due = [feed for feed in self._feeds.values() if feed.version != feed.sent_version]
+            snapshots = []
+            for feed in due:
+                feed.sent_version = feed.version
+                snapshots.append((feed.match_id, feed.snapshot()))
+        for match_id, snapshot in snapshots:
+            self.broadcast('spectate_snapshot', snapshot, spectator_room(match_id))
+        self.snapshots_sent += len(snapshots)
+        return len(snapshots)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='spectator-ticker', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        next_tick = time.monotonic()
+        while True:
+            # 按固定节拍发送，不受单次发送耗时影响
+            next_tick += self.tick_interval
+            if self._stop.wait(max(0.0, next_tick - time.monotonic())):
+                return
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"观战快照发送失败: {e}")
+
+    def _discard(self, match_id, sid):
+        feed = self._feeds.get(match_id)
+        if feed is not None:
+            feed.spectators.discard(sid)
+            if not feed.spectators:
+                del self._feeds[match_id]
+
+
+def _is_finite_number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    try:
+        return math.isfinite(value)
+    except OverflowError:
+        return False
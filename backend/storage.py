@@ -0,0 +1,149 @@
+"""
+存储后端接口
+server.py 的所有持久化都经过 execute_query(query, params, fetch)，
+不同后端只需实现相同的查询语义：fetch='one' 返回单行，fetch='all' 返回行列表，
+写操作返回 lastrowid（fetch='rowcount' 时返回受影响的行数），出错时打印错误并返回 None
+
+需要原子性的多条语句通过 transaction() 执行：返回的对象提供同样语义的 execute_query，
+但出错时直接抛出异常，由上下文管理器回滚
+"""
+
+from contextlib import contextmanager
+
+from mysql.connector import Error, errors
+
+from backend.db_router import is_read_only
+
+
+class Storage:
+    """存储后端基类"""
+
+    name = 'base'
+
+    def execute_query(self, query, params=None, fetch=False, pin_key=None, primary=False):
+        """primary=True 时读操作也在主库执行（结果要写入缓存时不能读到落后的从库）"""
+        raise NotImplementedError
+
+    def ping(self):
+        """存储是否可用"""
+        return True
+
+    def start(self):
+        """启动后台任务（健康检查等）"""
+
+    def status(self):
+        return {'backend': self.name}
+
+    def transaction(self):
+        """返回上下文管理器：在同一事务中执行多条语句，退出时提交，出现异常时回滚"""
+        raise NotImplementedError
+
+    def note_write(self, pin_key):
+        """记录在其他路径（异步连接池）完成的写入，使该用户随后的读请求走主库"""
+
+
+class _Transaction:
+    """MySQL 事务内的语句执行器"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute_query(self, query, params=None, fetch=False):
+        cursor = self.connection.execute(query, params or ())
+        if fetch == 'rowcount':
+            return cursor.rowcount
+        if fetch:
+            rows = cursor.fetchall()
+            return rows if fetch == 'all' else (rows[0] if rows else None)
+        return cursor.lastrowid
+
+
+class MySQLStorage(Storage):
+    """MySQL 后端：主从路由 + 连接池 + 预处理语句缓存"""
+
+    name = 'mysql'
+
+    def __init__(self, router):
+        self.router = router
+
+    def connection(self, read_only=False, pin_key=None):
+        """从连接池获取连接，失败时返回 None"""
+        try:
+            connection, _ = self.router.connect(read_only=read_only, pin_key=pin_key)
+            return connection
+        except Error as e:
+            print(f"数据库连接失败: {e}")
+            return None
+
+    def execute_query(self, query, params=None, fetch=False, pin_key=None, primary=False):
+        read_only = not primary and fetch in ('one', 'all') and is_read_only(query)
+        try:
+            connection, node = self.router.connect(read_only=read_only, pin_key=pin_key)
+        except Error as e:
+            print(f"数据库连接失败: {e}")
+            return None
+
+        try:
+            return self._run(connection, query, params, fetch, pin_key)
+        except (errors.OperationalError, errors.InterfaceError) as e:
+            if node.is_primary:
+                print(f"查询执行失败: {e}")
+                return None
+            # 副本断开或不可用：标记为不健康并在主库上重试，不把错误当作“没有数据”返回给调用方
+            self.router.mark_unhealthy(node, e)
+        except Error as e:
+            print(f"查询执行失败: {e}")
+            return None
+        return self.execute_query(query, params, fetch, pin_key, primary=True)
+
+    def _run(self, connection, query, params, fetch, pin_key):
+        """在取出的连接上执行一条语句，出错时回滚并抛出异常，最后归还连接"""
+        try:
+            # 使用连接上缓存的服务端预处理语句执行
+            cursor = connection.execute(query, params or ())
+
+            if fetch in ('one', 'all'):
+                rows = cursor.fetchall()
+                return rows if fetch == 'all' else (rows[0] if rows else None)
+
+            connection.commit()
+            result = cursor.rowcount if fetch == 'rowcount' else cursor.lastrowid
+            self.router.note_write(pin_key)
+            return result
+        except Error:
+            connection.rollback()
+            raise
+        finally:
+            # 归还连接池
+            connection.close()
+
+    def ping(self):
+        connection = self.connection()
+        if not connection:
+            return False
+        connection.close()
+        return True
+
+    def start(self):
+        self.router.start_health_checks()
+
+    def status(self):
+        return dict(self.router.status(), backend=self.name)
+
+    def note_write(self, pin_key):
+        self.router.note_write(pin_key)
+
+    @contextmanager
+    def transaction(self):
+        # 事务始终在主库执行；连接获取失败时抛出异常
+        # 连接池以 autocommit 打开连接，必须显式开始事务，否则每条语句各自提交、FOR UPDATE 的锁立即释放
+        connection, _ = self.router.connect()
+        try:
+            connection.begin()
+            yield _Transaction(connection)
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
@@ -0,0 +1,32 @@
+"""需要完整服务端的测试共用的夹具：内存存储后端，拼图缓存和事件日志写入临时目录"""
+
+import importlib
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    scratch = tmp_path_factory.mktemp('server')
+    os.environ['JIGSAW_STORAGE_BACKEND'] = 'memory'
+    os.environ['JIGSAW_RATE_LIMITS'] = 'off'
+    os.environ['JIGSAW_PUZZLE_CACHE_DIR'] = str(scratch / 'puzzle_cache')
+    os.environ['JIGSAW_EVENT_LOG_DIR'] = str(scratch / 'event_log')
+    return importlib.import_module('server')
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+@pytest.fixture
+def register(client):
+    """注册用户，返回 (user_id, 认证请求头)"""
+    def register(name):
+        response = client.post('/api/auth/register', json={
+            'username': name, 'email': f'{name}@test.local', 'password': 'test-password'})
+        body = response.get_json()
+        return body['user']['id'], {'Authorization': f"Bearer {body['token']}"}
+    return register
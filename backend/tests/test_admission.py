@@ -0,0 +1,104 @@
+"""AdmissionController：槽位占满或数据库变慢时先拒绝低优先级请求，关键请求不受影响"""
+
+import threading
+import time
+from contextlib import ExitStack
+
+import pytest
+
+from backend.admission import (
+    PRIORITY_CRITICAL, PRIORITY_LOW, PRIORITY_NORMAL, AdmissionController, OverloadedError, PriorityClass,
+)
+
+
+def make_controller(low_queue=0, low_timeout=0.0):
+    return AdmissionController(max_inflight=10, ewma_alpha=1.0, classes={
+        PRIORITY_CRITICAL: PriorityClass(capacity=1.0),
+        PRIORITY_NORMAL: PriorityClass(capacity=0.8, max_latency_ms=500),
+        PRIORITY_LOW: PriorityClass(capacity=0.4, max_latency_ms=20, queue_timeout=low_timeout, max_queue=low_queue),
+    })
+
+
+def hold(stack, controller, priority, count):
+    for _ in range(count):
+        stack.enter_context(controller.admit(priority))
+
+
+def test_low_priority_is_shed_when_its_share_is_used():
+    controller = make_controller()
+    with ExitStack() as stack:
+        # 4 个槽位已占用：达到低优先级的 40% 上限，普通和关键请求仍可进入
+        hold(stack, controller, PRIORITY_NORMAL, 4)
+        with pytest.raises(OverloadedError) as raised:
+            with controller.admit(PRIORITY_LOW):
+                pass
+        assert raised.value.priority == PRIORITY_LOW and raised.value.reason == '排队已满'
+
+        hold(stack, controller, PRIORITY_NORMAL, 4)
+        with pytest.raises(OverloadedError):
+            with controller.admit(PRIORITY_NORMAL):
+                pass
+        hold(stack, controller, PRIORITY_CRITICAL, 2)
+
+    classes = controller.snapshot()['classes']
+    assert (classes[PRIORITY_LOW]['shed'], classes[PRIORITY_LOW]['admitted']) == (1, 0)
+    assert (classes[PRIORITY_NORMAL]['shed'], classes[PRIORITY_NORMAL]['admitted']) == (1, 8)
+    assert (classes[PRIORITY_CRITICAL]['shed'], classes[PRIORITY_CRITICAL]['admitted']) == (0, 2)
+    assert controller.snapshot()['inflight'] == 0
+
+
+def test_queued_low_priority_request_times_out():
+    controller = make_controller(low_queue=1, low_timeout=0.05)
+    with ExitStack() as stack:
+        hold(stack, controller, PRIORITY_NORMAL, 4)
+        start = time.monotonic()
+        with pytest.raises(OverloadedError) as raised:
+            with controller.admit(PRIORITY_LOW):
+                pass
+        assert raised.value.reason == '排队超时'
+        assert time.monotonic() - start >= 0.05
+
+
+def test_queued_low_priority_request_is_admitted_when_slot_frees():
+    controller = make_controller(low_queue=1, low_timeout=5.0)
+    admitted = threading.Event()
+
+    def low_request():
+        with controller.admit(PRIORITY_LOW):
+            admitted.set()
+
+    with ExitStack() as stack:
+        hold(stack, controller, PRIORITY_NORMAL, 4)
+        thread = threading.Thread(target=low_request)
+        thread.start()
+        while controller.snapshot()['classes'][PRIORITY_LOW]['queued'] == 0:
+            time.sleep(0.001)
+        assert not admitted.is_set()
+    thread.join(5)
+    assert admitted.is_set()
+
+
+def test_slow_database_sheds_low_priority_first():
+    controller = make_controller()
+    with controller.track_db():
+        time.sleep(0.05)
+
+    # 数据库延迟约 50ms：超过低优先级的 20ms 阈值，未超过普通请求的 500ms
+    with pytest.raises(OverloadedError) as raised:
+        with controller.admit(PRIORITY_LOW):
+            pass
+    assert raised.value.reason == '数据库延迟过高'
+    with controller.admit(PRIORITY_NORMAL):
+        pass
+    with controller.admit(PRIORITY_CRITICAL):
+        pass
+
+
+def test_latency_estimate_decays_without_new_samples():
+    controller = make_controller()
+    controller.latency_half_life = 0.01
+    with controller.track_db():
+        time.sleep(0.05)
+    time.sleep(0.1)
+    with controller.admit(PRIORITY_LOW):
+        pass
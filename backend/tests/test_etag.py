@@ -0,0 +1,62 @@
+"""ETag：版本号未变时 If-None-Match 直接返回 304 且不访问数据库，写操作后版本号递增、ETag 随之变化"""
+
+from backend.etag import ResourceVersions
+
+
+def test_bump_changes_only_affected_etags():
+    versions = ResourceVersions()
+    profile = versions.etag(1, 'profile')
+    saves = versions.etag(1, 'saves')
+    other = versions.etag(2, 'profile')
+
+    versions.bump([1, None], 'profile')
+    assert versions.version(1, 'profile') == 1
+    assert versions.etag(1, 'profile') != profile
+    assert versions.etag(1, 'saves') == saves
+    assert versions.etag(2, 'profile') == other
+
+    # 查询参数不同的请求使用不同的 ETag；重启后旧 ETag 全部失效
+    assert versions.etag(1, 'saves', b'gameMode=classic') != versions.etag(1, 'saves', 'gameMode=free')
+    assert ResourceVersions().etag(1, 'saves') != saves
+
+
+def test_unchanged_profile_returns_304_without_queries(server, client, register):
+    _, headers = register('etag_alice')
+    first = client.get('/api/user/profile', headers=headers)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    before = server.storage.statements_executed
+    cached = client.get('/api/user/profile', headers=dict(headers, **{'If-None-Match': etag}))
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+    assert cached.get_data() == b''
+    assert server.storage.statements_executed == before
+
+
+def test_write_bumps_version_and_etag(server, client, register):
+    user_id, headers = register('etag_bob')
+    etag = client.get('/api/user/profile', headers=headers).headers['ETag']
+    version = server.resource_versions.version(user_id, 'profile')
+
+    response = client.post('/api/scores', json={'score': 900, 'time': 42, 'difficulty': 'easy'}, headers=headers)
+    assert response.status_code == 201
+    assert server.resource_versions.version(user_id, 'profile') == version + 1
+
+    # 旧 ETag 不再命中，返回包含新成绩的完整响应和新的 ETag
+    refreshed = client.get('/api/user/profile', headers=dict(headers, **{'If-None-Match': etag}))
+    assert refreshed.status_code == 200
+    assert refreshed.get_json()['stats']['games_played'] == 1
+    assert refreshed.headers['ETag'] != etag
+    assert client.get('/api/user/profile', headers=dict(
+        headers, **{'If-None-Match': refreshed.headers['ETag']})).status_code == 304
+
+
+def test_etag_is_per_user(client, register):
+    _, alice = register('etag_carol')
+    _, bob = register('etag_dave')
+    etag = client.get('/api/user/profile', headers=alice).headers['ETag']
+    response = client.get('/api/user/profile', headers=dict(bob, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.get_json()['user']['username'] == 'etag_dave'
@@ -0,0 +1,108 @@
+"""EventLog：缓存与段文件的回放、重启后重建索引、截断索引的恢复"""
+
+import os
+
+from backend.event_log import EVENT_FINISH, EVENT_PROGRESS, INDEX_ENTRY, RECORD, EventLog
+
+
+def events(log, match_id):
+    return [(event['user_id'], event['type'], event['value']) for event in log.replay(match_id)]
+
+
+def test_round_trip_through_buffer_and_segments(tmp_path):
+    log = EventLog(str(tmp_path))
+    log.append(1, 10, EVENT_PROGRESS, 25.5)
+    log.append(2, 30, EVENT_PROGRESS, 10)
+    log.append(1, 20, EVENT_PROGRESS, 40)
+    # 尚未落盘时从内存缓存回放
+    assert events(log, 1) == [(10, 'progress', 25.5), (20, 'progress', 40.0)]
+
+    assert log.flush() == 3 * RECORD.size
+    log.append(1, 10, EVENT_FINISH, 61234)
+    assert events(log, 1) == [(10, 'progress', 25.5), (20, 'progress', 40.0), (10, 'finish', 61234.0)]
+    assert events(log, 2) == [(30, 'progress', 10.0)]
+    assert events(log, 3) == []
+    assert log.has_events(1) and not log.has_events(3)
+
+    timestamps = [event['ts'] for event in log.replay(1)]
+    assert timestamps == sorted(timestamps)
+
+
+def test_reload_rebuilds_index_and_writes_new_segment(tmp_path):
+    log = EventLog(str(tmp_path))
+    log.append(1, 10, EVENT_PROGRESS, 50)
+    log.flush()
+    log.append(1, 20, EVENT_FINISH, 1000)
+    log.flush()
+
+    reloaded = EventLog(str(tmp_path))
+    reloaded.load()
+    assert events(reloaded, 1) == [(10, 'progress', 50.0), (20, 'finish', 1000.0)]
+
+    reloaded.append(1, 10, EVENT_FINISH, 2000)
+    reloaded.flush()
+    assert reloaded.status()['segment'] == 2
+    assert sorted(os.listdir(tmp_path)) == ['segment-000001.idx', 'segment-000001.log',
+                                            'segment-000002.idx', 'segment-000002.log']
+    assert events(reloaded, 1)[-1] == (10, 'finish', 2000.0)
+
+
+def test_truncated_index_entry_is_ignored(tmp_path):
+    log = EventLog(str(tmp_path))
+    log.append(1, 10, EVENT_PROGRESS, 50)
+    log.flush()
+    log.append(1, 10, EVENT_PROGRESS, 75)
+    log.append(2, 20, EVENT_PROGRESS, 5)
+    log.flush()
+
+    # 模拟写索引时崩溃：最后一条索引只写了一部分
+    index_path = tmp_path / 'segment-000001.idx'
+    data = index_path.read_bytes()
+    assert len(data) == 3 * INDEX_ENTRY.size
+    index_path.write_bytes(data[:-5])
+
+    reloaded = EventLog(str(tmp_path))
+    reloaded.load()
+    assert events(reloaded, 1) == [(10, 'progress', 50.0), (10, 'progress', 75.0)]
+    assert not reloaded.has_events(2)
+
+    # 旧段末尾可能有未建索引的数据，新记录写入新段，回放不受影响
+    reloaded.append(2, 20, EVENT_PROGRESS, 6)
+    reloaded.flush()
+    assert events(reloaded, 2) == [(20, 'progress', 6.0)]
+
+
+def test_segment_without_index_is_skipped(tmp_path):
+    log = EventLog(str(tmp_path))
+    log.append(1, 10, EVENT_PROGRESS, 50)
+    log.flush()
+    (tmp_path / 'segment-000001.idx').unlink()
+
+    reloaded = EventLog(str(tmp_path))
+    reloaded.load()
+    assert not reloaded.has_events(1)
+    reloaded.append(1, 10, EVENT_PROGRESS, 60)
+    reloaded.flush()
+    assert reloaded.status()['segment'] == 2
+
+
+def test_segments_roll_over_at_size_limit(tmp_path):
+    log = EventLog(str(tmp_path), segment_bytes=2 * RECORD.size)
+    for value in range(5):
+        log.append(1, 10, EVENT_PROGRESS, value)
+        log.flush()
+    assert log.status()['segment'] == 3
+    assert [value for _, _, value in events(log, 1)] == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_append_never_raises_on_bad_values(tmp_path):
+    log = EventLog(str(tmp_path))
+    for value in (1e39, 10 ** 400, -10 ** 400, float('nan'), float('inf'), None, 'fast', 42):
+        log.append(1, 10, EVENT_PROGRESS, value)
+    log.append(2 ** 40, 10, EVENT_PROGRESS, 1)
+
+    assert [value for _, _, value in events(log, 1)] == [
+        3.4028234663852886e38, 3.4028234663852886e38, -3.4028234663852886e38, 0.0, 0.0, 0.0, 42.0]
+    assert log.status()['events_dropped'] == 2
+    log.flush()
+    assert len(events(log, 1)) == 7
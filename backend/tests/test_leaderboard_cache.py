@@ -0,0 +1,97 @@
+"""LeaderboardCache：按加载序号判断加载期间的新分数，按榜单截止线失效条目"""
+
+from backend.leaderboard_cache import LeaderboardCache
+
+
+def board(*entries):
+    return [{'score': score, 'time': time_taken} for score, time_taken in entries]
+
+
+FULL_EASY = board((900, 30), (800, 40), (700, 50))
+
+
+def fill(cache, difficulty='easy', limit=3, rows=FULL_EASY, body=b'[]'):
+    return cache.put(difficulty, limit, rows, body, cache.begin_load())
+
+
+def test_put_and_get():
+    cache = LeaderboardCache()
+    assert cache.get('easy', 3) is None
+    assert fill(cache, body=b'easy')
+    assert cache.get('easy', 3) == b'easy'
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_score_during_load_entering_top_rejects_put():
+    cache = LeaderboardCache()
+    load_seq = cache.begin_load()
+    cache.on_score('easy', 750, 10)
+    assert not cache.put('easy', 3, FULL_EASY, b'stale', load_seq)
+    assert cache.get('easy', 3) is None
+
+
+def test_score_during_load_below_cutoff_keeps_put():
+    cache = LeaderboardCache()
+    load_seq = cache.begin_load()
+    cache.on_score('easy', 600, 10)
+    cache.on_score('hard', 5000, 10)
+    assert cache.put('easy', 3, FULL_EASY, b'fresh', load_seq)
+
+
+def test_tie_at_cutoff_counts_as_entering():
+    cache = LeaderboardCache()
+    load_seq = cache.begin_load()
+    cache.on_score('easy', 700, 50)
+    assert not cache.put('easy', 3, FULL_EASY, b'stale', load_seq)
+
+
+def test_score_before_load_does_not_reject_put():
+    cache = LeaderboardCache()
+    cache.on_score('easy', 1000, 10)
+    assert fill(cache)
+
+
+def test_partial_board_rejects_any_new_score():
+    cache = LeaderboardCache()
+    load_seq = cache.begin_load()
+    cache.on_score('easy', 1, 999)
+    assert not cache.put('easy', 10, FULL_EASY, b'stale', load_seq)
+
+
+def test_overflowed_recent_scores_reject_put():
+    # 加载期间的分数多到已被挤出 recent 队列时，无法判断是否受影响，放弃写入
+    cache = LeaderboardCache(recent_scores=2)
+    load_seq = cache.begin_load()
+    for _ in range(3):
+        cache.on_score('hard', 1, 999)
+    assert not cache.put('easy', 3, FULL_EASY, b'stale', load_seq)
+
+
+def test_on_score_invalidates_only_affected_entries():
+    cache = LeaderboardCache()
+    fill(cache, 'easy')
+    fill(cache, 'hard')
+    fill(cache, 'all')
+    cache.on_score('easy', 600, 10)
+    assert cache.stats()['entries'] == 3
+
+    cache.on_score('easy', 950, 10)
+    assert cache.get('easy', 3) is None
+    assert cache.get('all', 3) is None
+    assert cache.get('hard', 3) is not None
+    assert cache.stats()['invalidations'] == 2
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = LeaderboardCache(max_entries=2, max_bytes=10)
+    fill(cache, 'easy', body=b'aaaa')
+    fill(cache, 'medium', body=b'bbbb')
+    cache.get('easy', 3)
+    fill(cache, 'hard', body=b'cccc')
+    assert cache.get('medium', 3) is None
+    assert cache.get('easy', 3) == b'aaaa'
+
+    assert not fill(cache, 'master', body=b'x' * 11)
+    fill(cache, 'master', body=b'dddddddd')
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes']) == (1, 8)
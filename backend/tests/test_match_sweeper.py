@@ -0,0 +1,146 @@
+"""MatchSweeper：到期条目的惰性重新入堆和按批清理"""
+
+import pytest
+
+from backend.match_sweeper import MatchSweeper
+from backend.memory_storage import MemoryStorage
+
+
+@pytest.fixture
+def online():
+    return set()
+
+
+@pytest.fixture
+def expired():
+    return []
+
+
+@pytest.fixture
+def sweeper(online, expired):
+    return MatchSweeper(MemoryStorage(), online.__contains__, expired.extend,
+                        pending_ttl=120, idle_ttl=600, disconnect_grace=60)
+
+
+def heap_entries(sweeper, match_id):
+    return sorted(deadline for deadline, key in sweeper._heap if key == match_id)
+
+
+def test_touched_match_is_pushed_back_not_expired(sweeper):
+    sweeper.track_active(1, 10, 20)
+    tracked = sweeper._matches[1]
+    first_deadline = tracked.last_activity + 600
+
+    tracked.last_activity += 300  # 等价于 300 秒后的 touch()，不操作堆
+    assert heap_entries(sweeper, 1) == [first_deadline]
+
+    assert sweeper._pop_due(first_deadline) == []
+    assert heap_entries(sweeper, 1) == [first_deadline + 300]
+    assert 1 in sweeper._matches
+
+    assert [t.match_id for t in sweeper._pop_due(first_deadline + 300)] == [1]
+    assert 1 not in sweeper._matches
+    assert sweeper._heap == []
+
+
+def test_forgotten_match_entry_is_dropped(sweeper):
+    sweeper.track_pending(1, 10, 20)
+    deadline = sweeper._matches[1].deadline_at
+    sweeper.forget(1)
+    assert sweeper._pop_due(deadline) == []
+    assert sweeper._heap == []
+
+
+def test_disconnect_pushes_earlier_deadline_and_stale_entry_is_skipped(sweeper):
+    sweeper.track_active(1, 10, 20)
+    tracked = sweeper._matches[1]
+    idle_deadline = tracked.last_activity + 600
+
+    sweeper.player_left(10)
+    grace_deadline = tracked.left_at + 60
+    assert heap_entries(sweeper, 1) == [grace_deadline, idle_deadline]
+
+    assert [t.match_id for t in sweeper._pop_due(grace_deadline)] == [1]
+    # 空闲截止时间的旧条目仍在堆中，但对战已不再登记
+    assert sweeper._pop_due(idle_deadline) == []
+    assert sweeper._heap == []
+
+
+def test_returned_player_clears_grace_period(sweeper, online):
+    online.update({10, 20})
+    sweeper.track_active(1, 10, 20)
+    tracked = sweeper._matches[1]
+    sweeper.player_left(10)
+    grace_deadline = tracked.left_at + 60
+    sweeper.player_returned(10)
+
+    # 宽限期条目按空闲截止时间重新入堆（与原条目重复，先弹出的一个处理对战，另一个作废）
+    assert sweeper._pop_due(grace_deadline) == []
+    assert set(heap_entries(sweeper, 1)) == {tracked.last_activity + 600}
+    assert [t.match_id for t in sweeper._pop_due(tracked.last_activity + 600)] == [1]
+    assert sweeper._heap == []
+
+
+def test_entries_not_due_stay_in_heap(sweeper):
+    sweeper.track_pending(1, 10, 20, ttl=10)
+    sweeper.track_pending(2, 10, 30, ttl=100)
+    deadline = sweeper._matches[1].deadline_at
+    assert [t.match_id for t in sweeper._pop_due(deadline)] == [1]
+    assert [key for _, key in sweeper._heap] == [2]
+
+
+def test_sweep_forfeits_to_the_remaining_player(sweeper, online, expired):
+    online.add(20)
+    match_id = sweeper.storage.execute_query(
+        "INSERT INTO matches (challenger_id, opponent_id, difficulty, image_source, status, started_at, layout_seed) "
+        "VALUES (%s, %s, %s, %s, 'in_progress', CURRENT_TIMESTAMP, %s)",
+        (10, 20, 'easy', 'assets/images/1.jpg', 7)
+    )
+    sweeper.track_active(match_id, 10, 20)
+    sweeper.player_left(10)
+
+    assert sweeper.sweep(now=sweeper._matches[match_id].left_at + 60) == 1
+    assert [(item['id'], item['outcome'], item['match']['winner_id']) for item in expired] == [(match_id, 'forfeit', 20)]
+    assert sweeper.status()['forfeited'] == 1
+
+
+class FlakyStorage(MemoryStorage):
+    """第一次事务失败（例如锁等待超时），之后正常"""
+
+    def __init__(self):
+        super().__init__()
+        self.failures = 1
+
+    def transaction(self):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('lock wait timeout')
+        return super().transaction()
+
+
+def test_failed_batch_is_retracked_and_retried(online, expired):
+    sweeper = MatchSweeper(FlakyStorage(), online.__contains__, expired.extend, retry_delay=5)
+    match_id = sweeper.storage.execute_query(
+        "INSERT INTO matches (challenger_id, opponent_id, difficulty, image_source, status) VALUES (%s, %s, %s, %s, 'pending')",
+        (10, 20, 'easy', 'assets/images/1.jpg')
+    )
+    sweeper.track_pending(match_id, 10, 20, ttl=0)
+    now = sweeper._matches[match_id].deadline_at
+
+    with pytest.raises(RuntimeError):
+        sweeper.sweep(now=now)
+    assert match_id in sweeper._matches
+    assert heap_entries(sweeper, match_id) == [now + 5]
+    assert sweeper.sweep(now=now + 1) == 0
+
+    assert sweeper.sweep(now=now + 5) == 1
+    assert [(item['id'], item['outcome']) for item in expired] == [(match_id, 'expired')]
+    assert match_id not in sweeper._matches
+
+
+def test_retry_does_not_replace_newer_tracking(sweeper):
+    sweeper.track_pending(1, 10, 20, ttl=0)
+    stale = sweeper._pop_due(sweeper._matches[1].deadline_at)
+    sweeper.track_active(1, 10, 20)
+    sweeper._retry(stale, retry_at=0)
+    assert sweeper._matches[1].status == 'in_progress'
@@ -0,0 +1,89 @@
+"""Matchmaker：相邻桶立即配对，等待时间越长容忍范围越宽，不超过 max_tolerance"""
+
+import pytest
+
+from backend.matchmaker import Matchmaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def matchmaker(clock):
+    pairs = []
+    matchmaker = Matchmaker(lambda first, second: pairs.append((first.user_id, second.user_id)),
+                            bucket_width=50, base_tolerance=1, widen_seconds=5, max_tolerance=3, clock=clock)
+    matchmaker.pairs = pairs
+    return matchmaker
+
+
+def test_join_pairs_within_base_tolerance(matchmaker):
+    assert matchmaker.join(1, 'easy', 1500) is None
+    assert matchmaker.join(2, 'hard', 1500) is None
+    # 相差一个桶可以立即配对，不同难度互不匹配
+    first, second = matchmaker.join(3, 'easy', 1560)
+    assert (first.user_id, second.user_id) == (1, 3)
+    assert not matchmaker.is_queued(1) and matchmaker.is_queued(2)
+    assert matchmaker.status()['queued'] == {'easy': 0, 'hard': 1}
+
+
+def test_tolerance_widens_one_bucket_per_interval(matchmaker, clock):
+    # 桶 30 与桶 33 相差 3 个桶
+    matchmaker.join(1, 'easy', 1500)
+    assert matchmaker.join(2, 'easy', 1650) is None
+
+    clock.now += 4.9
+    assert matchmaker.tick() == []
+    clock.now += 0.1
+    # 等待 5 秒后容忍范围为 2 个桶，仍不够
+    assert matchmaker.tick() == []
+    clock.now += 5
+    assert [(a.user_id, b.user_id) for a, b in matchmaker.tick()] == [(1, 2)]
+    assert matchmaker.pairs == [(1, 2)]
+    assert len(matchmaker) == 0
+    assert matchmaker.status()['avg_wait_seconds'] == 10
+
+
+def test_tolerance_is_capped(matchmaker, clock):
+    matchmaker.join(1, 'easy', 1500)
+    matchmaker.join(2, 'easy', 1700)
+    clock.now += 3600
+    # 相差 4 个桶，超过 max_tolerance=3，等待再久也不配对
+    assert matchmaker.tick() == []
+    assert len(matchmaker) == 2
+
+
+def test_longest_waiting_player_is_served_first(matchmaker, clock):
+    matchmaker.join(1, 'easy', 1500)
+    clock.now += 5
+    matchmaker.join(2, 'easy', 1650)
+    clock.now += 1
+    matchmaker.join(3, 'easy', 1350)
+    clock.now += 4
+    # 玩家 1 已等待 10 秒，容忍 3 个桶：桶 27 与桶 33 距离相同，选等待更久的玩家 2
+    assert [(a.user_id, b.user_id) for a, b in matchmaker.tick()] == [(1, 2)]
+    assert matchmaker.is_queued(3)
+
+
+def test_rejoin_and_leave(matchmaker, clock):
+    matchmaker.join(1, 'easy', 1500)
+    matchmaker.join(2, 'easy', 1700)
+    # 按新的技能分重新排队，进入相邻桶后立即配对
+    first, second = matchmaker.join(2, 'easy', 1550)
+    assert (first.user_id, second.user_id) == (1, 2)
+
+    matchmaker.join(3, 'easy', 1500)
+    assert matchmaker.leave(3) and not matchmaker.leave(3)
+    clock.now += 60
+    assert matchmaker.join(4, 'easy', 1500) is None
+    assert matchmaker.tick() == []
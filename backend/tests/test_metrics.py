@@ -0,0 +1,90 @@
+"""MetricsRegistry：多个线程分片的计数器和直方图在采集时合并为一份 Prometheus 文本"""
+
+import threading
+import time
+
+from backend.metrics import MetricsRegistry
+
+
+def run_in_threads(fn, count, keep_alive=None):
+    """在 count 个线程中各执行一次 fn；给出 keep_alive 时线程执行完后保持存活直到该事件被设置"""
+    done = []
+
+    def target(i):
+        fn(i)
+        done.append(i)
+        if keep_alive is not None:
+            keep_alive.wait(5)
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    while len(done) < count:
+        time.sleep(0.001)
+    return threads
+
+
+def samples(text):
+    return [line for line in text.splitlines() if not line.startswith('#')]
+
+
+def test_render_merges_live_and_exited_thread_shards():
+    registry = MetricsRegistry()
+    requests = registry.counter('http_requests_total', 'HTTP 请求数', ('endpoint', 'status'))
+    release = threading.Event()
+
+    live = run_in_threads(lambda i: requests.inc('login', '200', amount=i + 1), 3, keep_alive=release)
+    for thread in run_in_threads(lambda i: requests.inc('login', '200'), 2):
+        thread.join()
+    requests.inc('login', '401')
+
+    # 存活线程 1+2+3，已退出线程 2，当前线程另一组标签 1
+    expected = ['http_requests_total{endpoint="login",status="200"} 8',
+                'http_requests_total{endpoint="login",status="401"} 1']
+    assert samples(registry.render()) == expected
+    release.set()
+    for thread in live:
+        thread.join()
+
+    # 退出线程的分片合并进公共分片后释放，再次采集结果不变
+    assert samples(registry.render()) == expected
+    assert len(requests._shards) == 1
+
+
+def test_histogram_render_is_cumulative_across_shards():
+    registry = MetricsRegistry()
+    latency = registry.histogram('db_seconds', '数据库耗时', ('op',), buckets=(0.25, 1.0))
+    # 取二进制可精确表示的值，合并顺序不影响总和
+    values = [0.125, 0.5, 2.0, 0.25]
+    for thread in run_in_threads(lambda i: latency.observe(values[i], 'select'), len(values)):
+        thread.join()
+
+    assert samples(registry.render()) == [
+        'db_seconds_bucket{op="select",le="0.25"} 2',
+        'db_seconds_bucket{op="select",le="1.0"} 3',
+        'db_seconds_bucket{op="select",le="+Inf"} 4',
+        'db_seconds_sum{op="select"} 2.875',
+        'db_seconds_count{op="select"} 4',
+    ]
+
+
+def test_render_text_format_and_failing_gauge():
+    registry = MetricsRegistry()
+    registry.counter('events_total', '事件数').inc()
+    registry.gauge('pool_in_use', '连接池使用量', lambda: {('primary',): 3, ('replica "a"',): 1}, ('node',))
+    registry.gauge('broken', '回调失败', lambda: 1 / 0)
+    registry.gauge('online', '在线人数', lambda: 7)
+
+    # 回调失败的指标整体跳过，不影响其他指标
+    assert registry.render() == '\n'.join([
+        '# HELP events_total 事件数',
+        '# TYPE events_total counter',
+        'events_total 1',
+        '# HELP pool_in_use 连接池使用量',
+        '# TYPE pool_in_use gauge',
+        'pool_in_use{node="primary"} 3',
+        'pool_in_use{node="replica \\"a\\""} 1',
+        '# HELP online 在线人数',
+        '# TYPE online gauge',
+        'online 7',
+    ]) + '\n'
@@ -0,0 +1,76 @@
+"""PasswordHasher：旧版 SHA-256 哈希登录成功后升级为 scrypt，成本参数过低的哈希同样需要升级"""
+
+import hashlib
+
+import pytest
+
+from backend.memory_storage import MemoryStorage
+from backend.password_hasher import SCHEME, PasswordHasher
+
+
+def make_hasher(cost=16):
+    # 固定成本参数，跳过校准，保证测试足够快
+    return PasswordHasher(max_workers=1, max_queue=1, min_cost=cost, max_cost=cost)
+
+
+@pytest.fixture
+def hasher():
+    hasher = make_hasher()
+    yield hasher
+    hasher.shutdown()
+
+
+def login(storage, hasher, username, password):
+    """与 server.login 相同的流程：验证通过且需要升级时写回新哈希"""
+    user = storage.execute_query(
+        "SELECT id, username, email, password_hash FROM users WHERE username = %s OR email = %s",
+        (username, username), fetch='one'
+    )
+    password_ok, needs_rehash = hasher.verify(password, user['password_hash'])
+    if password_ok and needs_rehash:
+        storage.execute_query("UPDATE users SET password_hash = %s WHERE id = %s",
+                              (hasher.hash(password), user['id']))
+    return password_ok, needs_rehash
+
+
+def stored_hash(storage, user_id):
+    return storage.tables['users'].get(user_id)['password_hash']
+
+
+def test_legacy_hash_is_upgraded_on_login(hasher):
+    storage = MemoryStorage()
+    legacy = hashlib.sha256(b'secret').hexdigest()
+    user_id = storage.execute_query(
+        "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
+        ('alice', 'alice@example.com', legacy)
+    )
+
+    # 密码错误时不升级
+    assert login(storage, hasher, 'alice', 'wrong') == (False, False)
+    assert stored_hash(storage, user_id) == legacy
+
+    assert login(storage, hasher, 'alice', 'secret') == (True, True)
+    upgraded = stored_hash(storage, user_id)
+    assert upgraded.startswith(SCHEME + '$16$')
+    assert hasher.verify('secret', upgraded) == (True, False)
+
+    # 升级后再次登录不再写回
+    assert login(storage, hasher, 'alice', 'secret') == (True, False)
+    assert stored_hash(storage, user_id) == upgraded
+
+
+def test_hash_below_current_cost_needs_rehash(hasher):
+    stronger = make_hasher(cost=32)
+    try:
+        weak = hasher.hash('secret')
+        assert stronger.verify('secret', weak) == (True, True)
+        assert stronger.verify('wrong', weak) == (False, False)
+        assert hasher.verify('secret', stronger.hash('secret')) == (True, False)
+    finally:
+        stronger.shutdown()
+
+
+def test_malformed_hash_never_matches(hasher):
+    assert hasher.verify('secret', '') == (False, False)
+    assert hasher.verify('secret', 'bcrypt$16$8$1$c2FsdA==$ZGlnZXN0') == (False, False)
+    assert hasher.verify('secret', 'scrypt$not-a-number') == (False, False)
@@ -0,0 +1,79 @@
+"""SamplingProfiler：耗时按每个采样的实际间隔累加，同一秒内的多个会话写出不同的文件"""
+
+import json
+import threading
+import time
+
+import pytest
+
+from backend.profiler import ProfileSession, SamplingProfiler
+
+HANDLER = 'handler (server.py:10)'
+QUERY = 'query (storage.py:20)'
+
+
+def finished_session(stacks):
+    session = ProfileSession(duration=1, sample_rate=1.0, targets=None, interval=0.005, include_async=False)
+    for stack, weights in stacks.items():
+        session.stacks[stack] += len(weights)
+        session.stack_seconds[stack] += sum(weights)
+        session.samples += len(weights)
+    session.stop_reason = 'stopped'
+    # 会话末尾的采样间隔被拉长，按最终间隔估算会高估前面的采样
+    session.effective_interval = 0.5
+    return session
+
+
+def test_write_sums_real_intervals_per_frame(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path))
+    session = finished_session({
+        ('login', HANDLER): [0.005, 0.005],
+        ('login', HANDLER, QUERY): [0.005, 0.5],
+    })
+    result = profiler._write(session)
+
+    with open(result['functions'], encoding='utf-8') as f:
+        functions = {row['function']: row for row in json.load(f)['functions']}
+    assert functions[HANDLER]['cumulative_samples'] == 4
+    assert functions[HANDLER]['cumulative_seconds'] == pytest.approx(0.515)
+    assert functions[HANDLER]['self_seconds'] == pytest.approx(0.01)
+    assert functions[QUERY]['self_seconds'] == pytest.approx(0.505)
+
+    with open(result['collapsed'], encoding='utf-8') as f:
+        assert sorted(f.read().splitlines()) == [f'login;{HANDLER} 2', f'login;{HANDLER};{QUERY} 2']
+
+
+def test_sessions_in_same_second_do_not_overwrite(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path))
+    session = finished_session({('login', HANDLER): [0.005]})
+    first = profiler._write(session)
+    second = profiler._write(session)
+    assert first['collapsed'] != second['collapsed'] and first['functions'] != second['functions']
+    assert len(list(tmp_path.iterdir())) == 4
+
+
+def test_sampled_seconds_track_wall_clock(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), max_overhead=0.5)
+    profiler.start(duration=5, sample_rate=1.0, interval=0.01)
+    release = threading.Event()
+
+    def wait_in_request():
+        token = profiler.begin('slow_request')
+        release.wait(5)
+        profiler.end(token)
+
+    worker = threading.Thread(target=wait_in_request)
+    started = time.perf_counter()
+    worker.start()
+    time.sleep(0.3)
+    release.set()
+    worker.join(5)
+    elapsed = time.perf_counter() - started
+    result = profiler.stop()
+
+    with open(result['functions'], encoding='utf-8') as f:
+        functions = json.load(f)['functions']
+    sampled = next(row for row in functions if row['function'].startswith('wait_in_request '))
+    assert result['samples'] > 5
+    # 采样覆盖的时间不超过请求实际持续的时间（首个采样多计一个间隔）
+    assert 0.1 < sampled['cumulative_seconds'] <= elapsed + 0.01
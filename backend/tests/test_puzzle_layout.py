@@ -0,0 +1,45 @@
+"""对战拼图布局：对照值与客户端 test/puzzle_generate_service_test.dart 相同，两端必须逐位一致"""
+
+import pytest
+
+from backend.puzzle_layout import (
+    DEFAULT_PUZZLE_IMAGE, LayoutRandom, generate_grid_graph, generate_layout, grid_size,
+    layout_signature, resolve_image, verify_layout,
+)
+
+
+def signature(seed, size):
+    return layout_signature(generate_layout(seed, size))
+
+
+def test_layout_random_matches_client_sequence():
+    random = LayoutRandom(12345)
+    assert [random.next_uint32() for _ in range(5)] == [642384322, 2822516123, 2623811804, 1434976643, 3803259071]
+
+
+@pytest.mark.parametrize('seed, size, expected', [
+    (12345, 3, '61b'),
+    (12345, 5, '61b1ee3b3c'),
+    (1, 4, '0f7a7e'),
+    (2147483647, 5, 'fc154f8480'),
+])
+def test_layout_signature_matches_client(seed, size, expected):
+    assert signature(seed, size) == expected
+
+
+def test_default_image_matches_client():
+    assert resolve_image(DEFAULT_PUZZLE_IMAGE, 12345) == 'assets/images/4.jpg'
+    assert resolve_image('assets/images/7.jpg', 12345) == 'assets/images/7.jpg'
+
+
+def test_grid_graph_numbering():
+    # 行优先，每个节点先连右边再连下边
+    assert generate_grid_graph(2, 2) == [(0, 0, 1), (1, 0, 2), (2, 1, 3), (3, 2, 3)]
+    assert len(generate_grid_graph(5, 5)) == 2 * 5 * 4
+
+
+def test_verify_layout_uses_difficulty_grid_size():
+    assert grid_size('hard') == 5 and grid_size('unknown') == 3
+    assert verify_layout(12345, 'hard', '61b1ee3b3c')
+    assert verify_layout(12345, 'easy', '61b')
+    assert not verify_layout(12345, 'hard', '61b')
@@ -0,0 +1,72 @@
+"""SliceCache：按总字节数淘汰最久未使用的条目，重启后按目录修改时间恢复 LRU 顺序"""
+
+import os
+
+from backend.puzzle_slicer import SliceCache, content_key
+
+KEYS = [content_key('entry', i) for i in range(4)]
+
+
+def put(cache, index, size=10):
+    return cache.put(KEYS[index], {'data.bin': b'x' * size})
+
+
+def cached(cache):
+    return [i for i, key in enumerate(KEYS) if os.path.isdir(cache.path(key))]
+
+
+def test_evicts_least_recently_used_entry(tmp_path):
+    cache = SliceCache(str(tmp_path), max_bytes=30)
+    for i in range(3):
+        put(cache, i)
+    # 读取使条目 0 成为最近使用，写入条目 3 时淘汰条目 1
+    assert cache.get(KEYS[0]) == cache.path(KEYS[0])
+    put(cache, 3)
+    assert cached(cache) == [0, 2, 3]
+    assert cache.get(KEYS[1]) is None
+
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (3, 30, 1)
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_entry_larger_than_limit_is_kept_alone(tmp_path):
+    cache = SliceCache(str(tmp_path), max_bytes=30)
+    put(cache, 0)
+    put(cache, 1)
+    # 刚写入的条目即使单独超过上限也保留，其余条目全部淘汰
+    put(cache, 2, size=50)
+    assert cached(cache) == [2]
+    assert cache.stats()['bytes'] == 50
+    put(cache, 3)
+    assert cached(cache) == [3]
+
+
+def test_load_restores_lru_order_from_mtime(tmp_path):
+    cache = SliceCache(str(tmp_path), max_bytes=100)
+    for i in range(3):
+        put(cache, i)
+    for age, i in enumerate((1, 2, 0)):
+        os.utime(cache.path(KEYS[i]), (1000 + age, 1000 + age))
+    os.makedirs(tmp_path / 'tmp' / 'partial')
+
+    # 以更小的上限重启：按修改时间淘汰最旧的条目 1，并清理残留的临时目录
+    reloaded = SliceCache(str(tmp_path), max_bytes=20)
+    reloaded.load()
+    assert cached(reloaded) == [0, 2]
+    assert not (tmp_path / 'tmp').exists()
+    put(reloaded, 3)
+    assert cached(reloaded) == [0, 3]
+
+
+def test_entry_written_by_other_process_is_adopted(tmp_path):
+    cache = SliceCache(str(tmp_path), max_bytes=30)
+    other = SliceCache(str(tmp_path), max_bytes=30)
+    put(other, 0)
+    put(cache, 1)
+    put(cache, 2)
+
+    assert cache.get(KEYS[0]) is not None
+    assert cache.stats()['bytes'] == 30
+    put(cache, 3)
+    assert cached(cache) == [0, 2, 3]
@@ -0,0 +1,101 @@
+"""RateLimiter：双窗口近似在窗口边界上的行为"""
+
+import pytest
+
+from backend.rate_limiter import RateLimiter, RatePolicy
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def limiter(clock):
+    return RateLimiter({'login': RatePolicy(3, 10, scopes=('ip', 'user'))}, idle_ttl=60, clock=clock)
+
+
+def hit(limiter, ip='1.1.1.1', user=None):
+    return limiter.hit('login', {'ip': ip, 'user': user})
+
+
+def test_limit_reached_within_window(limiter, clock):
+    assert [hit(limiter) for _ in range(3)] == [(True, 0)] * 3
+    clock.now += 9.5
+    assert hit(limiter) == (False, 1)
+
+
+def test_retry_after_counts_down_to_window_end(limiter, clock):
+    for _ in range(3):
+        hit(limiter)
+    clock.now += 2.2
+    assert hit(limiter) == (False, 8)
+
+
+def test_previous_window_fully_weighted_at_boundary(limiter, clock):
+    for _ in range(3):
+        hit(limiter)
+    # 刚进入下一个窗口时上一窗口的计数权重为 1，仍然拒绝
+    clock.now += 10
+    allowed, retry_after = hit(limiter)
+    assert not allowed
+    assert retry_after == 10
+
+
+def test_previous_window_weight_decays(limiter, clock):
+    for _ in range(3):
+        hit(limiter)
+    # 进入下一窗口一半：3 * 0.5 + 0 + 1 <= 3 允许；再一次时 1.5 + 1 + 1 > 3
+    clock.now += 15
+    assert hit(limiter) == (True, 0)
+    assert hit(limiter) == (False, 5)
+
+
+def test_two_idle_windows_reset_counts(limiter, clock):
+    for _ in range(3):
+        hit(limiter)
+    clock.now += 20
+    assert [hit(limiter) for _ in range(3)] == [(True, 0)] * 3
+    assert not hit(limiter)[0]
+
+
+def test_scopes_counted_separately(limiter):
+    for _ in range(3):
+        assert hit(limiter, ip='1.1.1.1', user=7)[0]
+    # 同一用户换 IP 仍然受用户维度限制；另一用户在原 IP 上同样受 IP 维度限制
+    assert not hit(limiter, ip='2.2.2.2', user=7)[0]
+    assert not hit(limiter, ip='1.1.1.1', user=8)[0]
+    assert hit(limiter, ip='2.2.2.2', user=8)[0]
+
+
+def test_rejected_hit_is_not_counted(limiter, clock):
+    for _ in range(3):
+        hit(limiter, user=7)
+    assert not hit(limiter, ip='2.2.2.2', user=7)[0]
+    # 被拒绝的请求没有增加 2.2.2.2 的计数
+    for _ in range(3):
+        assert hit(limiter, ip='2.2.2.2')[0]
+
+
+def test_unknown_policy_and_missing_identity_allowed(limiter):
+    assert limiter.hit('missing', {'ip': '1.1.1.1'}) == (True, 0)
+    for _ in range(5):
+        assert limiter.hit('login', {}) == (True, 0)
+
+
+def test_idle_keys_evicted(limiter, clock):
+    hit(limiter, ip='1.1.1.1')
+    clock.now += 30
+    hit(limiter, ip='2.2.2.2')
+    assert len(limiter) == 2
+    clock.now += 31
+    hit(limiter, ip='3.3.3.3')
+    assert len(limiter) == 2
@@ -0,0 +1,83 @@
+"""等级分天梯：增量结算、名次和启动时重放的结果一致"""
+
+import datetime
+
+import pytest
+
+from backend.memory_storage import MemoryStorage
+from backend.ratings import INITIAL_RATING, RatingLadder, expected_score, rebuild_ladder
+
+# (胜者, 负者)，按完成时间顺序
+RESULTS = [(1, 2), (1, 3), (2, 3), (4, 1), (1, 2), (3, 4), (1, 4), (2, 4)]
+
+
+@pytest.fixture
+def storage():
+    storage = MemoryStorage()
+    start = datetime.datetime(2026, 1, 1, 12, 0, 0)
+    for i, (winner_id, loser_id) in enumerate(RESULTS):
+        challenger_id, opponent_id = (winner_id, loser_id) if i % 2 else (loser_id, winner_id)
+        storage.tables['matches'].insert({
+            'challenger_id': challenger_id, 'opponent_id': opponent_id, 'status': 'completed',
+            'winner_id': winner_id, 'difficulty': 'easy',
+            # 两两同一秒完成，重放按 (completed_at, id) 排序
+            'completed_at': start + datetime.timedelta(seconds=i // 2),
+        })
+    storage.tables['matches'].insert({'challenger_id': 1, 'opponent_id': 2, 'status': 'cancelled'})
+    storage.tables['matches'].insert({'challenger_id': 3, 'opponent_id': 4, 'status': 'in_progress'})
+    return storage
+
+
+def incremental_ladder():
+    ladder = RatingLadder()
+    for match_id, (winner_id, loser_id) in enumerate(RESULTS, start=1):
+        ladder.record(match_id, winner_id, loser_id)
+    return ladder
+
+
+def test_record_is_zero_sum_for_equal_k_and_deduplicated():
+    ladder = RatingLadder()
+    changes = ladder.record(1, 10, 20)
+    assert changes == [(10, 1500, 1520, True), (20, 1500, 1480, False)]
+    assert ladder.record(1, 10, 20) == []
+    assert ladder.get(10) == {'rating': 1520, 'rank': 1, 'games': 1, 'wins': 1}
+    assert ladder.get(30) == {'rating': INITIAL_RATING, 'rank': None, 'games': 0, 'wins': 0}
+    assert expected_score(1520, 1480) + expected_score(1480, 1520) == pytest.approx(1)
+
+
+@pytest.mark.parametrize('batch_size', [1, 3, 5000])
+def test_rebuild_matches_incremental_ladder(storage, batch_size):
+    ladder = RatingLadder()
+    assert rebuild_ladder(ladder, storage, batch_size=batch_size) == len(RESULTS)
+
+    expected = incremental_ladder()
+    assert ladder.snapshot() == expected.snapshot()
+    for user_id in (1, 2, 3, 4):
+        assert ladder.get(user_id) == expected.get(user_id)
+
+
+def test_rank_after_rebuild(storage):
+    ladder = RatingLadder()
+    rebuild_ladder(ladder, storage)
+
+    ratings = {user_id: rating for user_id, (rating, _, _) in ladder.snapshot().items()}
+    for user_id, rating in ratings.items():
+        assert ladder.get(user_id)['rank'] == 1 + sum(1 for other in ratings.values() if other > rating)
+
+    page = ladder.page(0, 10)
+    assert [row['user_id'] for row in page] == sorted(ratings, key=lambda user_id: (-ratings[user_id], user_id))
+    assert [row['rank'] for row in page] == [ladder.get(row['user_id'])['rank'] for row in page]
+    assert ladder.page(1, 2) == page[1:3]
+
+
+def test_rebuild_syncs_user_ratings_once(storage):
+    ladder = RatingLadder()
+    rebuild_ladder(ladder, storage)
+    stored = {row['user_id']: (row['rating'], row['games'], row['wins'])
+              for row in storage.tables['user_ratings'].rows.values()}
+    assert stored == ladder.snapshot()
+
+    before = storage.statements_executed
+    rebuild_ladder(RatingLadder(), storage)
+    # 第二次重放结果一致：只有读取，没有写回
+    assert storage.statements_executed - before == 2
@@ -0,0 +1,158 @@
+"""ScoreRollup：水位分批推进、累加到已有的每日汇总行、汇总前后统计一致、归档保留排行榜前 N 名"""
+
+import datetime
+
+import pytest
+
+from backend.memory_storage import MemoryStorage
+from backend.score_rollup import ScoreRollup
+
+DIFFICULTIES = ('easy', 'medium', 'hard', 'master')
+
+# 与 server.load_profile 的统计查询相同：汇总表 + 水位之后的成绩
+PROFILE_STATS = """
+    SELECT
+        CAST(IFNULL(SUM(games), 0) AS SIGNED) as games_played,
+        IFNULL(MAX(best_score), 0) as best_score,
+        IFNULL(SUM(total_score) / SUM(games), 0) as avg_score,
+        IFNULL(MIN(best_time), 0) as best_time
+    FROM (
+        SELECT games, best_score, total_score, best_time
+        FROM score_daily_summaries
+        WHERE user_id = %s
+        UNION ALL
+        SELECT 1, score, score, time_taken
+        FROM scores
+        WHERE user_id = %s
+          AND id > IFNULL((SELECT last_score_id FROM score_rollup_state WHERE name = 'daily'), 0)
+    ) stats
+"""
+
+# (用户, 分数, 难度, 用时, 几天前)
+SCORES = [
+    (1, 900, 'easy', 40, 3), (1, 700, 'easy', 25, 3), (2, 1200, 'easy', 12, 3),
+    (1, 5000, 'hard', 300, 2), (2, 400, 'hard', 90, 2), (1, 650, 'easy', 33, 1),
+    (2, 10500, 'master', 620, 1), (1, 300, 'medium', 75, 0),
+]
+
+
+def add_score(storage, user_id, score, difficulty, time_taken, days_ago):
+    created_at = datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(days=days_ago, hours=1)
+    return storage.tables['scores'].insert({
+        'user_id': user_id, 'score': score, 'difficulty': difficulty,
+        'time_taken': time_taken, 'created_at': created_at,
+    })
+
+
+@pytest.fixture
+def storage():
+    storage = MemoryStorage()
+    for row in SCORES:
+        add_score(storage, *row)
+    return storage
+
+
+def make_rollup(storage, **options):
+    options.setdefault('settle_seconds', 0)
+    return ScoreRollup(storage, DIFFICULTIES, **options)
+
+
+def watermark(storage):
+    return storage.execute_query(
+        "SELECT last_score_id FROM score_rollup_state WHERE name = %s", ('daily',), fetch='one'
+    )['last_score_id']
+
+
+def profile_stats(storage, user_id):
+    return storage.execute_query(PROFILE_STATS, (user_id, user_id), fetch='one')
+
+
+def raw_stats(rows):
+    """汇总之前直接对原始成绩做聚合的结果"""
+    return {
+        'total_games': len(rows),
+        'best_score': max(score for _, score, _, _, _ in rows),
+        'avg_score': sum(score for _, score, _, _, _ in rows) / len(rows),
+        'best_time': min(time_taken for _, _, _, time_taken, _ in rows),
+    }
+
+
+def test_watermark_advances_one_batch_at_a_time(storage):
+    rollup = make_rollup(storage, batch_size=3)
+    assert [rollup.roll_up() for _ in range(4)] == [3, 3, 2, 0]
+    assert watermark(storage) == len(SCORES)
+
+    # 新成绩从水位之后继续汇总
+    score_id = add_score(storage, 1, 100, 'easy', 50, 0)
+    assert rollup.run_once() == (1, 0)
+    assert watermark(storage) == score_id
+    assert rollup.status()['rolled_up'] == len(SCORES) + 1
+
+
+def test_unsettled_scores_wait_for_next_run(storage):
+    rollup = make_rollup(storage, settle_seconds=600)
+    fresh = storage.tables['scores'].insert({'user_id': 1, 'score': 100, 'difficulty': 'easy', 'time_taken': 50})
+    assert rollup.roll_up() == len(SCORES)
+    assert watermark(storage) == fresh - 1
+
+
+def test_later_batch_sums_into_existing_daily_row(storage):
+    rollup = make_rollup(storage)
+    rollup.run_once()
+    summaries = storage.tables['score_daily_summaries']
+    rows_before = len(summaries.rows)
+    [easy] = [row for row in summaries.rows.values()
+              if row['user_id'] == 1 and row['difficulty'] == 'easy' and row['games'] == 2]
+
+    add_score(storage, 1, 1500, 'easy', 20, 3)
+    rollup.run_once()
+    # 同一 (用户, 难度, 日期) 不新增行，累加到原有行上
+    assert len(summaries.rows) == rows_before
+    assert (easy['games'], easy['best_score'], easy['total_score']) == (3, 1500, 900 + 700 + 1500)
+    assert (easy['best_time'], easy['longest_time'], easy['total_time']) == (20, 40, 40 + 25 + 20)
+    assert (easy['games_under_30s'], easy['scores_over_1000']) == (2, 1)
+
+
+@pytest.mark.parametrize('batch_size', [1, 3, 5000])
+def test_stats_over_summaries_match_raw_aggregate(storage, batch_size):
+    expected = {}
+    for user_id in (1, 2):
+        rows = [row for row in SCORES if row[0] == user_id]
+        stats = raw_stats(rows)
+        assert profile_stats(storage, user_id)['games_played'] == stats['total_games']
+        expected[user_id] = stats
+
+    rollup = make_rollup(storage, batch_size=batch_size)
+    # 汇总进行到一半和全部完成后，统计结果都与原始聚合一致
+    rollup.roll_up()
+    for _ in range(2):
+        for user_id, stats in expected.items():
+            current = profile_stats(storage, user_id)
+            assert current['games_played'] == stats['total_games']
+            assert current['best_score'] == stats['best_score']
+            assert float(current['avg_score']) == pytest.approx(stats['avg_score'], abs=1e-4)
+            assert current['best_time'] == stats['best_time']
+        rollup.run_once()
+
+
+def test_archive_keeps_top_scores_per_difficulty():
+    storage = MemoryStorage()
+    old = [add_score(storage, 1, score, difficulty, 60, 30)
+           for difficulty in ('easy', 'hard') for score in (100, 400, 200, 300)]
+    recent = add_score(storage, 2, 50, 'easy', 60, 0)
+    before = profile_stats(storage, 1)
+
+    rollup = make_rollup(storage, retention_days=7, keep_top=2)
+    assert rollup.run_once() == (len(old) + 1, 4)
+
+    # 每个难度分数最高的两条留在 scores，其余的移到归档表
+    kept = {(row['difficulty'], row['score']) for row in storage.tables['scores'].rows.values()}
+    assert kept == {('easy', 400), ('easy', 300), ('hard', 400), ('hard', 300), ('easy', 50)}
+    archived = {(row['difficulty'], row['score']) for row in storage.tables['scores_archive'].rows.values()}
+    assert archived == {('easy', 100), ('easy', 200), ('hard', 100), ('hard', 200)}
+    assert recent in storage.tables['scores'].rows
+
+    # 归档不影响已汇总的统计；扫描到末尾后游标回到开头
+    assert profile_stats(storage, 1) == before
+    assert rollup.archive() == 0
+    assert rollup.status()['archived'] == 4
@@ -0,0 +1,76 @@
+"""SingleFlight：同键并发调用共享结果和异常，完成后不缓存"""
+
+import threading
+import time
+
+import pytest
+
+from backend.singleflight import SingleFlight, make_key
+
+
+def run_concurrently(flight, key, fn, followers=3):
+    """由一个线程执行 fn，followers 个线程在其执行期间加入，返回每个线程的 (结果, 异常)"""
+    release = threading.Event()
+    outcomes = []
+    lock = threading.Lock()
+
+    def leader_fn():
+        release.wait(5)
+        return fn()
+
+    def call():
+        try:
+            outcome = (flight.do(key, leader_fn), None)
+        except Exception as e:
+            outcome = (None, e)
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=call) for _ in range(followers + 1)]
+    threads[0].start()
+    while flight.stats()['inflight'] == 0:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    while flight.stats()['shared'] < followers:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    outcomes = run_concurrently(flight, 'k', lambda: calls.append(1) or 'value')
+    assert calls == [1]
+    assert outcomes == [('value', None)] * 4
+    assert flight.stats() == {'inflight': 0, 'executed': 1, 'shared': 3}
+
+
+def test_error_propagates_to_every_waiter():
+    flight = SingleFlight()
+    error = RuntimeError('database down')
+
+    def fail():
+        raise error
+
+    outcomes = run_concurrently(flight, 'k', fail)
+    assert len(outcomes) == 4
+    assert all(result is None and raised is error for result, raised in outcomes)
+
+
+def test_failed_call_is_not_cached():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do('k', int, 'not a number')
+    assert flight.stats()['inflight'] == 0
+    assert flight.do('k', int, '42') == 42
+    assert flight.stats()['executed'] == 2
+
+
+def test_make_key_normalizes_arguments():
+    assert make_key('leaderboard', ' easy ', 10) == make_key('leaderboard', 'easy', 10)
+    assert make_key('history', [1, ' a'], page=' 2') == make_key('history', (1, 'a'), page='2')
+    assert make_key('leaderboard', 'easy', 10) != make_key('leaderboard', 'hard', 10)
@@ -0,0 +1,95 @@
+"""SpectatorHub：按节拍合并发送进度快照，只为有观众的对战保留快照"""
+
+import pytest
+
+from backend.spectators import SpectatorHub, SpectatorLimitError, spectator_room
+
+PLAYERS = (10, 20)
+
+
+@pytest.fixture
+def sent():
+    return []
+
+
+@pytest.fixture
+def hub(sent):
+    closed = []
+    hub = SpectatorHub(lambda event, data, room: sent.append((event, data, room)), closed.append, max_spectators=2)
+    hub.closed = closed
+    return hub
+
+
+def progress(snapshot):
+    return [player['progress'] for player in snapshot['players']]
+
+
+def test_tick_sends_one_merged_snapshot_per_changed_match(hub, sent):
+    snapshot, previous = hub.join(1, PLAYERS, 'sid-a')
+    assert previous is None
+    assert (progress(snapshot), snapshot['seq'], snapshot['spectators']) == ([0, 0], 0, 1)
+    assert hub.tick() == 0
+
+    for value in (10, 20, 30):
+        hub.update(1, 10, value)
+    hub.update(1, 20, 5.5)
+    # 两个节拍之间的多次进度合并为一条快照
+    assert hub.tick() == 1
+    event, data, room = sent[-1]
+    assert (event, room) == ('spectate_snapshot', spectator_room(1))
+    assert (progress(data), data['seq']) == ([30, 5.5], 4)
+
+    # 没有新进度时不重复发送
+    assert hub.tick() == 0
+    hub.update(1, 20, 50)
+    assert hub.tick() == 1
+    assert progress(sent[-1][1]) == [30, 50]
+    assert hub.status()['snapshots_sent'] == 2
+
+
+def test_unwatched_match_keeps_no_feed(hub):
+    assert not hub.update(1, 10, 50)
+    assert hub.status() == {'watched_matches': 0, 'spectators': 0, 'snapshots_sent': 0}
+    assert hub.tick() == 0
+
+    hub.join(1, PLAYERS, 'sid-a')
+    assert hub.update(1, 10, 60)
+    # 最后一名观众离开后快照被删除
+    assert hub.leave('sid-a') == 1
+    assert not hub.update(1, 10, 70)
+    assert hub.status()['watched_matches'] == 0
+
+
+@pytest.mark.parametrize('value', [None, 'fast', True, float('nan'), float('inf'), 10 ** 400])
+def test_invalid_progress_is_ignored(hub, value):
+    hub.join(1, PLAYERS, 'sid-a')
+    assert not hub.update(1, 10, value)
+    # 不是对战双方的进度同样忽略
+    assert not hub.update(1, 99, 50)
+    assert hub.tick() == 0
+
+
+def test_switching_matches_and_spectator_limit(hub):
+    hub.join(1, PLAYERS, 'sid-a')
+    hub.join(1, PLAYERS, 'sid-b')
+    with pytest.raises(SpectatorLimitError):
+        hub.join(1, PLAYERS, 'sid-c')
+    # 重复加入同一场不占用新名额
+    hub.join(1, PLAYERS, 'sid-b')
+
+    _, previous = hub.join(2, (30, 40), 'sid-b')
+    assert previous == 1
+    assert (hub.spectators(1), hub.spectators(2)) == (1, 1)
+    hub.join(1, PLAYERS, 'sid-c')
+
+
+def test_end_sends_final_snapshot_and_closes_room(hub, sent):
+    hub.join(1, PLAYERS, 'sid-a')
+    hub.update(1, 10, 100)
+    hub.end(1, {'winner_id': 10})
+    event, data, room = sent[-1]
+    assert (event, room) == ('spectate_match_over', spectator_room(1))
+    assert progress(data['snapshot']) == [100, 0] and data['result'] == {'winner_id': 10}
+    assert hub.closed == [spectator_room(1)]
+    assert hub.leave('sid-a') is None
+    assert hub.tick() == 0
@@ -0,0 +1,154 @@
+"""MySQLStorage：事务的提交 / 回滚语义，只读查询在副本失败时回退到主库"""
+
+import pytest
+from mysql.connector import errors
+
+from backend.db_router import DatabaseRouter
+from backend.storage import MySQLStorage
+
+
+class FakeDatabase:
+    """模拟 MySQL 的提交语义：autocommit 下每条语句立即生效，START TRANSACTION 后到 COMMIT 才生效"""
+
+    def __init__(self):
+        self.rows = []
+        self.down = set()   # 查询时报连接错误的节点
+
+    def connect(self, **config):
+        return FakeConnection(self, config.get('autocommit', False), config.get('host', 'primary'))
+
+
+class FakeConnection:
+    def __init__(self, database, autocommit, host='primary'):
+        self.database = database
+        self.autocommit = autocommit
+        self.host = host
+        self.in_transaction = False
+        self.pending = []
+
+    def cursor(self, prepared=False, dictionary=False):
+        return FakeCursor(self)
+
+    def start_transaction(self):
+        self.in_transaction = True
+
+    def commit(self):
+        self.database.rows.extend(self.pending)
+        self.pending = []
+        self.in_transaction = False
+
+    def rollback(self):
+        self.pending = []
+        self.in_transaction = False
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    lastrowid = None
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, query, params=()):
+        if self.connection.host in self.connection.database.down:
+            raise errors.OperationalError('Lost connection to MySQL server during query')
+        if 'FAIL' in query:
+            raise errors.ProgrammingError('simulated failure')
+        self.query = query
+        if query.startswith('SELECT'):
+            return
+        self.connection.pending.append(params)
+        if self.connection.autocommit and not self.connection.in_transaction:
+            self.connection.commit()
+
+    def fetchall(self):
+        # 只读查询返回执行它的节点
+        return [{'node': self.connection.host}] if self.query.startswith('SELECT') else []
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def database():
+    return FakeDatabase()
+
+
+@pytest.fixture
+def storage(database):
+    return MySQLStorage(DatabaseRouter({}, connect=database.connect))
+
+
+def test_transaction_commits_all_statements_together(storage, database):
+    with storage.transaction() as tx:
+        tx.execute_query("INSERT INTO t VALUES (%s)", (1,))
+        tx.execute_query("INSERT INTO t VALUES (%s)", (2,))
+        assert database.rows == []
+    assert database.rows == [(1,), (2,)]
+
+
+def test_failure_rolls_back_every_statement(storage, database):
+    with pytest.raises(errors.ProgrammingError):
+        with storage.transaction() as tx:
+            tx.execute_query("INSERT INTO summaries VALUES (%s)", ('summary',))
+            tx.execute_query("UPDATE watermark SET id = %s", ('watermark',))
+            tx.execute_query("FAIL", ())
+    assert database.rows == []
+
+
+def test_exception_in_block_rolls_back(storage, database):
+    with pytest.raises(RuntimeError):
+        with storage.transaction() as tx:
+            tx.execute_query("INSERT INTO t VALUES (%s)", (1,))
+            raise RuntimeError('crash between statements')
+    assert database.rows == []
+
+
+def test_statements_outside_transaction_autocommit(storage, database):
+    storage.execute_query("INSERT INTO t VALUES (%s)", (1,))
+    assert database.rows == [(1,)]
+
+
+@pytest.fixture
+def replicated(database):
+    router = DatabaseRouter({'host': 'primary'}, [{'host': 'replica'}], connect=database.connect,
+                            pool_options={'size': 1, 'timeout': 0.01})
+    return MySQLStorage(router), router
+
+
+def test_reads_go_to_healthy_replica(replicated):
+    storage, _ = replicated
+    assert storage.execute_query("SELECT 1", fetch='one') == {'node': 'replica'}
+
+
+def test_replica_query_failure_retries_on_primary(replicated, database):
+    storage, router = replicated
+    database.down.add('replica')
+    assert storage.execute_query("SELECT 1", fetch='all') == [{'node': 'primary'}]
+    assert not router.replicas[0].healthy
+    # 之后的读请求直接走主库
+    database.down.clear()
+    assert storage.execute_query("SELECT 1", fetch='one') == {'node': 'primary'}
+
+
+def test_query_error_on_replica_is_not_retried(replicated, database):
+    storage, router = replicated
+    # SQL 错误不是节点故障：不重试，也不影响副本的健康状态
+    assert storage.execute_query("SELECT FAIL", fetch='one') is None
+    assert router.replicas[0].healthy
+
+
+def test_replica_pool_exhaustion_falls_back_without_marking_unhealthy(replicated):
+    storage, router = replicated
+    held = router.replicas[0].pool.acquire()
+    try:
+        assert storage.execute_query("SELECT 1", fetch='one') == {'node': 'primary'}
+    finally:
+        held.close()
+    assert router.replicas[0].healthy
+    assert storage.execute_query("SELECT 1", fetch='one') == {'node': 'replica'}
@@ -0,0 +1,194 @@
+"""
+请求追踪
+每个 REST 请求 / SocketIO 事件对应一个 trace，每次数据库查询记录为一个子 span
+（SQL 指纹、返回行数、耗时），用于发现 N+1 查询和多余的数据库往返
+
+当前 trace 保存在 contextvars 中；异步任务在调度时复制调用方的上下文，
+并通过 hold() 让 trace 在任务完成后才结束，异步查询的 span 也会计入同一个 trace
+完成的 trace 保存在内存环形缓冲区中，超过慢阈值的可同时追加写入 JSONL 文件
+"""
+
+import contextvars
+import datetime
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+_current_trace = contextvars.ContextVar('jigsaw_trace', default=None)
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(query):
+    """SQL 指纹：去掉注释和字面量，合并空白，IN 列表折叠为 (...)"""
+    query = re.sub(r'--[^\n]*', ' ', query)
+    query = re.sub(r"'(?:[^'\\]|\\.)*'", '?', query)
+    query = re.sub(r'\b\d+\b', '?', query)
+    query = re.sub(r'%s', '?', query)
+    query = re.sub(r'\s+', ' ', query).strip()
+    return re.sub(r'IN \(\s*\?(?:\s*,\s*\?)*\s*\)', 'IN (...)', query, flags=re.IGNORECASE)
+
+
+class Span:
+    """trace 中的一个子操作"""
+
+    __slots__ = ('name', 'offset_ms', 'duration_ms', 'attrs')
+
+    def __init__(self, name, offset_ms, duration_ms, attrs):
+        self.name = name
+        self.offset_ms = offset_ms
+        self.duration_ms = duration_ms
+        self.attrs = attrs
+
+    def to_dict(self):
+        return dict(self.attrs, name=self.name, offset_ms=round(self.offset_ms, 3),
+                    duration_ms=round(self.duration_ms, 3))
+
+
+class Trace:
+    """一次请求或事件的追踪记录"""
+
+    def __init__(self, name, kind, attrs, max_spans):
+        # 不使用 uuid4：os.urandom 会释放 GIL，既慢又会让采样分析器的采样点偏向这里
+        self.trace_id = '%016x' % random.getrandbits(64)
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+        self.started_at = datetime.datetime.now()
+        self.duration_ms = None
+        self.spans = []
+        self.dropped_spans = 0
+        self.max_spans = max_spans
+        self._t0 = time.perf_counter()
+        self._end = None
+        # 根操作本身 + 尚未完成的异步任务
+        self._pending = 1
+        self._lock = threading.Lock()
+
+    def add_span(self, name, duration_seconds, attrs):
+        end = time.perf_counter()
+        offset_ms = (end - duration_seconds - self._t0) * 1000
+        with self._lock:
+            if len(self.spans) >= self.max_spans:
+                self.dropped_spans += 1
+                return
+            self.spans.append(Span(name, offset_ms, duration_seconds * 1000, attrs))
+
+    def to_dict(self):
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        db_spans = [span for span in spans if span['name'] == 'db']
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'kind': self.kind,
+            'attrs': self.attrs,
+            'started_at': self.started_at.isoformat(timespec='milliseconds'),
+            'duration_ms': round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            'db_queries': len(db_spans),
+            'db_ms': round(sum(span['duration_ms'] for span in db_spans), 3),
+            'dropped_spans': self.dropped_spans,
+            'spans': spans,
+        }
+
+
+class Tracer:
+    """追踪器"""
+
+    def __init__(self, buffer_size=500, slow_ms=200.0, export_path=None, max_spans=200, enabled=True):
+        self.slow_ms = slow_ms
+        self.export_path = export_path
+        self.max_spans = max_spans
+        self.enabled = enabled
+        self._buffer = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+
+    def start(self, name, kind, **attrs):
+        """开始一个 trace 并设为当前 trace，返回 finish() 所需的令牌"""
+        if not self.enabled:
+            return None
+        trace = Trace(name, kind, attrs, self.max_spans)
+        return trace, _current_trace.set(trace)
+
+    def finish(self, token, **attrs):
+        """结束 start() 开始的 trace"""
+        if token is None:
+            return
+        trace, var_token = token
+        trace.attrs.update(attrs)
+        try:
+            _current_trace.reset(var_token)
+        except ValueError:
+            # 在不同的上下文中结束（不应发生），仅清除当前值
+            _current_trace.set(None)
+        trace._end = time.perf_counter()
+        self._release(trace)
+
+    def current(self):
+        return _current_trace.get()
+
+    def add_span(self, name, duration_seconds, **attrs):
+        """向当前 trace 添加一个已完成的 span（没有当前 trace 时忽略）"""
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, duration_seconds, attrs)
+
+    def hold(self):
+        """
+        异步任务调度时调用：推迟当前 trace 的结束，直到返回的回调被调用
+        没有当前 trace 时返回 None
+        """
+        trace = _current_trace.get()
+        if trace is None:
+            return None
+        with trace._lock:
+            trace._pending += 1
+        return lambda *_: self._release(trace, task_done=True)
+
+    def recent(self, limit=50):
+        with self._lock:
+            traces = list(self._buffer)
+        return [trace.to_dict() for trace in reversed(traces[-limit:])]
+
+    def slowest(self, limit=20, min_ms=0.0):
+        with self._lock:
+            traces = [trace for trace in self._buffer if trace.duration_ms >= min_ms]
+        traces.sort(key=lambda trace: trace.duration_ms, reverse=True)
+        return [trace.to_dict() for trace in traces[:limit]]
+
+    def _release(self, trace, task_done=False):
+        with trace._lock:
+            trace._pending -= 1
+            if task_done:
+                trace._end = max(trace._end or 0.0, time.perf_counter())
+            if trace._pending > 0:
+                return
+            trace.duration_ms = (trace._end - trace._t0) * 1000
+        self._record(trace)
+
+    def _record(self, trace):
+        with self._lock:
+            self._buffer.append(trace)
+        if self.export_path and trace.duration_ms >= self.slow_ms:
+            try:
+                line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+                with self._lock, open(self.export_path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+            except OSError as e:
+                print(f"写入追踪文件失败: {e}")
+
+
+def format_waterfall(trace):
+    """把 trace 字典格式化为文本瀑布图，便于在终端查看"""
+    lines = [f"{trace['started_at']}  {trace['kind']} {trace['name']}  {trace['duration_ms']:.1f} ms  "
+             f"({trace['db_queries']} queries, {trace['db_ms']:.1f} ms in DB)  [{trace['trace_id']}]"]
+    for span in trace['spans']:
+        detail = span.get('sql', '')
+        rows = f" rows={span['rows']}" if span.get('rows') is not None else ''
+        lines.append(f"  +{span['offset_ms']:8.1f} ms {span['duration_ms']:8.1f} ms  {span['name']}{rows}  {detail}")
+    if trace['dropped_spans']:
+        lines.append(f"  ... {trace['dropped_spans']} spans dropped")
+    return '\n'.join(lines)
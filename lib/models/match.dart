@@ -6,6 +6,8 @@ class Match {
   final String difficulty;
   final String imageSource;
   final String status;
+  // 对战布局种子（服务器在对战开始时生成），旧版本服务器不下发时为 null
+  final int? layoutSeed;
 
   Match({
     required this.id,
@@ -14,6 +16,7 @@ class Match {
     required this.difficulty,
     required this.imageSource,
     required this.status,
+    this.layoutSeed,
   });
 
   /// 从JSON数据创建Match对象的工厂构造函数
@@ -29,6 +32,7 @@ class Match {
       difficulty: details['difficulty'],
       imageSource: details['image_source'],
       status: details['status'] ?? 'pending',
+      layoutSeed: details['layout_seed'],
     );
   }
 
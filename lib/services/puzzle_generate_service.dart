@@ -40,13 +40,22 @@ class PuzzleGenerateService {
     return _defaultImages[random.nextInt(_defaultImages.length)];
   }
 
+  /// 对战中由种子决定默认图片，双方看到同一张图（与服务器 resolve_image 一致）
+  static String defaultImageForSeed(int seed) {
+    return _defaultImages[seed % _defaultImages.length];
+  }
+
   /// 公开的API：根据图片源和难度生成拼图块列表
-  Future<List<PuzzlePiece>> generatePuzzle(
-      String imageSource, int difficulty) async {
+  /// 传入 [seed]（对战时由服务器下发）时，图片和边缘凹凸完全由种子决定，
+  /// 双方客户端生成的拼图相同
+  Future<List<PuzzlePiece>> generatePuzzle(String imageSource, int difficulty,
+      {int? seed}) async {
     // 智能加载图片 - 如果是默认图片，则随机选择
     String actualImageSource = imageSource;
     if (imageSource == 'assets/images/default_puzzle.jpg') {
-      actualImageSource = getRandomDefaultImage();
+      actualImageSource = seed != null
+          ? defaultImageForSeed(seed)
+          : getRandomDefaultImage();
     }
 
     ui.Image image;
@@ -65,9 +74,13 @@ class PuzzleGenerateService {
 
     // 生成图并随机化边缘
     final graph = generateGridGraph(gridSize, gridSize);
-    final random = Random();
-    for (var edge in graph.edges.values) {
-      edge.isConvexOnA = random.nextBool();
+    if (seed != null) {
+      applySeededLayout(graph, seed);
+    } else {
+      final random = Random();
+      for (var edge in graph.edges.values) {
+        edge.isConvexOnA = random.nextBool();
+      }
     }
     _lastGraph = graph;
 
@@ -137,6 +150,32 @@ class PuzzleGenerateService {
     return frameInfo.image;
   }
 
+  /// 按边 id 顺序用种子决定每条边的凹凸
+  static void applySeededLayout(PuzzleGraph graph, int seed) {
+    final random = LayoutRandom(seed);
+    final edgeIds = graph.edges.keys.toList()..sort();
+    for (final edgeId in edgeIds) {
+      graph.edges[edgeId]!.isConvexOnA = random.nextBool();
+    }
+  }
+
+  /// 布局签名：每 4 条边组成一个十六进制字符（第 j 条边为第 j 位），
+  /// 完成对战时上报给服务器校验
+  static String layoutSignature(PuzzleGraph graph) {
+    final edgeIds = graph.edges.keys.toList()..sort();
+    final buffer = StringBuffer();
+    for (int start = 0; start < edgeIds.length; start += 4) {
+      int nibble = 0;
+      for (int bit = 0; bit < 4 && start + bit < edgeIds.length; bit++) {
+        if (graph.edges[edgeIds[start + bit]]!.isConvexOnA) {
+          nibble |= 1 << bit;
+        }
+      }
+      buffer.write(nibble.toRadixString(16));
+    }
+    return buffer.toString();
+  }
+
   // 根据难度确定拼图网格大小
   int _getDifficultySize(int difficulty) {
     switch (difficulty) {
@@ -421,3 +460,43 @@ class PuzzleGenerateService {
     return pieces;
   }
 }
+
+/// 对战布局随机数：xorshift32，初始状态由种子经 Jenkins one-at-a-time 散列得到。
+/// 只用移位、异或和 32 位加法（每步都截断到 32 位），在所有平台上与
+/// 服务器 backend/puzzle_layout.py 的结果逐位相同；dart:math 的 Random 不保证这一点
+class LayoutRandom {
+  static const int _mask32 = 0xFFFFFFFF;
+  // xorshift 的状态不能为 0
+  static const int _zeroState = 0x9E3779B9;
+
+  int _state;
+
+  LayoutRandom(int seed) : _state = _hashSeed(seed & _mask32) {
+    if (_state == 0) _state = _zeroState;
+  }
+
+  static int _hashSeed(int seed) {
+    int h = 0;
+    for (int i = 0; i < 4; i++) {
+      h = (h + ((seed >> (8 * i)) & 0xFF)) & _mask32;
+      h = (h + ((h << 10) & _mask32)) & _mask32;
+      h ^= h >> 6;
+    }
+    h = (h + ((h << 3) & _mask32)) & _mask32;
+    h ^= h >> 11;
+    h = (h + ((h << 15) & _mask32)) & _mask32;
+    return h;
+  }
+
+  int nextUint32() {
+    int x = _state;
+    x ^= (x << 13) & _mask32;
+    x ^= x >> 17;
+    x ^= (x << 5) & _mask32;
+    _state = x;
+    return x;
+  }
+
+  // 取最高位，xorshift 的低位质量较差
+  bool nextBool() => (nextUint32() >> 31) == 1;
+}
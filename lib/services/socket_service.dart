@@ -127,12 +127,13 @@ class SocketService {
     });
   }
 
-  void playerFinished(int matchId, int timeMs) {
+  void playerFinished(int matchId, int timeMs, {String? layoutSignature}) {
     if (_socket?.connected != true) return;
     // 2. 直接发送数据
     _socket!.emit('player_finished', {
       'match_id': matchId,
       'time_ms': timeMs,
+      if (layoutSignature != null) 'layout_signature': layoutSignature,
     });
   }
 
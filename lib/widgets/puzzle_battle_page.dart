@@ -117,8 +117,10 @@ class _PuzzleBattlePageState extends State<PuzzleBattlePage> {
       setState(() => _statusMessage = "正在生成经典拼图...");
       final difficultyMap = {'easy': 1, 'medium': 2, 'hard': 3};
       final difficulty = difficultyMap[widget.match.difficulty] ?? 1;
-      final pieces =
-          await _generator.generatePuzzle(widget.match.imageSource, difficulty);
+      // 使用服务器下发的种子，双方生成相同的拼图
+      final pieces = await _generator.generatePuzzle(
+          widget.match.imageSource, difficulty,
+          seed: widget.match.layoutSeed);
       _targetImage = _generator.lastLoadedImage;
 
       await _gameService.initGame(pieces, difficulty);
@@ -153,7 +155,11 @@ class _PuzzleBattlePageState extends State<PuzzleBattlePage> {
             "你已完成！用时: ${(elapsedMs / 1000).toStringAsFixed(2)}s. 等待对手...";
       });
     }
-    _socketService.playerFinished(widget.match.id, elapsedMs);
+    final graph = _generator.lastGraph;
+    _socketService.playerFinished(widget.match.id, elapsedMs,
+        layoutSignature: widget.match.layoutSeed != null && graph != null
+            ? PuzzleGenerateService.layoutSignature(graph)
+            : null);
   }
 
   void _showGameResultDialog(Map<String, dynamic> resultData) {
@@ -0,0 +1,10 @@
+-- 成就解锁记录（server.py 已在使用，但 jigsaw.sql 中缺少该表）
+CREATE TABLE IF NOT EXISTS `user_achievements` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `user_id` INT NOT NULL,
+  `achievement_id` VARCHAR(64) NOT NULL,
+  `completed_at` TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `unique_user_achievement` (`user_id`, `achievement_id`),
+  CONSTRAINT `fk_user_achievements_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -0,0 +1,8 @@
+-- 排行榜：WHERE difficulty = ? ORDER BY score DESC, time_taken ASC LIMIT ?
+-- 按难度过滤和不过滤两种情况都可以沿索引顺序读取前 N 行，不再需要 filesort
+-- idx_difficulty、idx_score 是新索引的前缀，一并删除
+ALTER TABLE `scores`
+  ADD KEY `idx_scores_difficulty_rank` (`difficulty`, `score` DESC, `time_taken`),
+  ADD KEY `idx_scores_rank` (`score` DESC, `time_taken`),
+  DROP KEY `idx_difficulty`,
+  DROP KEY `idx_score`;
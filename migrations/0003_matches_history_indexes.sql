@@ -0,0 +1,8 @@
+-- 对战历史 / 社交统计：WHERE challenger_id = ? (或 opponent_id = ?) AND status = 'completed'
+-- ORDER BY completed_at DESC，两个分支各自沿索引倒序读取
+-- 原单列索引是新索引的前缀（外键仍由新索引支撑），一并删除
+ALTER TABLE `matches`
+  ADD KEY `idx_matches_challenger_status` (`challenger_id`, `status`, `completed_at`),
+  ADD KEY `idx_matches_opponent_status` (`opponent_id`, `status`, `completed_at`),
+  DROP KEY `idx_challenger`,
+  DROP KEY `idx_opponent`;
@@ -0,0 +1,8 @@
+-- 好友列表 / 好友请求：WHERE (user_one_id = ? OR user_two_id = ?) AND status = ?
+-- 两侧各有 (用户, 状态) 索引时可以走 index_merge，而不是扫描整张表
+-- idx_user_one 与 unique_friendship 的前缀重复，idx_user_two 是新索引的前缀，一并删除
+ALTER TABLE `friendships`
+  ADD KEY `idx_friendships_one_status` (`user_one_id`, `status`),
+  ADD KEY `idx_friendships_two_status` (`user_two_id`, `status`),
+  DROP KEY `idx_user_one`,
+  DROP KEY `idx_user_two`;
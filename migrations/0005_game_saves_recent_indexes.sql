@@ -0,0 +1,7 @@
+-- 读取存档：WHERE user_id = ? [AND game_mode = ? AND difficulty = ?] ORDER BY updated_at DESC
+-- 在原 (user_id, game_mode, difficulty) 索引末尾加上 updated_at，并为存档列表增加 (user_id, updated_at)
+ALTER TABLE `game_saves`
+  ADD KEY `idx_game_saves_user_updated` (`user_id`, `updated_at`),
+  ADD KEY `idx_game_saves_user_game_difficulty_updated` (`user_id`, `game_mode`, `difficulty`, `updated_at`),
+  DROP KEY `idx_game_saves_user_game_difficulty`,
+  DROP KEY `idx_user_id`;
@@ -0,0 +1,50 @@
+-- 成绩每日汇总：按 (用户, 难度, 日期) 累计，个人资料和成就统计读汇总表 + 尚未汇总的新成绩，
+-- 查询量只与用户的活跃天数有关，与 scores 保留多少年历史无关
+CREATE TABLE IF NOT EXISTS `score_daily_summaries` (
+  `user_id` INT NOT NULL,
+  `difficulty` VARCHAR(20) NOT NULL,
+  `day` DATE NOT NULL,
+  `games` INT NOT NULL DEFAULT 0,
+  `best_score` INT NOT NULL DEFAULT 0,
+  `total_score` BIGINT NOT NULL DEFAULT 0,
+  `best_time` INT NOT NULL DEFAULT 0,
+  `longest_time` INT NOT NULL DEFAULT 0,
+  `total_time` BIGINT NOT NULL DEFAULT 0,
+  `games_under_15s` INT NOT NULL DEFAULT 0,
+  `games_under_30s` INT NOT NULL DEFAULT 0,
+  `games_under_60s` INT NOT NULL DEFAULT 0,
+  `games_under_120s` INT NOT NULL DEFAULT 0,
+  `games_over_5min` INT NOT NULL DEFAULT 0,
+  `games_over_10min` INT NOT NULL DEFAULT 0,
+  `scores_over_1000` INT NOT NULL DEFAULT 0,
+  `scores_over_5000` INT NOT NULL DEFAULT 0,
+  `scores_over_10000` INT NOT NULL DEFAULT 0,
+  `first_played_at` TIMESTAMP NULL DEFAULT NULL,
+  `last_played_at` TIMESTAMP NULL DEFAULT NULL,
+  PRIMARY KEY (`user_id`, `difficulty`, `day`),
+  CONSTRAINT `fk_score_summaries_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- 汇总水位：id 不超过 last_score_id 的成绩都已计入汇总表
+CREATE TABLE IF NOT EXISTS `score_rollup_state` (
+  `name` VARCHAR(50) NOT NULL,
+  `last_score_id` INT NOT NULL DEFAULT 0,
+  `updated_at` TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+INSERT IGNORE INTO `score_rollup_state` (`name`, `last_score_id`) VALUES ('daily', 0);
+
+-- 超过保留期且已汇总的成绩移到归档表（压缩存储，不参与在线查询，可按需导出后清理）
+CREATE TABLE IF NOT EXISTS `scores_archive` (
+  `id` INT NOT NULL,
+  `user_id` INT NOT NULL,
+  `score` INT NOT NULL,
+  `difficulty` VARCHAR(20) NOT NULL,
+  `time_taken` INT NOT NULL,
+  `created_at` TIMESTAMP NULL DEFAULT NULL,
+  `archived_at` TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  KEY `idx_scores_archive_user` (`user_id`),
+  KEY `idx_scores_archive_created_at` (`created_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci ROW_FORMAT=COMPRESSED;
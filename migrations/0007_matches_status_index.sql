@@ -0,0 +1,4 @@
+-- 对战过期清理：启动时载入 WHERE status IN ('pending', 'in_progress') 的对战，
+-- 已完成的对战占绝大多数，按状态索引只读取未结束的少量行
+ALTER TABLE `matches`
+  ADD KEY `idx_matches_status_created` (`status`, `created_at`);
@@ -0,0 +1,24 @@
+-- 对战等级分：user_ratings 保存当前值，rating_history 记录每场对战带来的变化
+CREATE TABLE IF NOT EXISTS `user_ratings` (
+  `user_id` INT NOT NULL,
+  `rating` INT NOT NULL DEFAULT 1500,
+  `games` INT NOT NULL DEFAULT 0,
+  `wins` INT NOT NULL DEFAULT 0,
+  `updated_at` TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`user_id`),
+  KEY `idx_user_ratings_rating` (`rating`),
+  CONSTRAINT `fk_user_ratings_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+CREATE TABLE IF NOT EXISTS `rating_history` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `user_id` INT NOT NULL,
+  `match_id` INT NOT NULL,
+  `rating_before` INT NOT NULL,
+  `rating_after` INT NOT NULL,
+  `created_at` TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uk_rating_history_match_user` (`match_id`, `user_id`),
+  KEY `idx_rating_history_user` (`user_id`, `id`),
+  CONSTRAINT `fk_rating_history_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
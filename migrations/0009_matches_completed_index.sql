@@ -0,0 +1,3 @@
+-- 启动时按完成顺序重放对战：WHERE status = 'completed' ... ORDER BY completed_at, id
+ALTER TABLE `matches`
+  ADD KEY `idx_matches_status_completed` (`status`, `completed_at`);
@@ -0,0 +1,3 @@
+-- 对战布局种子：开始对战时生成，随 match_started 下发，双方客户端据此在本地生成相同的拼图
+ALTER TABLE `matches`
+  ADD COLUMN `layout_seed` INT UNSIGNED NULL AFTER `image_source`;
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+服务器热点函数微基准测试
+每个基准重复采样多次，每次采样执行足够多的调用以摊薄计时误差，记录单次调用耗时（微秒）；
+各基准轮流采样，采样分散在整个运行期间
+结果写入 JSON；test_runner.py --bench 在同一次调用中交替运行基线版本和当前版本的代码，
+用 --project-root 指定被测的代码目录（基准脚本本身始终使用当前版本）
+
+示例：
+    python scripts/benchmarks.py                                  # 测量当前代码并打印结果
+    python scripts/benchmarks.py --project-root /tmp/base --output base.json
+"""
+
+import argparse
+import atexit
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from typing import Callable, Dict, List
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 基准测试不依赖数据库：排行榜数据来自内存存储后端；缓存和事件日志写入临时目录
+os.environ.setdefault('JIGSAW_STORAGE_BACKEND', 'memory')
+SCRATCH_DIR = tempfile.mkdtemp(prefix='benchmarks-')
+os.environ.setdefault('JIGSAW_PUZZLE_CACHE_DIR', os.path.join(SCRATCH_DIR, 'puzzle_cache'))
+os.environ.setdefault('JIGSAW_EVENT_LOG_DIR', os.path.join(SCRATCH_DIR, 'event_log'))
+atexit.register(shutil.rmtree, SCRATCH_DIR, ignore_errors=True)
+
+
+def _load_server(project_root: str):
+    sys.path.insert(0, project_root)
+    import server
+    if server.storage.name != 'memory':
+        raise RuntimeError('benchmarks require JIGSAW_STORAGE_BACKEND=memory')
+    return server
+
+
+def bench_verify_token(server) -> Callable:
+    token = server.generate_token({'id': 42, 'username': 'bench_user', 'email': 'bench@example.com'})
+    return lambda: server.verify_token(token)
+
+
+def bench_json_serializable(server) -> Callable:
+    now = datetime.datetime(2024, 5, 1, 12, 30, 0)
+    row = {
+        'id': 1, 'challenger_id': 1, 'opponent_id': 2, 'status': 'completed', 'difficulty': 'easy',
+        'image_source': 'assets/images/puzzle1.jpg', 'winner_id': 1, 'challenger_time_ms': 53210,
+        'opponent_time_ms': None, 'created_at': now, 'started_at': now, 'completed_at': now,
+        'progress': Decimal('66.67'),
+    }
+    # json_serializable 会原地修改参数，每次调用传入新的副本
+    return lambda: server.json_serializable(dict(row))
+
+
+def bench_save_progress_classic(server) -> Callable:
+    placed = [i if i % 4 else None for i in range(36)]
+    available = list(range(36, 64))
+    return lambda: server.calculate_save_progress('classic', 8, placed, available, [])
+
+
+def bench_save_progress_master(server) -> Callable:
+    master_pieces = [{'id': i, 'x': i * 1.5, 'y': i * 2.5, 'rotation': 90} for i in range(120)]
+    return lambda: server.calculate_save_progress('master', 4, [], [], master_pieces)
+
+
+def bench_decode_save(server) -> Callable:
+    now = datetime.datetime(2024, 5, 1, 12, 30, 0)
+    row = {
+        'id': 7, 'save_name': 'auto_save_1714566600', 'game_mode': 'master', 'difficulty': '5',
+        'elapsed_seconds': 321, 'current_score': 1800, 'image_source': 'assets/images/puzzle1.jpg',
+        'placed_pieces_ids': json.dumps(list(range(40))),
+        'available_pieces_ids': json.dumps(list(range(40, 100))),
+        'master_pieces': json.dumps([{'id': i, 'x': i * 1.5, 'y': i * 2.5, 'rotation': 90} for i in range(100)]),
+        'progress': Decimal('40.00'), 'created_at': now, 'updated_at': now,
+    }
+    return lambda: server.decode_save(dict(row))
+
+
+def bench_leaderboard_body(server) -> Callable:
+    storage = server.storage
+    if not storage.tables['scores'].rows:
+        difficulties = ['easy', 'medium', 'hard', 'master']
+        for i in range(100):
+            storage.execute_query("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
+                                  (f'bench_{i}', f'bench_{i}@example.com', 'x'))
+        for i in range(2000):
+            storage.execute_query(
+                "INSERT INTO scores (user_id, score, difficulty, time_taken) VALUES (%s, %s, %s, %s)",
+                (i % 100 + 1, (i * 7919) % 10000, difficulties[i % 4], 10 + (i * 31) % 600))
+    return lambda: server.load_leaderboard_body('easy', 50)
+
+
+BENCHMARKS = {
+    'verify_token': bench_verify_token,
+    'json_serializable': bench_json_serializable,
+    'save_progress_classic': bench_save_progress_classic,
+    'save_progress_master': bench_save_progress_master,
+    'decode_save': bench_decode_save,
+    'leaderboard_body': bench_leaderboard_body,
+}
+
+
+def calibrate(fn: Callable, target_seconds: float) -> int:
+    """估算每次采样的调用次数，使单次采样耗时接近 target_seconds"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= target_seconds / 10 or number >= 1_000_000:
+            return max(1, int(number * target_seconds / max(elapsed, 1e-9)))
+        number *= 10
+
+
+def sample(fn: Callable, number: int, rounds: int = 5) -> float:
+    """
+    一次采样：单次调用的平均耗时（微秒）
+    取 rounds 轮中最快的一轮，过滤掉调度和中断带来的偶发干扰
+    """
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1e6
+
+
+def run_benchmarks(names: List[str], repeat: int, target_seconds: float, project_root: str = PROJECT_ROOT,
+                   rounds: int = 5) -> Dict:
+    """
+    各基准轮流采样（每轮每个基准一次），同一基准的 repeat 个采样分散在整个进程的运行期间；
+    机器的慢速时段通常持续零点几秒到数秒，集中采样时会整体落在某个时段里
+    """
+    server = _load_server(project_root)
+    fns = {}
+    for name in names:
+        try:
+            fn = BENCHMARKS[name](server)
+        except AttributeError as e:
+            # 基线版本中还没有被测函数
+            print(f"{name:<24}{'skipped':>12}  ({e})")
+            continue
+        fn()  # 预热
+        fns[name] = (fn, calibrate(fn, target_seconds / rounds))
+
+    samples = {name: [] for name in fns}
+    for _ in range(repeat):
+        for name, (fn, number) in fns.items():
+            samples[name].append(sample(fn, number, rounds))
+
+    results = {}
+    for name, values in samples.items():
+        results[name] = {
+            'unit': 'us',
+            'median': statistics.median(values),
+            'best': min(values),
+            'samples': values,
+        }
+        print(f"{name:<24}{results[name]['median']:>12.2f} us  (best {results[name]['best']:.2f})")
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'project_root': project_root,
+            'repeat': repeat,
+        },
+        'benchmarks': results,
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='Jigsaw server microbenchmarks')
+    parser.add_argument('--output', help='write results JSON to this file')
+    parser.add_argument('--project-root', default=PROJECT_ROOT, help='directory of the server code to measure')
+    parser.add_argument('--repeat', type=int, default=30, help='samples per benchmark')
+    parser.add_argument('--sample-time', type=float, default=0.02, help='target seconds per sample')
+    parser.add_argument('--filter', action='append', choices=sorted(BENCHMARKS), help='run only these benchmarks')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.filter or list(BENCHMARKS), args.repeat, args.sample_time,
+                             os.path.abspath(args.project_root))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"结果已保存到: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+查询计划检查
+1. 在内存存储后端上运行 query_budget.py 的场景，记录 server.py 实际执行的每条 SQL 及其参数；
+   server.py 中其余未被场景覆盖的 SQL 字面量按占位参数补充
+2. 新建一个独立的本地数据库：导入 jigsaw.sql，执行 migrations/ 下的迁移，批量生成测试数据并 ANALYZE
+3. 对每条语句执行 EXPLAIN，出现全表扫描、filesort 或临时表且不在 ACCEPTED 中时失败
+
+示例：
+    python scripts/explain_queries.py
+    python scripts/explain_queries.py --scale 5 --output plans.json
+退出码：0 通过，1 存在未接受的问题，2 MySQL 不可用
+"""
+
+import argparse
+import ast
+import contextlib
+import datetime
+import io
+import json
+import os
+import random
+import sys
+from typing import Dict, List
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPTS_DIR)
+SCHEMA_FILE = os.path.join(PROJECT_ROOT, 'jigsaw.sql')
+MIGRATIONS_DIR = os.path.join(PROJECT_ROOT, 'migrations')
+SERVER_FILE = os.path.join(PROJECT_ROOT, 'server.py')
+
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+
+import query_budget  # 设置内存存储后端的环境变量，必须先于 server 导入
+
+import mysql.connector
+
+from backend.migrator import Migrator, split_statements
+from backend.tracing import fingerprint
+
+# 每个 --scale 单位生成的行数
+SEED_ROWS = {
+    'users': 2000,
+    'scores': 40000,
+    'matches': 10000,
+    'friendships': 8000,
+    'game_saves': 4000,
+    'user_achievements': 6000,
+}
+
+# 已确认可以接受的计划问题：SQL 指纹前缀 -> (允许的问题, 原因)
+ACCEPTED = {
+    'SELECT u.id, u.username, f.status, f.action_user_id FROM users u LEFT JOIN friendships f': (
+        {'full_scan'}, '按用户名/邮箱子串搜索，前导 % 无法使用 B-tree 索引'),
+    '(SELECT m.id, m.difficulty, m.completed_at, m.winner_id': (
+        {'temporary', 'filesort'}, '合并两个分支的结果（各最多 50 行）后排序'),
+}
+
+ISSUE_LABELS = {
+    'full_scan': 'full table scan',
+    'filesort': 'filesort',
+    'temporary': 'temporary table',
+}
+
+
+def collect_statements() -> Dict[str, Dict]:
+    """运行场景并记录执行过的 SQL，返回 {指纹: {query, params, source}}"""
+    import server
+
+    statements = {}
+    execute = server.storage.execute_query
+
+    def recording_execute(query, params=None, fetch=False, pin_key=None):
+        statements.setdefault(fingerprint(query), {
+            'query': query, 'params': list(params or ()), 'source': 'scenario'})
+        return execute(query, params, fetch, pin_key)
+
+    server.storage.execute_query = recording_execute
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            query_budget.run_scenario()
+    finally:
+        server.storage.execute_query = execute
+
+    for query in static_statements(SERVER_FILE):
+        statements.setdefault(fingerprint(query), {
+            'query': query, 'params': ['1'] * query.count('%s'), 'source': 'static'})
+    return statements
+
+
+def static_statements(path: str) -> List[str]:
+    """server.py 中直接传给 execute_query 的 SQL 字面量"""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    queries = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or not node.args:
+            continue
+        func = node.func
+        name = func.id if isinstance(func, ast.Name) else func.attr if isinstance(func, ast.Attribute) else None
+        first = node.args[0]
+        if name == 'execute_query' and isinstance(first, ast.Constant) and isinstance(first.value, str):
+            queries.append(first.value)
+    return queries
+
+
+class SeededDatabase:
+    """用于 EXPLAIN 的独立数据库"""
+
+    def __init__(self, config: Dict, database: str, scale: float, seed: int = 42):
+        self.config = dict(config, database=database)
+        self.server_config = {k: v for k, v in config.items() if k != 'database'}
+        self.database = database
+        self.scale = scale
+        self.rng = random.Random(seed)
+
+    def connect(self, with_database=True):
+        return mysql.connector.connect(**(self.config if with_database else self.server_config))
+
+    def create(self):
+        conn = self.connect(with_database=False)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"DROP DATABASE IF EXISTS `{self.database}`")
+            cursor.execute(f"CREATE DATABASE `{self.database}` CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci")
+            cursor.close()
+        finally:
+            conn.close()
+
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            with open(SCHEMA_FILE, encoding='utf-8') as f:
+                for statement in split_statements(f.read()):
+                    cursor.execute(statement)
+                    if cursor.with_rows:
+                        cursor.fetchall()
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            Migrator(self.connect, MIGRATIONS_DIR).migrate()
+
+    def drop(self):
+        conn = self.connect(with_database=False)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"DROP DATABASE IF EXISTS `{self.database}`")
+            cursor.close()
+        finally:
+            conn.close()
+
+    def seed(self):
+        rng = self.rng
+        rows = {table: int(count * self.scale) for table, count in SEED_ROWS.items()}
+        difficulties = ['easy', 'medium', 'hard', 'master']
+        now = datetime.datetime.now().replace(microsecond=0)
+
+        def moment():
+            return now - datetime.timedelta(seconds=rng.randint(0, 180 * 86400))
+
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            self._insert(cursor, "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
+                         [(f'seed_user_{i}', f'seed_user_{i}@example.com', 'x') for i in range(rows['users'])])
+            cursor.execute("SELECT id FROM users")
+            user_ids = [row[0] for row in cursor.fetchall()]
+
+            self._insert(cursor,
+                         "INSERT INTO scores (user_id, score, difficulty, time_taken, created_at) VALUES (%s, %s, %s, %s, %s)",
+                         [(rng.choice(user_ids), rng.randint(100, 12000), rng.choice(difficulties),
+                           rng.randint(5, 900), moment()) for _ in range(rows['scores'])])
+
+            matches = []
+            statuses = ['completed'] * 7 + ['pending', 'in_progress', 'declined', 'cancelled']
+            for _ in range(rows['matches']):
+                challenger, opponent = rng.sample(user_ids, 2)
+                status = rng.choice(statuses)
+                completed_at = moment() if status == 'completed' else None
+                winner = rng.choice([challenger, opponent]) if completed_at else None
+                matches.append((challenger, opponent, status, rng.choice(difficulties),
+                                'assets/images/puzzle1.jpg', winner, completed_at))
+            self._insert(cursor,
+                         "INSERT INTO matches (challenger_id, opponent_id, status, difficulty, image_source, "
+                         "winner_id, completed_at) VALUES (%s, %s, %s, %s, %s, %s, %s)", matches)
+
+            pairs = set()
+            while len(pairs) < rows['friendships']:
+                a, b = rng.sample(user_ids, 2)
+                pairs.add((min(a, b), max(a, b)))
+            self._insert(cursor,
+                         "INSERT INTO friendships (user_one_id, user_two_id, status, action_user_id) VALUES (%s, %s, %s, %s)",
+                         [(a, b, rng.choice(['accepted', 'accepted', 'pending']), rng.choice([a, b]))
+                          for a, b in sorted(pairs)])
+
+            self._insert(cursor,
+                         "INSERT INTO game_saves (user_id, save_name, game_mode, difficulty, progress, updated_at) "
+                         "VALUES (%s, %s, %s, %s, %s, %s)",
+                         [(rng.choice(user_ids), f'seed_save_{i}', rng.choice(['classic', 'master']),
+                           str(rng.randint(3, 8)), rng.randint(0, 100), moment()) for i in range(rows['game_saves'])])
+
+            achievements = {(rng.choice(user_ids), f'achievement_{rng.randint(1, 30)}')
+                            for _ in range(rows['user_achievements'])}
+            self._insert(cursor, "INSERT INTO user_achievements (user_id, achievement_id) VALUES (%s, %s)",
+                         sorted(achievements))
+
+            for table in SEED_ROWS:
+                cursor.execute(f"ANALYZE TABLE `{table}`")
+                cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        return rows
+
+    def explain(self, query, params):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute('EXPLAIN ' + query, params)
+            plan = cursor.fetchall()
+            cursor.close()
+            return plan
+        finally:
+            conn.close()
+
+    def _insert(self, cursor, query, rows, batch_size=1000):
+        for i in range(0, len(rows), batch_size):
+            cursor.executemany(query, rows[i:i + batch_size])
+        cursor.connection.commit()
+
+
+def plan_issues(plan: List[Dict]) -> List[str]:
+    """从 EXPLAIN 结果中找出全表扫描、filesort 和临时表"""
+    issues = set()
+    for row in plan:
+        table = row.get('table') or ''
+        extra = row.get('Extra') or ''
+        # <union1,2> / <derived2> 等内部结果表的 ALL 不是真实的表扫描
+        if row.get('type') == 'ALL' and not table.startswith('<'):
+            issues.add('full_scan')
+        if 'Using filesort' in extra:
+            issues.add('filesort')
+        if 'Using temporary' in extra:
+            issues.add('temporary')
+    return sorted(issues)
+
+
+def accepted_issues(sql_fingerprint: str):
+    for prefix, (issues, reason) in ACCEPTED.items():
+        if sql_fingerprint.startswith(fingerprint(prefix)):
+            return issues, reason
+    return set(), None
+
+
+def check_plans(db: SeededDatabase, statements: Dict[str, Dict]) -> List[Dict]:
+    results = []
+    for sql_fingerprint, statement in sorted(statements.items()):
+        if sql_fingerprint.upper().startswith('INSERT'):
+            continue
+        try:
+            plan = db.explain(statement['query'], statement['params'])
+        except mysql.connector.Error as e:
+            results.append({'fingerprint': sql_fingerprint, 'source': statement['source'],
+                            'issues': ['error'], 'unaccepted': ['error'], 'reason': None,
+                            'error': str(e), 'plan': []})
+            continue
+        issues = plan_issues(plan)
+        allowed, reason = accepted_issues(sql_fingerprint)
+        results.append({
+            'fingerprint': sql_fingerprint,
+            'source': statement['source'],
+            'issues': issues,
+            'unaccepted': [issue for issue in issues if issue not in allowed],
+            'reason': reason,
+            'plan': plan,
+        })
+    return results
+
+
+def format_report(results: List[Dict]) -> str:
+    lines = []
+    for row in results:
+        verdict = 'FAIL' if row['unaccepted'] else 'ok'
+        issues = ', '.join(ISSUE_LABELS.get(issue, issue) for issue in row['issues']) or '-'
+        lines.append(f"[{verdict:>4}] {row['fingerprint'][:100]}")
+        lines.append(f"        issues: {issues}" + (f"  (accepted: {row['reason']})" if row['reason'] and row['issues'] else ''))
+        if row.get('error'):
+            lines.append(f"        error: {row['error']}")
+        if row['unaccepted']:
+            for step in row['plan']:
+                lines.append(f"        {step.get('table')}: type={step.get('type')} key={step.get('key')} "
+                             f"rows={step.get('rows')} extra={step.get('Extra')}")
+    failed = sum(1 for row in results if row['unaccepted'])
+    lines.append(f"\n{len(results)} statements checked, {failed} with unaccepted plan issues")
+    return '\n'.join(lines)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='EXPLAIN every server.py query against a seeded database')
+    parser.add_argument('--database', default='jigsaw_explain', help='scratch database (dropped and recreated)')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for seeded row counts')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch database afterwards')
+    parser.add_argument('--output', help='write plans JSON to this file')
+    args = parser.parse_args()
+
+    import server
+    if args.database == server.DB_CONFIG['database']:
+        parser.error('--database must not be the application database (it is dropped and recreated)')
+
+    statements = collect_statements()
+    db = SeededDatabase(server.DB_CONFIG, args.database, args.scale)
+    try:
+        db.create()
+    except mysql.connector.Error as e:
+        print(f"MySQL 不可用，跳过查询计划检查: {e}")
+        sys.exit(2)
+
+    try:
+        rows = db.seed()
+        results = check_plans(db, statements)
+    finally:
+        if not args.keep:
+            db.drop()
+
+    print(format_report(results))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'seed_rows': rows, 'statements': results}, f, indent=2, ensure_ascii=False, default=str)
+
+    sys.exit(1 if any(row['unaccepted'] for row in results) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+压力测试脚本
+模拟 N 个并发玩家：注册、登录、自动存档、读取排行榜，并两两组队完成完整的 Socket 对战
+（invite_to_match → respond_to_invite → player_progress_update → player_finished），
+按操作统计吞吐量、错误率和延迟分位数
+
+示例：
+    # 自动启动使用内存存储的本地服务器，20 个用户压测 60 秒
+    python scripts/load_test.py --spawn-server --users 20 --duration 60
+
+    # 压测已经启动的服务器（需以 JIGSAW_RATE_LIMITS=off 启动，否则注册/登录会被限流）
+    python scripts/load_test.py --url http://127.0.0.1:5000 --users 50
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+try:
+    import socketio
+except ImportError:
+    socketio = None
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩法计算分位数（输入需已排序）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadStats:
+    """线程安全的按操作统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = defaultdict(list)
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def record(self, operation: str, seconds: float, ok: bool = True, detail: str = ''):
+        with self._lock:
+            self.latencies[operation].append(seconds)
+            if not ok:
+                self.errors[operation] += 1
+                if len(self.error_samples[operation]) < 3:
+                    self.error_samples[operation].append(detail)
+
+    def summary(self) -> Dict:
+        """每个操作的次数、吞吐量、错误率和延迟分位数（毫秒）"""
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        result = {}
+        with self._lock:
+            for operation in sorted(self.latencies):
+                values = sorted(self.latencies[operation])
+                count = len(values)
+                result[operation] = {
+                    'count': count,
+                    'throughput': count / elapsed if elapsed > 0 else 0.0,
+                    'error_rate': self.errors[operation] / count if count else 0.0,
+                    'p50_ms': percentile(values, 50) * 1000,
+                    'p95_ms': percentile(values, 95) * 1000,
+                    'p99_ms': percentile(values, 99) * 1000,
+                    'max_ms': values[-1] * 1000 if values else 0.0,
+                    'error_samples': list(self.error_samples[operation]),
+                }
+        return {'elapsed_seconds': elapsed, 'operations': result}
+
+
+class ApiClient:
+    """单个虚拟用户的 HTTP 客户端（保持长连接）"""
+
+    def __init__(self, base_url: str, stats: LoadStats, timeout: float = 10.0):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.stats = stats
+        self.timeout = timeout
+        self.token = None
+        self._connection = None
+
+    def request(self, operation: str, method: str, path: str, body: Optional[Dict] = None,
+                expect=(200, 201)):
+        """发送请求并记录延迟，返回 (状态码, JSON)"""
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        payload = json.dumps(body) if body is not None else None
+
+        start = time.perf_counter()
+        try:
+            if self._connection is None:
+                self._connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._connection.request(method, path, body=payload, headers=headers)
+            response = self._connection.getresponse()
+            raw = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            self.stats.record(operation, time.perf_counter() - start, ok=False, detail=repr(e))
+            self.close()
+            return None, None
+
+        elapsed = time.perf_counter() - start
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = None
+        ok = status in expect
+        self.stats.record(operation, elapsed, ok=ok, detail='' if ok else f'HTTP {status}: {raw[:120]!r}')
+        return status, data
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class VirtualPlayer:
+    """一个虚拟玩家：HTTP 会话 + 可选的 Socket 连接"""
+
+    def __init__(self, index: int, run_id: str, base_url: str, stats: LoadStats):
+        self.index = index
+        self.username = f'lt_{run_id}_{index}'
+        self.email = f'{self.username}@loadtest.local'
+        self.password = 'loadtest-password'
+        self.base_url = base_url
+        self.stats = stats
+        self.api = ApiClient(base_url, stats)
+        self.user_id = None
+        # 客户端自动存档只针对当前这一局，反复覆盖同一难度的存档
+        self.difficulty = random.choice([3, 4, 5])
+        self.sio = None
+        self._events = defaultdict(list)
+        self._event_cond = threading.Condition()
+
+    # ---------------- HTTP ----------------
+
+    def sign_up(self) -> bool:
+        status, _ = self.api.request('register', 'POST', '/api/auth/register', {
+            'username': self.username, 'email': self.email, 'password': self.password,
+        })
+        if status != 201:
+            return False
+        status, data = self.api.request('login', 'POST', '/api/auth/login', {
+            'email': self.username, 'password': self.password,
+        })
+        if status != 200:
+            return False
+        self.api.token = data['token']
+        self.user_id = data['user']['id']
+        return True
+
+    def autosave(self, step: int):
+        difficulty = self.difficulty
+        total = difficulty * difficulty
+        placed = list(range(min(step, total)))
+        self.api.request('save_game', 'POST', '/api/save-game', {
+            'gameMode': 'classic',
+            'difficulty': difficulty,
+            'elapsedSeconds': step * 5,
+            'currentScore': step * 10,
+            'imageSource': 'assets/images/puzzle1.jpg',
+            'placedPiecesIds': placed,
+            'availablePiecesIds': list(range(len(placed), total)),
+        })
+
+    def read_leaderboard(self):
+        difficulty = random.choice(['all', 'easy', 'medium', 'hard'])
+        self.api.request('leaderboard', 'GET', f'/api/scores?difficulty={difficulty}&limit=10')
+
+    # ---------------- Socket ----------------
+
+    def connect_socket(self, timeout: float) -> bool:
+        self.sio = socketio.Client(reconnection=False)
+        for event in ('authentication_success', 'authentication_failed', 'new_match_invite',
+                      'match_started', 'opponent_progress_update', 'match_over', 'error'):
+            self.sio.on(event, self._handler(event))
+
+        start = time.perf_counter()
+        try:
+            self.sio.connect(self.base_url, transports=['websocket'], wait_timeout=timeout)
+        except Exception as e:
+            self.stats.record('socket_connect', time.perf_counter() - start, ok=False, detail=repr(e))
+            return False
+        self.sio.emit('authenticate', {'token': self.api.token})
+        ok = self.wait_for('authentication_success', timeout) is not None
+        self.stats.record('socket_authenticate', time.perf_counter() - start, ok=ok,
+                          detail='' if ok else 'no authentication_success')
+        return ok
+
+    def wait_for(self, event: str, timeout: float, predicate=None):
+        """等待指定事件，返回事件数据；超时返回 None"""
+        deadline = time.monotonic() + timeout
+        with self._event_cond:
+            while True:
+                for i, data in enumerate(self._events[event]):
+                    if predicate is None or predicate(data):
+                        return self._events[event].pop(i)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._event_cond.wait(remaining)
+
+    def disconnect_socket(self):
+        if self.sio is not None:
+            try:
+                self.sio.disconnect()
+            except Exception:
+                pass
+
+    def _handler(self, event):
+        def handle(data=None):
+            with self._event_cond:
+                self._events[event].append(data)
+                self._event_cond.notify_all()
+        return handle
+
+
+def play_battle(challenger: VirtualPlayer, opponent: VirtualPlayer, stats: LoadStats,
+                progress_steps: int, timeout: float) -> bool:
+    """完整的一局对战，各阶段延迟按“发出事件 → 对端收到”统计"""
+    start = time.perf_counter()
+    challenger.sio.emit('invite_to_match', {
+        'opponent_id': opponent.user_id,
+        'difficulty': 'easy',
+        'image_source': 'assets/images/puzzle1.jpg',
+    })
+    invite = opponent.wait_for('new_match_invite', timeout,
+                               lambda d: d.get('challenger_id') == challenger.user_id)
+    stats.record('battle_invite', time.perf_counter() - start, ok=invite is not None,
+                 detail='' if invite else 'new_match_invite not received')
+    if not invite:
+        return False
+    match_id = invite['match_id']
+
+    start = time.perf_counter()
+    opponent.sio.emit('respond_to_invite', {'match_id': match_id, 'response': 'accepted'})
+    started = challenger.wait_for('match_started', timeout, lambda d: d['match']['id'] == match_id)
+    opponent.wait_for('match_started', timeout, lambda d: d['match']['id'] == match_id)
+    stats.record('battle_start', time.perf_counter() - start, ok=started is not None,
+                 detail='' if started else 'match_started not received')
+    if not started:
+        return False
+
+    for step in range(1, progress_steps + 1):
+        progress = 100.0 * step / (progress_steps + 1)
+        start = time.perf_counter()
+        challenger.sio.emit('player_progress_update', {'match_id': match_id, 'progress': progress})
+        relayed = opponent.wait_for('opponent_progress_update', timeout)
+        stats.record('battle_progress', time.perf_counter() - start, ok=relayed is not None,
+                     detail='' if relayed else 'opponent_progress_update not received')
+
+    start = time.perf_counter()
+    winner = random.choice([challenger, opponent])
+    winner.sio.emit('player_finished', {'match_id': match_id, 'time_ms': random.randint(20000, 120000)})
+    over = challenger.wait_for('match_over', timeout, lambda d: d['result']['id'] == match_id)
+    opponent.wait_for('match_over', timeout, lambda d: d['result']['id'] == match_id)
+    stats.record('battle_finish', time.perf_counter() - start, ok=over is not None,
+                 detail='' if over else 'match_over not received')
+    return over is not None
+
+
+class LoadTestRunner:
+    """压测运行器"""
+
+    def __init__(self, base_url: str, users: int, duration: float, think_time: float,
+                 battles: bool, progress_steps: int, timeout: float):
+        self.base_url = base_url.rstrip('/')
+        self.users = users
+        self.duration = duration
+        self.think_time = think_time
+        self.battles = battles
+        self.progress_steps = progress_steps
+        self.timeout = timeout
+        self.stats = LoadStats()
+        self.run_id = uuid.uuid4().hex[:8]
+
+    def run(self) -> Dict:
+        players = [VirtualPlayer(i, self.run_id, self.base_url, self.stats) for i in range(self.users)]
+        deadline = time.monotonic() + self.duration
+        barrier = threading.Barrier(self.users)
+
+        threads = [threading.Thread(target=self._player_loop, args=(player, players, barrier, deadline),
+                                    name=f'player-{player.index}', daemon=True)
+                   for player in players]
+        print(f"Starting load test: {self.users} users, {self.duration:.0f}s, run id {self.run_id}")
+        self.stats.started_at = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(self.duration + self.timeout * 4 + 60)
+        self.stats.finished_at = time.monotonic()
+
+        for player in players:
+            player.disconnect_socket()
+            player.api.close()
+        return self.stats.summary()
+
+    def _player_loop(self, player: VirtualPlayer, players: List[VirtualPlayer],
+                     barrier: threading.Barrier, deadline: float):
+        signed_up = player.sign_up()
+        socket_ready = False
+        if signed_up and self.battles:
+            socket_ready = player.connect_socket(self.timeout)
+
+        # 等待所有玩家完成登录和 Socket 认证后再开始对战，保证邀请时对手已在线
+        try:
+            barrier.wait(self.timeout * 4)
+        except threading.BrokenBarrierError:
+            pass
+        if not signed_up:
+            return
+
+        # 偶数号玩家向下一个玩家发起挑战，双方在对战之间穿插 HTTP 请求
+        partner = players[player.index + 1] if player.index % 2 == 0 and player.index + 1 < len(players) else None
+        step = 0
+        while time.monotonic() < deadline:
+            step += 1
+            player.autosave(step)
+            player.read_leaderboard()
+            if partner is not None and socket_ready and partner.sio is not None and partner.sio.connected:
+                play_battle(player, partner, self.stats, self.progress_steps, self.timeout)
+            if self.think_time:
+                time.sleep(random.uniform(0, self.think_time * 2))
+
+
+def format_report(summary: Dict) -> str:
+    """生成文本报告"""
+    lines = [
+        f"Elapsed: {summary['elapsed_seconds']:.1f}s",
+        '',
+        f"{'operation':<22}{'count':>8}{'ops/s':>10}{'errors':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+    ]
+    for operation, row in summary['operations'].items():
+        lines.append(
+            f"{operation:<22}{row['count']:>8}{row['throughput']:>10.1f}{row['error_rate']:>8.1%} "
+            f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}"
+        )
+    for operation, row in summary['operations'].items():
+        for sample in row['error_samples']:
+            lines.append(f"  ! {operation}: {sample}")
+    return '\n'.join(lines)
+
+
+def spawn_server(port: int, storage: str) -> subprocess.Popen:
+    """启动本地服务器（关闭限流和调试模式），等待端口可用"""
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, JIGSAW_STORAGE_BACKEND=storage, JIGSAW_RATE_LIMITS='off')
+    code = ("import server; "
+            f"server.socketio.run(server.app, host='127.0.0.1', port={port}, "
+            "allow_unsafe_werkzeug=True, log_output=False)")
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=project_root, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with code {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/api/health')
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('Server did not become ready within 30s')
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='Jigsaw server load test')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='server base URL')
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual players')
+    parser.add_argument('--duration', type=float, default=30, help='test duration in seconds')
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean pause between iterations (s)')
+    parser.add_argument('--progress-steps', type=int, default=4, help='progress updates per battle')
+    parser.add_argument('--timeout', type=float, default=10, help='per-operation timeout (s)')
+    parser.add_argument('--no-battles', action='store_true', help='skip socket battles')
+    parser.add_argument('--spawn-server', action='store_true', help='start a local server for the run')
+    parser.add_argument('--storage', default='memory', choices=['memory', 'mysql'],
+                        help='storage backend for --spawn-server')
+    parser.add_argument('--output', help='write the JSON summary to this file')
+    args = parser.parse_args()
+
+    battles = not args.no_battles
+    if battles and socketio is None:
+        print("python-socketio client is not installed (pip install 'python-socketio[client]'); "
+              "run with --no-battles to skip socket battles")
+        sys.exit(2)
+
+    process = None
+    url = args.url
+    if args.spawn_server:
+        port = urlsplit(url).port or 5000
+        url = f'http://127.0.0.1:{port}'
+        process = spawn_server(port, args.storage)
+
+    try:
+        runner = LoadTestRunner(url, args.users, args.duration, args.think_time,
+                                battles, args.progress_steps, args.timeout)
+        summary = runner.run()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(10)
+
+    print(format_report(summary))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"详细结果已保存到: {args.output}")
+
+    total = sum(row['count'] for row in summary['operations'].values())
+    failed = sum(row['count'] * row['error_rate'] for row in summary['operations'].values())
+    sys.exit(0 if total and failed == 0 else 1)
+
+
+if __name__ == '__main__':
+    main()
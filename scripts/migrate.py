@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+数据库结构迁移工具
+按版本号顺序执行 migrations/ 下尚未执行的迁移文件，连接参数默认取 server.py 的 DB_CONFIG
+
+示例：
+    python scripts/migrate.py                    # 执行所有待执行的迁移
+    python scripts/migrate.py status             # 查看每个版本的状态
+    python scripts/migrate.py up --target 3      # 只执行到版本 3
+    python scripts/migrate.py up --dry-run       # 只打印将要执行的语句
+"""
+
+import argparse
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(PROJECT_ROOT, 'migrations')
+
+sys.path.insert(0, PROJECT_ROOT)
+
+import mysql.connector
+
+from backend.migrator import Migrator, MigrationError
+
+
+def build_config(args) -> dict:
+    """server.py 的 DB_CONFIG，命令行参数优先"""
+    from server import DB_CONFIG
+    config = dict(DB_CONFIG)
+    for key in ('host', 'port', 'user', 'password', 'database'):
+        value = getattr(args, key)
+        if value is not None:
+            config[key] = value
+    return config
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='Apply versioned schema migrations')
+    parser.add_argument('command', nargs='?', default='up', choices=['up', 'status'])
+    parser.add_argument('--target', type=int, help='apply migrations up to this version')
+    parser.add_argument('--dry-run', action='store_true', help='print pending statements without executing them')
+    parser.add_argument('--dir', default=MIGRATIONS_DIR, help='migrations directory')
+    parser.add_argument('--host')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--user')
+    parser.add_argument('--password')
+    parser.add_argument('--database')
+    args = parser.parse_args()
+
+    config = build_config(args)
+    migrator = Migrator(lambda: mysql.connector.connect(**config), args.dir)
+
+    try:
+        if args.command == 'status':
+            for row in migrator.status():
+                applied_at = row['applied_at'] or '-'
+                print(f"{row['version']:04d}  {row['name']:<40}{row['state']:<10}{applied_at}")
+            return
+
+        applied = migrator.migrate(target=args.target, dry_run=args.dry_run)
+        if not applied:
+            print("数据库结构已是最新")
+    except (MigrationError, mysql.connector.Error) as e:
+        print(f"迁移失败: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
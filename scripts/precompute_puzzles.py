@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+部署时预生成拼图切割缓存
+为 assets/images 下的每张内置图片生成正方形图片（对战使用任意种子时也能复用），
+并为预设种子池（server.py 的 PUZZLE_PRESET_SEEDS）和常用网格大小生成图集和元数据，
+未指定种子的单人拼图请求因此都能直接命中缓存。缓存目录、最大边长等参数取自 server.py
+
+示例：
+    python scripts/precompute_puzzles.py                     # 预设种子池 x 3/4/5 网格
+    python scripts/precompute_puzzles.py --grid-sizes 3 4 5 6 --workers 8
+"""
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, PROJECT_ROOT)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def main():
+    """主函数"""
+    from server import puzzle_slicer, PUZZLE_ASSET_DIR, PUZZLE_PRESET_SEEDS, PUZZLE_PRESET_GRID_SIZES
+
+    parser = argparse.ArgumentParser(description='Precompute sliced puzzle atlases for the bundled images')
+    parser.add_argument('--images', default=PUZZLE_ASSET_DIR, help='directory of bundled puzzle images')
+    parser.add_argument('--grid-sizes', type=int, nargs='+', default=list(PUZZLE_PRESET_GRID_SIZES))
+    parser.add_argument('--seeds', type=int, default=PUZZLE_PRESET_SEEDS, help='precompute seeds 1..N')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if not puzzle_slicer.available():
+        print("未安装 Pillow / NumPy，无法预生成")
+        sys.exit(1)
+
+    puzzle_slicer.cache.load()
+    images = sorted(os.path.join(args.images, name) for name in os.listdir(args.images)
+                    if name.lower().endswith(IMAGE_EXTENSIONS))
+    jobs = [(path, size, seed) for path in images for size in args.grid_sizes for seed in range(1, args.seeds + 1)]
+
+    started = time.perf_counter()
+    computed_before = puzzle_slicer.computed
+    failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(puzzle_slicer.slice_file, *job): job for job in jobs}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(f"预生成失败 {futures[future]}: {e}")
+
+    stats = puzzle_slicer.stats()
+    print(f"预生成完成: {len(images)} 张图片, {len(jobs)} 个组合, 新生成 {puzzle_slicer.computed - computed_before} 个, "
+          f"失败 {failed} 个, 用时 {time.perf_counter() - started:.1f}s, "
+          f"缓存 {stats['entries']} 个条目 / {stats['bytes'] / 1024 / 1024:.1f} MB")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
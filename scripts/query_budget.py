@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+数据库往返预算检查
+在内存存储后端上依次驱动每个 REST 接口和 SocketIO 事件，从请求追踪中读取
+每个请求/事件执行的查询次数和 SQL 指纹，与 BUDGETS 中声明的上限比较，超出即失败
+（异步任务中的查询同样计入触发它的事件）
+
+示例：
+    python scripts/query_budget.py
+    python scripts/query_budget.py --output budget.json
+"""
+
+import argparse
+import atexit
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ['JIGSAW_STORAGE_BACKEND'] = 'memory'
+os.environ['JIGSAW_RATE_LIMITS'] = 'off'
+# 拼图缓存和对战事件日志写入临时目录，不在工作区留下文件，也不读取上次运行的事件
+SCRATCH_DIR = tempfile.mkdtemp(prefix='query-budget-')
+os.environ['JIGSAW_PUZZLE_CACHE_DIR'] = os.path.join(SCRATCH_DIR, 'puzzle_cache')
+os.environ['JIGSAW_EVENT_LOG_DIR'] = os.path.join(SCRATCH_DIR, 'event_log')
+atexit.register(shutil.rmtree, SCRATCH_DIR, ignore_errors=True)
+sys.path.insert(0, PROJECT_ROOT)
+
+# 每个请求/事件允许的最大查询次数（键为 trace 名称：HTTP 为 endpoint，SocketIO 为事件名）
+BUDGETS = {
+    'register': 2,
+    'login': 2,                       # 查询用户 + 需要时升级密码哈希
+    'reset_password': 1,
+    'validate_token': 0,
+    'submit_score': 2,                # 写入成绩 + 清理该难度的存档
+    'get_leaderboard': 1,
+    'get_profile': 2,
+    'get_user_achievements': 3,
+    'unlock_achievement': 2,
+    'get_match_history': 1,
+    'search_users': 1,
+    'send_friend_request': 2,
+    'get_friend_requests': 1,
+    'respond_to_friend_request': 2,
+    'get_friends': 1,
+    'submit_save': 2,
+    'load_save': 1,
+    'delete_save': 2,
+    'authenticate': 1,
+    'invite_to_match': 1,
+    'respond_to_invite': 3,
+    'player_progress_update': 0,      # 对战开始后由 active_matches 缓存提供对手信息
+    'player_finished': 5,             # 读取并完成对战、读回结果 + 等级分两条批量写入
+    'join_matchmaking': 2,            # 等级分来自内存天梯；配对成功时写入对战并读回
+    'spectate_match': 0,              # 进行中的对战由 active_matches 缓存提供
+    'leave_spectate': 0,
+    'get_match_replay': 1,            # 校验参与者/对战已结束；事件来自本地段文件和内存缓存
+    'get_rating_ladder': 1,
+    'get_user_rating': 1,
+    'slice_puzzle': 0,                # 切割结果来自磁盘缓存，不访问数据库
+    'get_puzzle_cache_file': 0,
+}
+
+# 必须与预算完全相等的步骤：对战热路径上的事件不允许访问数据库
+EXACT_BUDGETS = {'player_progress_update'}
+
+
+class BudgetScenario:
+    """依次执行请求，收集每一步的查询记录"""
+
+    def __init__(self, server, wait_timeout: float = 5.0):
+        self.server = server
+        self.client = server.app.test_client()
+        self.wait_timeout = wait_timeout
+        self.results = []
+        self._seen = set()
+
+    def step(self, label: str, trace_name: str, action: Callable, budget_key: Optional[str] = None):
+        """执行一步并记录对应 trace 的查询次数"""
+        action()
+        trace = self._wait_for_trace(trace_name)
+        key = budget_key or trace_name
+        budget = BUDGETS.get(key)
+        queries = trace['db_queries'] if trace else None
+        self.results.append({
+            'step': label,
+            'trace': trace_name,
+            'budget_key': key,
+            'budget': budget,
+            'queries': queries,
+            'fingerprints': [span['sql'] for span in trace['spans'] if span['name'] == 'db'] if trace else [],
+            'ok': trace is not None and (budget is None or
+                                         (queries == budget if key in EXACT_BUDGETS else queries <= budget)),
+        })
+        return trace
+
+    def _wait_for_trace(self, name: str) -> Optional[Dict]:
+        # 异步任务结束后 trace 才会记录，轮询等待
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            for trace in self.server.tracer.recent(50):
+                if trace['name'] == name and trace['trace_id'] not in self._seen:
+                    self._seen.add(trace['trace_id'])
+                    return trace
+            time.sleep(0.01)
+        return None
+
+
+def run_scenario() -> List[Dict]:
+    import server
+
+    scenario = BudgetScenario(server)
+    c = scenario.client
+    tokens = {}
+
+    def register(name):
+        def action():
+            response = c.post('/api/auth/register', json={
+                'username': name, 'email': f'{name}@budget.local', 'password': 'budget-password'})
+            tokens[name] = response.get_json()['token']
+        return action
+
+    def headers(name):
+        return {'Authorization': f'Bearer {tokens[name]}'}
+
+    scenario.step('register alice', 'register', register('alice'))
+    scenario.step('register bob', 'register', register('bob'))
+    scenario.step('register carol', 'register', register('carol'))
+    scenario.step('login', 'login', lambda: c.post('/api/auth/login', json={
+        'email': 'alice', 'password': 'budget-password'}))
+    scenario.step('reset password', 'reset_password', lambda: c.post('/api/auth/reset-password', json={
+        'email': 'bob@budget.local'}))
+    scenario.step('validate token', 'validate_token', lambda: c.get('/api/auth/validate', headers=headers('alice')))
+    scenario.step('submit score', 'submit_score', lambda: c.post('/api/scores', json={
+        'score': 900, 'time': 42, 'difficulty': 'easy'}, headers=headers('alice')))
+    scenario.step('leaderboard (cold)', 'get_leaderboard',
+                  lambda: c.get('/api/scores?difficulty=easy&limit=10', headers=headers('alice')))
+    scenario.step('leaderboard (cached)', 'get_leaderboard',
+                  lambda: c.get('/api/scores?difficulty=easy&limit=10', headers=headers('bob')))
+    scenario.step('leaderboard (all)', 'get_leaderboard',
+                  lambda: c.get('/api/scores?difficulty=all&limit=10', headers=headers('alice')))
+    scenario.step('profile', 'get_profile', lambda: c.get('/api/user/profile', headers=headers('alice')))
+    scenario.step('achievements', 'get_user_achievements',
+                  lambda: c.get('/api/user/achievements', headers=headers('alice')))
+    scenario.step('unlock achievement', 'unlock_achievement', lambda: c.post(
+        '/api/user/achievements', json={'achievement_id': 'first_game'}, headers=headers('alice')))
+    scenario.step('match history', 'get_match_history', lambda: c.get('/api/matches/history', headers=headers('alice')))
+    scenario.step('search users', 'search_users', lambda: c.get('/api/users/search?query=bo', headers=headers('alice')))
+    scenario.step('friend request', 'send_friend_request', lambda: c.post(
+        '/api/friends/request', json={'target_user_id': 2}, headers=headers('alice')))
+    scenario.step('friend requests', 'get_friend_requests', lambda: c.get('/api/friends/requests', headers=headers('bob')))
+    scenario.step('accept friend', 'respond_to_friend_request', lambda: c.post(
+        '/api/friends/respond', json={'friendship_id': 1, 'action': 'accept'}, headers=headers('bob')))
+    scenario.step('friend request (carol)', 'send_friend_request', lambda: c.post(
+        '/api/friends/request', json={'target_user_id': 1}, headers=headers('carol')))
+    scenario.step('decline friend', 'respond_to_friend_request', lambda: c.post(
+        '/api/friends/respond', json={'friendship_id': 2, 'action': 'decline'}, headers=headers('alice')))
+    scenario.step('friends', 'get_friends', lambda: c.get('/api/friends', headers=headers('alice')))
+    save = {'gameMode': 'classic', 'difficulty': 3, 'placedPiecesIds': [0, 1], 'availablePiecesIds': [2, 3]}
+    scenario.step('save (insert)', 'submit_save', lambda: c.post('/api/save-game', json=save, headers=headers('alice')))
+    scenario.step('save (update)', 'submit_save', lambda: c.post('/api/save-game', json=save, headers=headers('alice')))
+    scenario.step('load save', 'load_save',
+                  lambda: c.get('/api/load-save?gameMode=classic&difficulty=3', headers=headers('alice')))
+    scenario.step('list saves', 'load_save', lambda: c.get('/api/load-save', headers=headers('alice')))
+    scenario.step('delete save', 'delete_save',
+                  lambda: c.delete('/api/delete-save?gameMode=classic&difficulty=3', headers=headers('alice')))
+
+    alice = server.socketio.test_client(server.app, flask_test_client=c)
+    bob = server.socketio.test_client(server.app, flask_test_client=c)
+    scenario.step('authenticate alice', 'authenticate', lambda: alice.emit('authenticate', {'token': tokens['alice']}))
+    scenario.step('authenticate bob', 'authenticate', lambda: bob.emit('authenticate', {'token': tokens['bob']}))
+    scenario.step('invite', 'invite_to_match', lambda: alice.emit('invite_to_match', {
+        'opponent_id': 2, 'difficulty': 'easy', 'image_source': 'assets/images/puzzle1.jpg'}))
+    scenario.step('accept invite', 'respond_to_invite',
+                  lambda: bob.emit('respond_to_invite', {'match_id': 1, 'response': 'accepted'}))
+    for i in range(3):
+        scenario.step(f'progress update {i + 1}', 'player_progress_update',
+                      lambda: alice.emit('player_progress_update', {'match_id': 1, 'progress': 30.0}))
+    scenario.step('finish', 'player_finished', lambda: bob.emit('player_finished', {'match_id': 1, 'time_ms': 61000}))
+    scenario.step('invite (declined)', 'invite_to_match', lambda: bob.emit('invite_to_match', {
+        'opponent_id': 1, 'difficulty': 'hard', 'image_source': 'assets/images/puzzle1.jpg'}))
+    scenario.step('decline invite', 'respond_to_invite',
+                  lambda: alice.emit('respond_to_invite', {'match_id': 2, 'response': 'declined'}))
+
+    # 两名没有对战记录的玩家技能分相同，第二人加入时立即配对
+    scenario.step('register dave', 'register', register('dave'))
+    carol = server.socketio.test_client(server.app, flask_test_client=c)
+    dave = server.socketio.test_client(server.app, flask_test_client=c)
+    scenario.step('authenticate carol', 'authenticate', lambda: carol.emit('authenticate', {'token': tokens['carol']}))
+    scenario.step('authenticate dave', 'authenticate', lambda: dave.emit('authenticate', {'token': tokens['dave']}))
+    scenario.step('matchmaking (queued)', 'join_matchmaking', lambda: carol.emit('join_matchmaking', {
+        'difficulty': 'easy', 'image_source': 'assets/images/puzzle1.jpg'}))
+    scenario.step('matchmaking (paired)', 'join_matchmaking', lambda: dave.emit('join_matchmaking', {
+        'difficulty': 'easy', 'image_source': 'assets/images/puzzle1.jpg'}))
+    scenario.step('spectate', 'spectate_match', lambda: alice.emit('spectate_match', {'match_id': 3}))
+    scenario.step('progress (spectated)', 'player_progress_update',
+                  lambda: carol.emit('player_progress_update', {'match_id': 3, 'progress': 40.0}))
+    scenario.step('leave spectate', 'leave_spectate', lambda: alice.emit('leave_spectate', {}))
+    scenario.step('spectate again', 'spectate_match', lambda: bob.emit('spectate_match', {'match_id': 3}))
+    scenario.step('finish (matchmade)', 'player_finished',
+                  lambda: dave.emit('player_finished', {'match_id': 3, 'time_ms': 58000}))
+
+    scenario.step('match replay', 'get_match_replay', lambda: c.get('/api/matches/3/replay', headers=headers('bob')))
+    scenario.step('rating ladder', 'get_rating_ladder',
+                  lambda: c.get('/api/ratings/ladder?limit=10', headers=headers('alice')))
+    scenario.step('user rating', 'get_user_rating', lambda: c.get('/api/user/rating', headers=headers('dave')))
+    scenario.step('slice puzzle', 'slice_puzzle',
+                  lambda: c.get('/api/puzzles/slice?image=assets/images/1.jpg&grid_size=3&seed=1', headers=headers('dave')))
+    scenario.step('puzzle cache file', 'get_puzzle_cache_file',
+                  lambda: c.get(f'/api/puzzles/cache/{"0" * 64}/pieces.json'))
+
+    for client in (alice, bob, carol, dave):
+        client.disconnect()
+    return scenario.results
+
+
+def format_report(results: List[Dict]) -> str:
+    lines = [f"{'step':<26}{'trace':<28}{'queries':>8}{'budget':>8}  result"]
+    for row in results:
+        queries = '-' if row['queries'] is None else row['queries']
+        budget = '-' if row['budget'] is None else row['budget']
+        verdict = 'ok' if row['ok'] else 'OVER BUDGET' if row['queries'] is not None else 'NO TRACE'
+        lines.append(f"{row['step']:<26}{row['trace']:<28}{queries:>8}{budget:>8}  {verdict}")
+        if not row['ok']:
+            for sql in row['fingerprints']:
+                lines.append(f"    {sql[:140]}")
+    return '\n'.join(lines)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='Check per-endpoint database round-trip budgets')
+    parser.add_argument('--output', help='write results JSON to this file')
+    args = parser.parse_args()
+
+    results = run_scenario()
+    print(format_report(results))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    sys.exit(0 if all(row['ok'] for row in results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,31 @@
 用于批量运行和报告测试结果
 """
 
+import io
+import json
+import shutil
 import subprocess
 import sys
 import os
+import tarfile
+import tempfile
 from datetime import datetime
-from typing import Dict
+from typing import Dict, List
+
+# 基准回归判定：基线版本（默认 HEAD）和当前工作区在同一次调用中交替运行 BENCH_RUNS 对进程。
+# 同一进程内的采样共享同一次导入和内存布局，互不独立，因此以进程为单位：每个进程取最快的采样
+# （机器的慢速时段只会让耗时变长），两边各取最快的进程比较；
+# 变慢幅度必须同时超过阈值和两边最快的两个进程之间的差距（进程间波动）才算回归
+BENCH_REGRESSION_THRESHOLD = 0.10
+BENCH_RUNS = 6
+BENCH_REPEAT = 15
+
+def _fastest_gap(runs: List[float]) -> float:
+    """最快的两个进程之间的相对差距"""
+    if len(runs) < 2:
+        return 0.0
+    first, second = sorted(runs)[:2]
+    return second / first - 1 if first > 0 else 0.0
 
 class TestRunner:
     """测试运行器"""
@@ -138,6 +158,143 @@ class TestRunner:
 
         return results
 
+    def run_benchmarks(self, baseline_ref: str = 'HEAD', runs: int = BENCH_RUNS) -> Dict:
+        """在同一次调用中交替测量基线版本和当前工作区的代码，比较两者的进程中位数"""
+        print(f"Running benchmarks against {baseline_ref}...")
+
+        baseline_root = tempfile.mkdtemp(prefix='bench-baseline-')
+        try:
+            archive = subprocess.run(
+                ['git', '-C', self.project_root, 'archive', '--format=tar', baseline_ref],
+                capture_output=True,
+                timeout=120
+            )
+            if archive.returncode != 0:
+                return {'success': False, 'error': archive.stderr.decode(errors='replace'), 'results': {}}
+            with tarfile.open(fileobj=io.BytesIO(archive.stdout)) as tar:
+                tar.extractall(baseline_root)
+
+            trees = {'baseline': baseline_root, 'current': self.project_root}
+            best = {'baseline': {}, 'current': {}}
+            for i in range(runs):
+                # ABBA 顺序，机器负载的缓慢漂移对两边的影响相同
+                order = ('baseline', 'current') if i % 2 == 0 else ('current', 'baseline')
+                for side in order:
+                    run = self._run_benchmark_process(trees[side])
+                    if 'error' in run:
+                        return {'success': False, 'error': f"{side}: {run['error']}", 'results': {}}
+                    for name, row in run['benchmarks'].items():
+                        best[side].setdefault(name, []).append(row['best'])
+        except subprocess.TimeoutExpired:
+            return {'success': False, 'error': 'Benchmark execution timed out', 'results': {}}
+        finally:
+            shutil.rmtree(baseline_root, ignore_errors=True)
+
+        results = self.compare_benchmarks(best['baseline'], best['current'])
+        regressions = [name for name, row in results.items() if row['regression']]
+        return {
+            'success': not regressions,
+            'error': f"Regressions: {', '.join(regressions)}" if regressions else '',
+            'results': results,
+            'baseline_ref': baseline_ref,
+            'runs': runs,
+        }
+
+    def _run_benchmark_process(self, tree: str) -> Dict:
+        """用当前版本的基准脚本在一个新进程中测量 tree 下的代码"""
+        fd, output_file = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            result = subprocess.run(
+                [sys.executable, os.path.join(self.project_root, 'scripts', 'benchmarks.py'),
+                 '--project-root', tree, '--repeat', str(BENCH_REPEAT), '--output', output_file],
+                capture_output=True,
+                text=True,
+                timeout=600
+            )
+            if result.returncode != 0:
+                return {'error': result.stderr}
+            with open(output_file, encoding='utf-8') as f:
+                return json.load(f)
+        finally:
+            os.remove(output_file)
+
+    def run_query_budgets(self) -> Dict:
+        """检查每个接口/事件的数据库往返次数是否超出预算"""
+        print("Running query budget checks...")
+
+        fd, output_file = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            result = subprocess.run(
+                [sys.executable, os.path.join(self.project_root, 'scripts', 'query_budget.py'),
+                 '--output', output_file],
+                capture_output=True,
+                text=True,
+                timeout=300
+            )
+            try:
+                with open(output_file, encoding='utf-8') as f:
+                    rows = json.load(f)
+            except (OSError, ValueError):
+                rows = []
+        except subprocess.TimeoutExpired:
+            return {'success': False, 'error': 'Query budget check timed out', 'results': []}
+        finally:
+            os.remove(output_file)
+
+        violations = [row['step'] for row in rows if not row['ok']]
+        error = f"Over budget: {', '.join(violations)}" if violations else ''
+        if result.returncode != 0 and not rows:
+            error = result.stderr
+        return {'success': result.returncode == 0, 'error': error, 'results': rows}
+
+    def run_query_plans(self) -> Dict:
+        """在测试数据库上检查 server.py 所有查询的执行计划（MySQL 不可用时跳过）"""
+        print("Running query plan checks...")
+
+        try:
+            result = subprocess.run(
+                [sys.executable, os.path.join(self.project_root, 'scripts', 'explain_queries.py')],
+                capture_output=True,
+                text=True,
+                timeout=900
+            )
+        except subprocess.TimeoutExpired:
+            return {'success': False, 'skipped': False, 'error': 'Query plan check timed out', 'output': ''}
+
+        if result.returncode == 2:
+            return {'success': True, 'skipped': True, 'error': result.stdout.strip(), 'output': ''}
+        return {
+            'success': result.returncode == 0,
+            'skipped': False,
+            'error': result.stderr if result.returncode != 0 else '',
+            'output': result.stdout,
+        }
+
+    def compare_benchmarks(self, baseline: Dict[str, List[float]], current: Dict[str, List[float]]) -> Dict:
+        """逐项比较两边最快的进程，变慢超过阈值和进程间波动时视为回归"""
+        results = {}
+        for name, runs in current.items():
+            best = min(runs)
+            base = baseline.get(name)
+            if not base:
+                results[name] = {'best': best, 'baseline_best': None, 'change': None,
+                                 'noise': None, 'regression': False}
+                continue
+
+            base_best = min(base)
+            change = best / base_best - 1 if base_best else 0.0
+            noise = max(_fastest_gap(base), _fastest_gap(runs))
+            results[name] = {
+                'best': best,
+                'baseline_best': base_best,
+                'change': change,
+                'noise': noise,
+                'regression': change > max(BENCH_REGRESSION_THRESHOLD, noise),
+            }
+        return results
+
     def generate_report(self) -> str:
         """生成测试报告"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -180,6 +337,64 @@ class TestRunner:
                 if result['error'] and 'not found' not in result['error']:
                     report += f"错误信息:\n{result['error']}\n\n"
 
+        # 性能基准结果
+        if 'benchmarks' in self.test_results:
+            bench_result = self.test_results['benchmarks']
+            status = "✅ 无回归" if bench_result['success'] else "❌ 存在性能回归"
+            report += f"## 性能基准: {status}\n\n"
+            if 'baseline_ref' in bench_result:
+                report += (f"基线: {bench_result['baseline_ref']}，两边各 {bench_result['runs']} 个进程交替运行，"
+                           f"比较各自最快的进程\n\n")
+
+            if bench_result['results']:
+                report += "| 基准 | 当前 (us) | 基线 (us) | 变化 | 进程间波动 | 结论 |\n"
+                report += "|------|-----------|-----------|------|-----------|------|\n"
+                for name, row in bench_result['results'].items():
+                    if row['baseline_best'] is None:
+                        report += f"| {name} | {row['best']:.2f} | - | - | - | 新增 |\n"
+                        continue
+                    verdict = "回归" if row['regression'] else "正常"
+                    report += (f"| {name} | {row['best']:.2f} | {row['baseline_best']:.2f} | "
+                               f"{row['change']:+.1%} | {row['noise']:.1%} | {verdict} |\n")
+                report += "\n"
+
+            if bench_result['error']:
+                report += f"错误信息:\n{bench_result['error']}\n\n"
+
+        # 数据库往返预算
+        if 'query_budgets' in self.test_results:
+            budget_result = self.test_results['query_budgets']
+            status = "✅ 未超出" if budget_result['success'] else "❌ 超出预算"
+            report += f"## 数据库往返预算: {status}\n\n"
+
+            if budget_result['results']:
+                report += "| 步骤 | 接口/事件 | 查询次数 | 预算 | 结论 |\n"
+                report += "|------|----------|---------|------|------|\n"
+                for row in budget_result['results']:
+                    queries = '-' if row['queries'] is None else row['queries']
+                    budget = '-' if row['budget'] is None else row['budget']
+                    verdict = "正常" if row['ok'] else "超出"
+                    report += f"| {row['step']} | {row['trace']} | {queries} | {budget} | {verdict} |\n"
+                report += "\n"
+
+            if budget_result['error']:
+                report += f"错误信息:\n{budget_result['error']}\n\n"
+
+        # 查询计划检查
+        if 'query_plans' in self.test_results:
+            plan_result = self.test_results['query_plans']
+            if plan_result['skipped']:
+                status = "⏭️ 跳过"
+            else:
+                status = "✅ 通过" if plan_result['success'] else "❌ 存在全表扫描/filesort/临时表"
+            report += f"## 查询计划检查: {status}\n\n"
+
+            if plan_result['output']:
+                report += f"```\n{plan_result['output']}```\n\n"
+
+            if plan_result['error']:
+                report += f"错误信息:\n{plan_result['error']}\n\n"
+
         return report
 
     def run_all_tests(self) -> Dict:
@@ -195,18 +410,39 @@ class TestRunner:
         # 运行AI脚本
         self.test_results['ai_scripts'] = self.run_ai_scripts()
 
+        # 检查数据库往返预算
+        self.test_results['query_budgets'] = self.run_query_budgets()
+
+        # 检查查询执行计划
+        self.test_results['query_plans'] = self.run_query_plans()
+
         print("\n=== 测试执行完成 ===")
 
         return self.test_results
 
 def main():
     """主函数"""
-    if len(sys.argv) > 1:
-        project_root = sys.argv[1]
+    # --bench: 只运行微基准测试，与 --baseline-ref（默认 HEAD）比较，出现显著的性能回归时以非零码退出
+    args = sys.argv[1:]
+    bench_mode = '--bench' in args
+    baseline_ref = 'HEAD'
+    for arg in args:
+        if arg.startswith('--baseline-ref='):
+            baseline_ref = arg.split('=', 1)[1]
+    args = [arg for arg in args if arg != '--bench' and not arg.startswith('--baseline-ref=')]
+
+    if args:
+        project_root = args[0]
     else:
         project_root = os.getcwd()
 
     runner = TestRunner(project_root)
+    if bench_mode:
+        runner.test_results['benchmarks'] = runner.run_benchmarks(baseline_ref)
+        report = runner.generate_report()
+        print(report)
+        sys.exit(0 if runner.test_results['benchmarks']['success'] else 1)
+
     results = runner.run_all_tests()
 
     # 生成并打印报告
@@ -223,8 +459,10 @@ def main():
     # 返回适当的退出码
     flutter_success = results.get('flutter', {}).get('success', False)
     python_success = results.get('python', {}).get('success', False)
+    budget_success = results.get('query_budgets', {}).get('success', False)
+    plan_success = results.get('query_plans', {}).get('success', False)
 
-    if flutter_success and python_success:
+    if flutter_success and python_success and budget_success and plan_success:
         sys.exit(0)
     else:
         sys.exit(1)
@@ -1,16 +1,41 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, has_request_context, g, send_file
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import json
+import math
 import time
-import hashlib
 import datetime
 from decimal import Decimal
 from functools import wraps
 import jwt
-import mysql.connector
-from mysql.connector import Error
+import os
 import re
+import atexit
+import random
+from backend.password_hasher import PasswordHasher, HasherBusyError
+from backend.rate_limiter import RateLimiter, RatePolicy
+from backend.admission import (AdmissionController, OverloadedError,
+                               PRIORITY_CRITICAL, PRIORITY_NORMAL, PRIORITY_LOW)
+from backend.singleflight import SingleFlight, make_key
+from backend.etag import ResourceVersions
+from backend.leaderboard_cache import LeaderboardCache
+from backend.db_router import DatabaseRouter
+from backend.storage import MySQLStorage
+from backend.memory_storage import MemoryStorage
+from backend.async_db import AsyncDatabase
+from backend.metrics import MetricsRegistry
+from backend.tracing import Tracer, fingerprint, format_waterfall
+from backend.profiler import SamplingProfiler, ProfilerBusyError
+from backend.score_rollup import ScoreRollup
+from backend.match_sweeper import MatchSweeper
+from backend.matchmaker import Matchmaker
+from backend.ratings import RatingLadder, rating_writes, rebuild_ladder
+from backend.spectators import SpectatorHub, SpectatorLimitError, spectator_room
+from backend.event_log import EventLog, EVENT_PROGRESS, EVENT_FINISH, EVENT_VALUE_MAX
+from backend.puzzle_layout import (new_layout_seed, verify_layout, grid_size as difficulty_grid_size,
+                                   resolve_image, DEFAULT_PUZZLE_IMAGE)
+from backend.puzzle_slicer import (PuzzleSlicer, SliceCache, SlicerUnavailableError, InvalidImageError,
+                                   SQUARE_IMAGE, PIECES_JSON, CACHE_FILES)
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
@@ -29,49 +54,327 @@ DB_CONFIG = {
     'charset': 'utf8mb4'
 }
 
-online_users = {}  # 格式: { user_id: session_id }
-authenticated_sids = {} # 格式: { session_id: user_payload }
-# 数据库连接函数
+# 连接池配置：每个连接缓存最多 DB_STATEMENT_CACHE_SIZE 条服务端预处理语句
+DB_POOL_SIZE = 10
+DB_POOL_TIMEOUT = 5
+DB_STATEMENT_CACHE_SIZE = 64
+
+# 只读副本配置（与 DB_CONFIG 格式相同），为空时所有查询都走主库
+DB_REPLICAS = []
+DB_REPLICA_MAX_LAG_SECONDS = 2
+DB_HEALTH_CHECK_INTERVAL = 5
+# 用户写入后在该时间窗口内的读请求固定走主库
+DB_READ_YOUR_WRITES_SECONDS = 5
+
+db_router = DatabaseRouter(
+    DB_CONFIG,
+    DB_REPLICAS,
+    max_lag_seconds=DB_REPLICA_MAX_LAG_SECONDS,
+    health_interval=DB_HEALTH_CHECK_INTERVAL,
+    read_your_writes_window=DB_READ_YOUR_WRITES_SECONDS,
+    pool_options={
+        'size': DB_POOL_SIZE,
+        'timeout': DB_POOL_TIMEOUT,
+        'statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+    }
+)
+
+# 存储后端：mysql（默认）或 memory（无需数据库，用于基准测试和压测）
+STORAGE_BACKEND = os.environ.get('JIGSAW_STORAGE_BACKEND', 'mysql')
+
+if STORAGE_BACKEND == 'memory':
+    storage = MemoryStorage()
+else:
+    storage = MySQLStorage(db_router)
+
+# 密码哈希配置（scrypt 在独立线程池中执行，成本参数按目标延迟自动校准）
+PASSWORD_HASH_WORKERS = 4
+PASSWORD_HASH_MAX_QUEUE = 32
+PASSWORD_HASH_TARGET_MS = 100
+
+password_hasher = PasswordHasher(
+    max_workers=PASSWORD_HASH_WORKERS,
+    max_queue=PASSWORD_HASH_MAX_QUEUE,
+    target_ms=PASSWORD_HASH_TARGET_MS
+)
+
+# 限流策略：按接口/事件配置，超限请求在访问数据库之前被拒绝
+RATE_LIMIT_POLICIES = {
+    'auth_login': RatePolicy(limit=10, window=60, scopes=('ip',)),
+    'auth_register': RatePolicy(limit=5, window=60, scopes=('ip',)),
+    'users_search': RatePolicy(limit=30, window=60, scopes=('user', 'ip')),
+    'invite_to_match': RatePolicy(limit=10, window=60, scopes=('user', 'sid')),
+    'player_progress_update': RatePolicy(limit=20, window=1, scopes=('sid',)),
+    'join_matchmaking': RatePolicy(limit=10, window=60, scopes=('user', 'sid')),
+    'spectate_match': RatePolicy(limit=20, window=60, scopes=('sid',)),
+    'puzzle_slice': RatePolicy(limit=30, window=60, scopes=('user', 'ip')),
+}
 
-def get_db_connection():
-    """获取数据库连接"""
-    try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
-    except Error as e:
-        print(f"数据库连接失败: {e}")
-        return None
+rate_limiter = RateLimiter(RATE_LIMIT_POLICIES)
 
-def execute_query(query, params=None, fetch=False):
-    """执行数据库查询"""
-    connection = get_db_connection()
-    if not connection:
-        return None
+# 本机压测时可通过 JIGSAW_RATE_LIMITS=off 关闭限流（所有虚拟用户共用同一 IP）
+RATE_LIMIT_ENABLED = os.environ.get('JIGSAW_RATE_LIMITS', 'on') != 'off'
 
-    try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(query, params or ())
+# 准入控制：数据库变慢时优先削减排行榜/历史/搜索等低优先级请求，保护对战事件
+ADMISSION_MAX_INFLIGHT = 32
+
+admission_controller = AdmissionController(max_inflight=ADMISSION_MAX_INFLIGHT)
+
+# 读接口请求合并：相同参数的并发请求共享同一次数据库查询
+read_flights = SingleFlight()
+
+# 按用户的资源版本号，写操作递增后读接口的 ETag 随之变化
+resource_versions = ResourceVersions()
+
+# 排行榜响应缓存（按 difficulty + limit 缓存序列化后的响应体）
+LEADERBOARD_CACHE_ENTRIES = 64
+LEADERBOARD_CACHE_BYTES = 4 * 1024 * 1024
+
+leaderboard_cache = LeaderboardCache(max_entries=LEADERBOARD_CACHE_ENTRIES,
+                                     max_bytes=LEADERBOARD_CACHE_BYTES)
+# 排行榜单次最多返回的条数（同时是归档时每个难度保留在 scores 中的前 N 名）
+LEADERBOARD_MAX_LIMIT = 100
 
-        if fetch:
-            result = cursor.fetchall() if fetch == 'all' else cursor.fetchone()
+SCORE_DIFFICULTIES = ('easy', 'medium', 'hard', 'master')
+
+# 成绩汇总：后台定期把新成绩累加到每日汇总表，并把超过保留期的成绩移到归档表
+SCORE_ROLLUP_INTERVAL = 60
+SCORE_ROLLUP_BATCH_SIZE = 5000
+SCORE_RETENTION_DAYS = 90
+
+score_rollup = ScoreRollup(storage, SCORE_DIFFICULTIES,
+                           interval=SCORE_ROLLUP_INTERVAL,
+                           batch_size=SCORE_ROLLUP_BATCH_SIZE,
+                           retention_days=SCORE_RETENTION_DAYS,
+                           keep_top=LEADERBOARD_MAX_LIMIT)
+
+online_users = {}  # 格式: { user_id: session_id }
+authenticated_sids = {} # 格式: { session_id: user_payload }
+active_matches = {}  # 格式: { match_id: (challenger_id, opponent_id) }，进行中的对战，进度转发无需查库
+
+# 对战等级分：内存天梯提供分数和名次，启动时从 matches 表重放重建
+RATING_REBUILD_BATCH_SIZE = 5000
+RATING_LADDER_MAX_LIMIT = 100
+
+rating_ladder = RatingLadder()
+
+def settle_rating(match):
+    """辅助函数：按对战结果更新内存天梯，返回 (变化列表, 需要执行的写入语句)"""
+    winner_id = match['winner_id']
+    if winner_id is None:
+        return [], []
+    loser_id = match['opponent_id'] if winner_id == match['challenger_id'] else match['challenger_id']
+    changes = rating_ladder.record(match['id'], winner_id, loser_id)
+    return changes, rating_writes(match['id'], changes)
+
+def rating_payload(changes):
+    """辅助函数：match_over 中附带的等级分变化"""
+    return {str(user_id): {'before': before, 'after': after} for user_id, before, after, _ in changes}
+
+# 观战：观众按固定间隔收到双方进度的合并快照，广播次数与玩家进度事件频率无关
+SPECTATOR_TICK_INTERVAL = 0.5
+SPECTATOR_MAX_PER_MATCH = 5000
+
+spectator_hub = SpectatorHub(lambda event, data, room: socketio.emit(event, data, room=room),
+                             lambda room: socketio.close_room(room),
+                             tick_interval=SPECTATOR_TICK_INTERVAL,
+                             max_spectators=SPECTATOR_MAX_PER_MATCH)
+
+# 对战过期清理：邀请超时取消；进行中的对战长时间无进度或玩家掉线超过宽限期后判负 / 取消
+MATCH_INVITE_TTL = 120
+MATCH_IDLE_TTL = 600
+MATCH_DISCONNECT_GRACE = 60
+MATCH_SWEEP_BATCH_SIZE = 200
+
+def notify_expired_matches(expired):
+    """辅助函数：通知被清理的对战双方"""
+    finished = []
+    for item in expired:
+        match_id = item['id']
+        active_matches.pop(match_id, None)
+        rooms = (str(item['challenger_id']), str(item['opponent_id']))
+        if item['outcome'] == 'expired':
+            payload, event = {'match_id': match_id}, 'match_invite_expired'
+        elif item['outcome'] == 'forfeit':
+            if item['match'] is None:
+                # 读回结果失败：不结算等级分（重启时重放对战会补上），客户端重新连接后从对战历史得到结果
+                print(f"对战清理: 无法读取对战 {match_id} 的判负结果，跳过等级分结算和通知")
+                continue
+            # 清理器已确认判负由本次 UPDATE 完成，winner_id 与数据库一致
+            changes, writes = settle_rating(item['match'])
+            for query, params in writes:
+                execute_query(query, params)
+            payload = {'result': json_serializable(item['match']), 'reason': 'forfeit',
+                       'ratings': rating_payload(changes)}
+            event = 'match_over'
+            finished.extend((item['challenger_id'], item['opponent_id']))
         else:
-            connection.commit()
-            result = cursor.lastrowid
+            payload, event = {'match_id': match_id, 'reason': 'abandoned'}, 'match_cancelled'
+        for room in rooms:
+            socketio.emit(event, payload, room=room)
+        spectator_hub.end(match_id, payload)
+    if finished:
+        resource_versions.bump(finished, 'match_history', 'achievements')
+    print(f"对战清理: 处理 {len(expired)} 场过期对战")
+
+match_sweeper = MatchSweeper(storage, lambda user_id: user_id in online_users, notify_expired_matches,
+                             pending_ttl=MATCH_INVITE_TTL,
+                             idle_ttl=MATCH_IDLE_TTL,
+                             disconnect_grace=MATCH_DISCONNECT_GRACE,
+                             batch_size=MATCH_SWEEP_BATCH_SIZE)
+
+# 匹配队列：等级分按桶划分，等待越久可接受的等级分差距越大
+MATCHMAKING_BUCKET_WIDTH = 50
+MATCHMAKING_BASE_TOLERANCE = 1       # 初始可匹配的相邻桶数
+MATCHMAKING_WIDEN_SECONDS = 5        # 每等待这么久多接受一个相邻桶
+MATCHMAKING_MAX_TOLERANCE = 20
+MATCHMAKING_TICK_INTERVAL = 1.0
+
+def on_matchmaking_pair(first, second):
+    """辅助函数：后台线程配对成功后创建对战"""
+    async_db.spawn(start_matchmade_match, first, second)
+
+matchmaker = Matchmaker(on_matchmaking_pair,
+                        bucket_width=MATCHMAKING_BUCKET_WIDTH,
+                        base_tolerance=MATCHMAKING_BASE_TOLERANCE,
+                        widen_seconds=MATCHMAKING_WIDEN_SECONDS,
+                        max_tolerance=MATCHMAKING_MAX_TOLERANCE,
+                        tick_interval=MATCHMAKING_TICK_INTERVAL)
+
+# 运行指标（/metrics，Prometheus 文本格式）
+metrics = MetricsRegistry()
+
+http_requests_total = metrics.counter(
+    'jigsaw_http_requests_total', 'HTTP requests by endpoint, method and status', ('endpoint', 'method', 'status'))
+http_request_duration = metrics.histogram(
+    'jigsaw_http_request_duration_seconds', 'HTTP request latency', ('endpoint', 'method'))
+socket_events_total = metrics.counter(
+    'jigsaw_socket_events_total', 'SocketIO events by event name and outcome', ('event', 'outcome'))
+socket_event_duration = metrics.histogram(
+    'jigsaw_socket_event_duration_seconds', 'SocketIO event handler latency', ('event',))
+db_queries_total = metrics.counter(
+    'jigsaw_db_queries_total', 'Database queries by kind (read/write) and path (sync/async)', ('kind', 'path'))
+db_query_duration = metrics.histogram(
+    'jigsaw_db_query_duration_seconds', 'Database query latency', ('kind', 'path'))
+
+def db_pool_usage():
+    """辅助函数：各数据库节点连接池的使用情况（供 /metrics 采集）"""
+    status = storage.status()
+    usage = {}
+    for node in [status.get('primary')] + status.get('replicas', []):
+        if node:
+            for state in ('size', 'in_use', 'idle'):
+                usage[(node['name'], state)] = node['pool'][state]
+    return usage
+
+metrics.gauge('jigsaw_online_users', 'Users with an authenticated socket', lambda: len(online_users))
+metrics.gauge('jigsaw_authenticated_sids', 'Authenticated socket sessions', lambda: len(authenticated_sids))
+metrics.gauge('jigsaw_active_matches', 'Matches in progress cached for progress relaying', lambda: len(active_matches))
+metrics.gauge('jigsaw_swept_matches_tracked', 'Pending and in-progress matches awaiting expiry', lambda: len(match_sweeper))
+metrics.gauge('jigsaw_matchmaking_queued', 'Players waiting in the matchmaking queue', lambda: len(matchmaker))
+metrics.gauge('jigsaw_spectators', 'Sockets currently spectating a match', lambda: spectator_hub.status()['spectators'])
+metrics.gauge('jigsaw_db_pool_connections', 'Connection pool usage by node and state',
+              db_pool_usage, ('node', 'state'))
+metrics.gauge('jigsaw_admission_inflight', 'Requests currently admitted by the admission controller',
+              lambda: admission_controller.snapshot()['inflight'])
+
+# 请求追踪：每个请求/事件一个 trace，每次数据库查询一个 span
+TRACE_BUFFER_SIZE = 500
+TRACE_SLOW_MS = 200
+# 设置后超过 TRACE_SLOW_MS 的 trace 追加写入该 JSONL 文件
+TRACE_EXPORT_PATH = os.environ.get('JIGSAW_TRACE_FILE')
+
+tracer = Tracer(buffer_size=TRACE_BUFFER_SIZE, slow_ms=TRACE_SLOW_MS, export_path=TRACE_EXPORT_PATH)
+
+# 按需采样分析器：运行时通过 /api/profiler 开启，结果写入 PROFILE_OUTPUT_DIR
+PROFILE_OUTPUT_DIR = os.environ.get('JIGSAW_PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PROFILER_MAX_OVERHEAD = 0.02
+PROFILER_MAX_DURATION = 600
+
+profiler = SamplingProfiler(PROFILE_OUTPUT_DIR, max_overhead=PROFILER_MAX_OVERHEAD,
+                            max_duration=PROFILER_MAX_DURATION)
+
+# 对战事件日志：进度/完成事件先进内存缓存，后台批量追加到 EVENT_LOG_DIR 下的段文件
+EVENT_LOG_DIR = os.environ.get('JIGSAW_EVENT_LOG_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'event_log'))
+EVENT_LOG_FLUSH_INTERVAL = 1.0
+EVENT_LOG_MAX_BUFFER_BYTES = 1024 * 1024
+EVENT_LOG_SEGMENT_BYTES = 64 * 1024 * 1024
+
+event_log = EventLog(EVENT_LOG_DIR, flush_interval=EVENT_LOG_FLUSH_INTERVAL,
+                     max_buffer_bytes=EVENT_LOG_MAX_BUFFER_BYTES,
+                     segment_bytes=EVENT_LOG_SEGMENT_BYTES)
+
+# 服务端拼图切割：正方形图片、图集和拼图块元数据按内容散列缓存在 PUZZLE_CACHE_DIR，超过上限按 LRU 淘汰
+PUZZLE_CACHE_DIR = os.environ.get('JIGSAW_PUZZLE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'puzzle_cache'))
+PUZZLE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+PUZZLE_ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'images')
+PUZZLE_MAX_SIDE = 1024
+PUZZLE_MAX_GRID_SIZE = 10
+PUZZLE_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+# 未指定种子的单人拼图从固定的种子池中选取，部署时用 scripts/precompute_puzzles.py 预生成后基本都能命中缓存
+PUZZLE_PRESET_SEEDS = 16
+PUZZLE_PRESET_GRID_SIZES = (3, 4, 5)
+# 缓存文件按内容寻址，同一 URL 的内容永远不变
+PUZZLE_CACHE_MAX_AGE = 365 * 24 * 3600
+
+puzzle_slicer = PuzzleSlicer(SliceCache(PUZZLE_CACHE_DIR, max_bytes=PUZZLE_CACHE_MAX_BYTES), max_side=PUZZLE_MAX_SIDE)
+
+def record_db_query(query, fetch, seconds, result, path):
+    """辅助函数：记录一次数据库查询的指标和追踪 span"""
+    kind = 'read' if fetch in ('one', 'all') else 'write'
+    db_queries_total.inc(kind, path)
+    db_query_duration.observe(seconds, kind, path)
+
+    if fetch == 'all':
+        rows = len(result) if result else 0
+    elif fetch == 'rowcount':
+        rows = result
+    elif fetch:
+        rows = 1 if result else 0
+    else:
+        rows = None
+    tracer.add_span('db', seconds, sql=fingerprint(query), rows=rows, path=path)
 
-        return result
-    except Error as e:
-        print(f"查询执行失败: {e}")
-        if connection:
-            connection.rollback()
+# 数据库访问函数
+
+def current_user_id():
+    """当前请求（HTTP 或 SocketIO 事件）的用户ID，用于读己之写路由"""
+    if not has_request_context():
         return None
+    user = getattr(request, 'user', None)
+    return user.get('user_id') if user else None
+
+def execute_query(query, params=None, fetch=False, pin_key=None, primary=False):
+    """执行数据库查询；pin_key 默认取当前请求的用户（异步回退路径没有请求上下文，由调用方传入），primary=True 时读主库"""
+    if pin_key is None:
+        pin_key = current_user_id()
+    start = time.perf_counter()
+    result = None
+    try:
+        with admission_controller.track_db():
+            result = storage.execute_query(query, params, fetch, pin_key=pin_key, primary=primary)
+        return result
     finally:
-        if connection and connection.is_connected():
-            cursor.close()
-            connection.close()
+        record_db_query(query, fetch, time.perf_counter() - start, result, 'sync')
+
+# 异步数据库访问层：供 SocketIO 事件和异步路由使用
+ASYNC_DB_POOL_SIZE = 10
+
+async_db = AsyncDatabase(DB_CONFIG, maxsize=ASYNC_DB_POOL_SIZE,
+                         sync_fallback=execute_query, track_db=admission_controller.track_db,
+                         use_pool=STORAGE_BACKEND == 'mysql',
+                         observe=lambda query, fetch, seconds, result: record_db_query(
+                             query, fetch, seconds, result, 'async'),
+                         on_spawn=tracer.hold,
+                         on_write=lambda pin_keys: [storage.note_write(key) for key in pin_keys])
 
 def hash_password(password):
     """密码哈希"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    return password_hasher.hash(password)
+
+def verify_password(password, password_hash):
+    """验证密码，返回 (是否匹配, 是否需要升级哈希)"""
+    return password_hasher.verify(password, password_hash)
 
 def json_serializable(data):
     """一个辅助函数，用于转换字典中非JSON序列化的类型"""
@@ -160,6 +463,20 @@ def token_required(f):
         return f(*args, **kwargs)
     
     return decorated
+
+# 运维接口（指标、追踪、准入状态、采样分析器）只允许本机访问
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+def local_only(f):
+    """运维接口只允许本机访问（监控采集端与服务同机部署）"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if request.remote_addr not in LOCAL_ADDRESSES:
+            return jsonify({'error': '仅允许本机访问'}), 403
+        return f(*args, **kwargs)
+
+    return decorated
+
 def authenticated_only(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -174,16 +491,121 @@ def authenticated_only(f):
         request.user = authenticated_sids[request.sid]
         return f(*args, **kwargs)
     return decorated
+
+def conditional_get(scope):
+    """条件请求装饰器：If-None-Match 命中当前版本时直接返回 304，不访问数据库"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            etag = resource_versions.etag(request.user['user_id'], scope, request.query_string)
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated
+    return decorator
+
+def rate_limited(policy_name):
+    """限流装饰器：HTTP 接口返回 429，SocketIO 事件直接丢弃"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if not RATE_LIMIT_ENABLED:
+                return f(*args, **kwargs)
+
+            user = getattr(request, 'user', None) or {}
+            sid = getattr(request, 'sid', None)
+            allowed, retry_after = rate_limiter.hit(policy_name, {
+                'ip': request.remote_addr,
+                'user': user.get('user_id'),
+                'sid': sid,
+            })
+            if allowed:
+                return f(*args, **kwargs)
+
+            if sid is not None:
+                return
+            return jsonify({'error': '请求过于频繁，请稍后再试'}), 429, {'Retry-After': str(retry_after)}
+        return decorated
+    return decorator
+
+def admission_controlled(priority):
+    """准入控制装饰器：过载时 HTTP 接口返回 503，SocketIO 事件返回错误消息"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            try:
+                with admission_controller.admit(priority):
+                    return f(*args, **kwargs)
+            except OverloadedError as e:
+                print(f"准入控制拒绝请求 {f.__name__}: {e.reason}")
+                if getattr(request, 'sid', None) is not None:
+                    emit('error', {'message': '服务器繁忙，请稍后重试'})
+                    return
+                return jsonify({'error': '服务器繁忙，请稍后重试'}), 503, {'Retry-After': '1'}
+        return decorated
+    return decorator
 # ===================================================================
 #                      WebSocket 实时事件处理
 # ===================================================================
 
+@app.before_request
+def start_request_timer():
+    """记录请求开始时间（请求指标）并开始追踪"""
+    g.profile = profiler.begin(request.endpoint or 'unmatched')
+    g.request_started = time.perf_counter()
+    g.trace = tracer.start(request.endpoint or 'unmatched', 'http', method=request.method, path=request.path)
+
+@app.after_request
+def record_request_metrics(response):
+    """记录请求次数和耗时"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        http_requests_total.inc(endpoint, request.method, str(response.status_code))
+        http_request_duration.observe(time.perf_counter() - started, endpoint, request.method)
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_trace(error=None):
+    """结束请求追踪和采样"""
+    tracer.finish(g.pop('trace', None), status=g.pop('response_status', 500))
+    profiler.end(g.pop('profile', None))
+
+def instrumented_event(f):
+    """SocketIO 事件指标和追踪装饰器：记录事件次数、处理耗时和数据库 span"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        event = getattr(request, 'event', {}).get('message', f.__name__)
+        start = time.perf_counter()
+        profile = profiler.begin(event)
+        trace = tracer.start(event, 'socket', sid=request.sid)
+        outcome = 'error'
+        try:
+            result = f(*args, **kwargs)
+            outcome = 'ok'
+            return result
+        finally:
+            socket_events_total.inc(event, outcome)
+            socket_event_duration.observe(time.perf_counter() - start, event)
+            tracer.finish(trace, outcome=outcome)
+            profiler.end(profile)
+    return decorated
+
 @socketio.on('connect')
 def handle_connect():
     """客户端连接成功"""
     print(f'客户端连接成功, sid: {request.sid}')
 
 @socketio.on('authenticate')
+@instrumented_event
+@admission_controlled(PRIORITY_NORMAL)
 def handle_authenticate(data):
     """客户端连接后发送token进行认证"""
     token = data.get('token')
@@ -193,9 +615,11 @@ def handle_authenticate(data):
         online_users[user_id] = request.sid
         authenticated_sids[request.sid] = payload
         join_room(str(user_id))  # 每个用户进入以自己ID命名的房间，方便定向通知
+        match_sweeper.player_returned(user_id)
         print(f"用户 {user_id} ({payload['username']}) 已认证上线, sid: {request.sid}")
         # 通知该用户的好友，他上线了
         friends = get_user_friends_list(user_id)
+        resource_versions.bump([friend['id'] for friend in friends], 'friends')
         for friend in friends:
             if friend['id'] in online_users:
                 emit('friend_status_update', {'user_id': user_id, 'status': 'online'}, room=str(friend['id']))
@@ -215,10 +639,14 @@ def handle_disconnect():
         # 从 online_users 也移除
         if user_id_to_notify in online_users:
             del online_users[user_id_to_notify]
+        match_sweeper.player_left(user_id_to_notify)
+        matchmaker.leave(user_id_to_notify)
+        spectator_hub.leave(request.sid)
 
         print(f"用户 {user_id_to_notify} ({disconnected_user_payload['username']}) 已下线")
         # 通知好友下线 (这部分逻辑可以保持)
         friends = get_user_friends_list(user_id_to_notify)
+        resource_versions.bump([friend['id'] for friend in friends], 'friends')
         for friend in friends:
             if friend['id'] in online_users:
                 emit('friend_status_update', {'user_id': user_id_to_notify, 'status': 'offline'}, room=str(friend['id']))
@@ -227,7 +655,10 @@ def handle_disconnect():
 
 
 @socketio.on('invite_to_match')
+@instrumented_event
 @authenticated_only  # <-- 使用新装饰器
+@rate_limited('invite_to_match')
+@admission_controlled(PRIORITY_CRITICAL)
 def handle_invite_to_match(data):
     """处理发起对战邀请"""
     challenger_id = request.user['user_id']
@@ -240,15 +671,26 @@ def handle_invite_to_match(data):
         emit('error', {'message': '邀请信息不完整'})
         return
 
+    # 数据库操作交给异步事件循环，当前处理线程立即返回
+    async_db.spawn(create_match_invite, request.sid, challenger_id, challenger_username,
+                   opponent_id, difficulty, image_source)
+
+async def create_match_invite(sid, challenger_id, challenger_username, opponent_id, difficulty, image_source):
+    """异步任务：创建比赛记录并通知对手"""
     # 1. 在数据库创建比赛记录
-    match_id = execute_query(
+    match_id = await async_db.execute_query(
         "INSERT INTO matches (challenger_id, opponent_id, difficulty, image_source, status) VALUES (%s, %s, %s, %s, 'pending')",
-        (challenger_id, opponent_id, difficulty, image_source)
+        (challenger_id, opponent_id, difficulty, image_source),
+        pin_keys=(challenger_id, opponent_id)
     )
+    if not match_id:
+        socketio.emit('error', {'message': '创建对战失败'}, room=sid)
+        return
 
     # 2. 如果对手在线，发送实时邀请通知
     if opponent_id in online_users:
-        emit('new_match_invite', {
+        match_sweeper.track_pending(match_id, challenger_id, opponent_id)
+        socketio.emit('new_match_invite', {
             'match_id': match_id,
             'challenger_id': challenger_id,
             'challenger_username': challenger_username,
@@ -258,63 +700,228 @@ def handle_invite_to_match(data):
     else:
         # 对手不在线，可以考虑后续实现离线消息系统
         print(f"邀请失败：用户 {opponent_id} 不在线")
-        emit('error', {'message': f'邀请失败，玩家不在线'})
+        socketio.emit('error', {'message': f'邀请失败，玩家不在线'}, room=sid)
+        # 邀请记录交给清理线程在下一轮取消
+        match_sweeper.track_pending(match_id, challenger_id, opponent_id, ttl=0)
+
+
+@socketio.on('join_matchmaking')
+@instrumented_event
+@authenticated_only
+@rate_limited('join_matchmaking')
+@admission_controlled(PRIORITY_CRITICAL)
+def handle_join_matchmaking(data):
+    """加入匹配队列，与等级分相近的玩家自动开始对战"""
+    difficulty = data.get('difficulty')
+    image_source = data.get('image_source')
+
+    if not all([difficulty, image_source]):
+        emit('error', {'message': '匹配信息不完整'})
+        return
+
+    async_db.spawn(enqueue_matchmaking, request.sid, request.user['user_id'], difficulty, image_source)
+
+async def enqueue_matchmaking(sid, user_id, difficulty, image_source):
+    """异步任务：按等级分加入匹配队列，能立即配对时直接开始对战"""
+    skill = rating_ladder.rating(user_id)
+
+    if user_id not in online_users:
+        return  # 已断开
+
+    socketio.emit('matchmaking_queued', {'difficulty': difficulty}, room=sid)
+    pair = matchmaker.join(user_id, difficulty, skill, {'image_source': image_source})
+    if pair:
+        await start_matchmade_match(*pair)
+
+async def start_matchmade_match(first, second):
+    """异步任务：为配对成功的两名玩家创建进行中的对战并通知双方（先排队的玩家作为挑战者）"""
+    challenger_id, opponent_id = first.user_id, second.user_id
+    match_id = await async_db.execute_query(
+        "INSERT INTO matches (challenger_id, opponent_id, difficulty, image_source, status, started_at, layout_seed) "
+        "VALUES (%s, %s, %s, %s, 'in_progress', CURRENT_TIMESTAMP, %s)",
+        (challenger_id, opponent_id, first.difficulty, first.data['image_source'], new_layout_seed()),
+        pin_keys=(challenger_id, opponent_id)
+    )
+    if not match_id:
+        for user_id in (challenger_id, opponent_id):
+            socketio.emit('error', {'message': '创建对战失败'}, room=str(user_id))
+        return
+
+    active_matches[int(match_id)] = (challenger_id, opponent_id)
+    match_sweeper.track_active(match_id, challenger_id, opponent_id)
+
+    match = await async_db.execute_query("SELECT * FROM matches WHERE id=%s", (match_id,), fetch='one',
+                                         pin_keys=(challenger_id, opponent_id))
+    serializable_match = json_serializable(match)
+    socketio.emit('match_started', {'match': serializable_match}, room=str(challenger_id))
+    socketio.emit('match_started', {'match': serializable_match}, room=str(opponent_id))
+
+
+@socketio.on('leave_matchmaking')
+@instrumented_event
+@authenticated_only
+def handle_leave_matchmaking(data=None):
+    """离开匹配队列"""
+    if matchmaker.leave(request.user['user_id']):
+        emit('matchmaking_left', {})
 
 
 @socketio.on('respond_to_invite')
+@instrumented_event
 @authenticated_only
+@admission_controlled(PRIORITY_CRITICAL)
 def handle_respond_to_invite(data):
     """处理对战邀请的回应"""
     user_id = request.user['user_id']
     match_id = data.get('match_id')
     response = data.get('response') # 'accepted' or 'declined'
 
-    match = execute_query("SELECT * FROM matches WHERE id = %s AND opponent_id = %s AND status = 'pending'", (match_id, user_id), fetch='one')
+    async_db.spawn(respond_to_match_invite, request.sid, user_id, request.user['username'], match_id, response)
+
+async def respond_to_match_invite(sid, user_id, username, match_id, response):
+    """异步任务：处理对战邀请的回应"""
+    match = await async_db.execute_query("SELECT * FROM matches WHERE id = %s AND opponent_id = %s AND status = 'pending'",
+                                         (match_id, user_id), fetch='one', pin_keys=(user_id,))
     if not match:
-        emit('error', {'message': '无效的邀请或邀请已过期'})
+        socketio.emit('error', {'message': '无效的邀请或邀请已过期'}, room=sid)
         return
 
     challenger_id = match['challenger_id']
 
     if response == 'accepted':
-        execute_query("UPDATE matches SET status='in_progress', started_at=CURRENT_TIMESTAMP WHERE id=%s", (match_id,))
+        # 只在仍为 pending 时开始，避免与清理线程的过期取消互相覆盖
+        # 同时生成布局种子，双方客户端用它在本地生成相同的拼图
+        await async_db.execute_query(
+            "UPDATE matches SET status='in_progress', started_at=CURRENT_TIMESTAMP, layout_seed=%s "
+            "WHERE id=%s AND status='pending'",
+            (new_layout_seed(), match_id),
+            pin_keys=(challenger_id, user_id)
+        )
+
+        updated_match = await async_db.execute_query("SELECT * FROM matches WHERE id=%s", (match_id,), fetch='one',
+                                                     pin_keys=(challenger_id, user_id))
+        if not updated_match or updated_match['status'] != 'in_progress':
+            socketio.emit('error', {'message': '无效的邀请或邀请已过期'}, room=sid)
+            return
 
-        updated_match = execute_query("SELECT * FROM matches WHERE id=%s", (match_id,), fetch='one')
+        active_matches[int(match_id)] = (challenger_id, user_id)
+        match_sweeper.track_active(match_id, challenger_id, user_id)
 
         # 2. 序列化数据
         serializable_match = json_serializable(updated_match)
 
         # 3. 发送一个清晰、扁平的 'match' 对象
         # 不再使用 'match_id' 和 'match_details' 的嵌套结构
-        emit('match_started', {'match': serializable_match}, room=str(challenger_id))
-        emit('match_started', {'match': serializable_match}, room=str(user_id))
+        socketio.emit('match_started', {'match': serializable_match}, room=str(challenger_id))
+        socketio.emit('match_started', {'match': serializable_match}, room=str(user_id))
 
     else: # 'declined'
-        execute_query("UPDATE matches SET status='declined' WHERE id=%s", (match_id,))
+        await async_db.execute_query("UPDATE matches SET status='declined' WHERE id=%s", (match_id,),
+                                     pin_keys=(challenger_id, user_id))
+        match_sweeper.forget(match_id)
         # 通知挑战者，邀请被拒绝
-        emit('invite_declined', {'match_id': match_id, 'opponent_username': request.user['username']}, room=str(challenger_id))
+        socketio.emit('invite_declined', {'match_id': match_id, 'opponent_username': username}, room=str(challenger_id))
+
+def finite_number(value):
+    """辅助函数：客户端上报的数值转换为有限浮点数，不是数值（含布尔值）或无法表示时返回 None"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    try:
+        value = float(value)
+    except OverflowError:
+        return None
+    return value if math.isfinite(value) else None
 
 @socketio.on('player_progress_update')
+@instrumented_event
 @authenticated_only
+@rate_limited('player_progress_update')
+@admission_controlled(PRIORITY_CRITICAL)
 def handle_progress_update(data):
     """处理玩家游戏进度更新"""
     user_id = request.user['user_id']
     match_id = data.get('match_id')
     progress = data.get('progress') # e.g., 25.5 (百分比)
     
-    match = execute_query("SELECT challenger_id, opponent_id FROM matches WHERE id = %s", (match_id,), fetch='one')
-    if not match: return
-    
+    try:
+        match_key = int(match_id)
+    except (TypeError, ValueError):
+        return
+
+    players = active_matches.get(match_key)
+    if players is None:
+        # 缓存未命中（例如服务器重启后），查库一次并缓存进行中的对战
+        match = execute_query("SELECT challenger_id, opponent_id, status FROM matches WHERE id = %s", (match_key,), fetch='one')
+        if not match: return
+        players = (match['challenger_id'], match['opponent_id'])
+        if match['status'] == 'in_progress':
+            active_matches[match_key] = players
+
+    match_sweeper.touch(match_key)
+    if match_key in active_matches and user_id in players:
+        value = finite_number(progress)
+        if value is not None:
+            value = min(max(value, 0.0), 100.0)
+            spectator_hub.update(match_key, user_id, value)
+            event_log.append(match_key, user_id, EVENT_PROGRESS, value)
+
     # 确定对手ID
-    opponent_id = match['opponent_id'] if user_id == match['challenger_id'] else match['challenger_id']
+    challenger_id, match_opponent_id = players
+    opponent_id = match_opponent_id if user_id == challenger_id else challenger_id
     
     # 将进度转发给对手
     if opponent_id in online_users:
         emit('opponent_progress_update', {'progress': progress}, room=str(opponent_id))
 
 
+@socketio.on('spectate_match')
+@instrumented_event
+@authenticated_only
+@rate_limited('spectate_match')
+@admission_controlled(PRIORITY_NORMAL)
+def handle_spectate_match(data):
+    """加入对战的观战房间，立即收到当前快照，之后按固定间隔收到进度快照"""
+    try:
+        match_key = int(data.get('match_id'))
+    except (TypeError, ValueError):
+        emit('error', {'message': '无效的对战'})
+        return
+
+    players = active_matches.get(match_key)
+    if players is None:
+        match = execute_query("SELECT challenger_id, opponent_id, status FROM matches WHERE id = %s", (match_key,), fetch='one')
+        if not match or match['status'] != 'in_progress':
+            emit('error', {'message': '对战不存在或已结束'})
+            return
+        players = (match['challenger_id'], match['opponent_id'])
+        active_matches[match_key] = players
+
+    try:
+        snapshot, previous = spectator_hub.join(match_key, players, request.sid)
+    except SpectatorLimitError:
+        emit('error', {'message': '观战人数已满'})
+        return
+
+    if previous is not None and previous != match_key:
+        leave_room(spectator_room(previous))
+    join_room(spectator_room(match_key))
+    emit('spectate_joined', snapshot)
+
+@socketio.on('leave_spectate')
+@instrumented_event
+@authenticated_only
+def handle_leave_spectate(data=None):
+    """离开观战房间"""
+    match_id = spectator_hub.leave(request.sid)
+    if match_id is not None:
+        leave_room(spectator_room(match_id))
+        emit('spectate_left', {'match_id': match_id})
+
+
 @socketio.on('player_finished')
+@instrumented_event
 @authenticated_only
+@admission_controlled(PRIORITY_CRITICAL)
 def handle_player_finished(data):
     """
     处理玩家完成拼图 (新逻辑：第一个完成者直接获胜)
@@ -322,16 +929,27 @@ def handle_player_finished(data):
     user_id = request.user['user_id']
     match_id = data.get('match_id')
     time_ms = data.get('time_ms')
+    layout_signature = data.get('layout_signature')
 
     if not match_id:
         print(f"无效的 'player_finished' 事件：缺少 match_id。")
         return
 
+    # 只记录进行中对战参与者的完成事件（对战是否真正由本次请求完成由 finish_match 判断）
+    players = active_matches.get(int(match_id)) if str(match_id).isdigit() else None
+    value = finite_number(time_ms)
+    if players is not None and user_id in players and value is not None and 0 <= value <= EVENT_VALUE_MAX:
+        event_log.append(int(match_id), user_id, EVENT_FINISH, value)
+
+    async_db.spawn(finish_match, user_id, match_id, time_ms, layout_signature, request.sid)
+
+async def finish_match(user_id, match_id, time_ms, layout_signature=None, sid=None):
+    """异步任务：记录胜利者并广播比赛结果"""
     # ▼▼▼ 核心逻辑修改 ▼▼▼
 
     # 1. 获取比赛当前状态，并检查是否已经结束
     # 这一步至关重要，防止两个玩家在毫秒级的时间差内都完成，导致逻辑冲突
-    match = execute_query("SELECT * FROM matches WHERE id=%s", (match_id,), fetch='one')
+    match = await async_db.execute_query("SELECT * FROM matches WHERE id=%s", (match_id,), fetch='one', pin_keys=(user_id,))
 
     if not match:
         print(f"比赛 {match_id} 不存在。")
@@ -339,6 +957,7 @@ def handle_player_finished(data):
 
     # 如果比赛状态不是 "in_progress"，说明已经有胜利者产生了，直接返回
     if match['status'] != 'in_progress':
+        active_matches.pop(match['id'], None)
         print(f"比赛 {match_id} 已结束，忽略来自玩家 {user_id} 的完成请求。")
         return
 
@@ -357,6 +976,14 @@ def handle_player_finished(data):
         print(f"用户 {user_id} 不是比赛 {match_id} 的参与者。")
         return
 
+    # 客户端上报了布局签名时，按对战种子重新生成一次进行校验（只是几十次移位运算）
+    if layout_signature is not None and match.get('layout_seed') is not None:
+        if not verify_layout(match['layout_seed'], match['difficulty'], layout_signature):
+            print(f"玩家 {user_id} 在比赛 {match_id} 中上报的拼图布局与种子不符，忽略完成请求。")
+            if sid:
+                socketio.emit('error', {'message': '拼图布局校验失败'}, room=sid)
+            return
+
     print(f"玩家 {user_id} 第一个完成比赛 {match_id}！宣布为胜利者。")
 
     # 在一个查询中完成所有更新，确保数据一致性
@@ -367,20 +994,38 @@ def handle_player_finished(data):
             winner_id = %s,
             completed_at = CURRENT_TIMESTAMP,
             {update_column} = %s
-        WHERE id = %s
+        WHERE id = %s AND status = 'in_progress'
     """
-    execute_query(final_update_query, (winner_id, time_ms, match_id))
+    # 只在仍为 in_progress 时完成：同时到达的另一个完成请求或清理线程的判负 / 取消已经结束了这场对战
+    participants = (match['challenger_id'], match['opponent_id'])
+    updated = await async_db.execute_query(final_update_query, (winner_id, time_ms, match_id), fetch='rowcount',
+                                           pin_keys=participants)
+    if not updated:
+        active_matches.pop(match['id'], None)
+        print(f"比赛 {match_id} 已结束，忽略来自玩家 {user_id} 的完成请求。")
+        return
+    active_matches.pop(match['id'], None)
+    match_sweeper.forget(match['id'])
+    resource_versions.bump(list(participants), 'match_history', 'achievements')
+
+    # 更新双方等级分（内存天梯 + 两条批量写入）；上面的 UPDATE 已确认本次请求完成了这场对战
+    changes, writes = settle_rating(dict(match, winner_id=winner_id))
+    for query, params in writes:
+        await async_db.execute_query(query, params, pin_keys=participants)
 
     # 4. 向双方广播比赛结束的消息
-    final_result = execute_query("SELECT * FROM matches WHERE id=%s", (match_id,), fetch='one')
+    final_result = await async_db.execute_query("SELECT * FROM matches WHERE id=%s", (match_id,), fetch='one',
+                                                pin_keys=participants)
     serializable_result = json_serializable(final_result)
 
     challenger_id = match['challenger_id']
     opponent_id = match['opponent_id']
 
     print(f"向玩家 {challenger_id} 和 {opponent_id} 广播比赛 {match_id} 的结束结果。")
-    emit('match_over', {'result': serializable_result}, room=str(challenger_id))
-    emit('match_over', {'result': serializable_result}, room=str(opponent_id))
+    ratings = rating_payload(changes)
+    socketio.emit('match_over', {'result': serializable_result, 'ratings': ratings}, room=str(challenger_id))
+    socketio.emit('match_over', {'result': serializable_result, 'ratings': ratings}, room=str(opponent_id))
+    spectator_hub.end(match['id'], {'result': serializable_result, 'ratings': ratings})
 
     # ▲▲▲ 核心逻辑修改结束 ▲▲▲
 
@@ -389,6 +1034,8 @@ def handle_player_finished(data):
 # API路由
 
 @app.route('/api/auth/register', methods=['POST'])
+@rate_limited('auth_register')
+@admission_controlled(PRIORITY_NORMAL)
 def register():
     """用户注册"""
     try:
@@ -445,10 +1092,14 @@ def register():
         else:
             return jsonify({'error': '注册失败'}), 500
 
+    except HasherBusyError:
+        return jsonify({'error': '服务器繁忙，请稍后重试'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': f'注册失败: {str(e)}'}), 500
 
 @app.route('/api/auth/login', methods=['POST'])
+@rate_limited('auth_login')
+@admission_controlled(PRIORITY_NORMAL)
 def login():
     """用户登录"""
     try:
@@ -470,9 +1121,17 @@ def login():
             return jsonify({'error': '用户不存在'}), 404
 
         # 验证密码
-        if user['password_hash'] != hash_password(password):
+        password_ok, needs_rehash = verify_password(password, user['password_hash'])
+        if not password_ok:
             return jsonify({'error': '密码错误'}), 401
 
+        # 旧版哈希或成本参数过低时，登录成功后透明升级
+        if needs_rehash:
+            execute_query(
+                "UPDATE users SET password_hash = %s WHERE id = %s",
+                (hash_password(password), user['id'])
+            )
+
         # 生成token
         user_data = {
             'id': user['id'],
@@ -487,10 +1146,13 @@ def login():
             'user': user_data
         }), 200
         
+    except HasherBusyError:
+        return jsonify({'error': '服务器繁忙，请稍后重试'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': f'登录失败: {str(e)}'}), 500
 
 @app.route('/api/auth/reset-password', methods=['POST'])
+@admission_controlled(PRIORITY_NORMAL)
 def reset_password():
     """重置密码"""
     try:
@@ -529,39 +1191,60 @@ def validate_token():
         }
     }), 200
 
+def load_leaderboard(difficulty, limit):
+    """辅助函数：查询排行榜数据"""
+    query = """
+    SELECT s.id, s.score, s.difficulty, s.time_taken as time, s.created_at,
+           u.username
+    FROM scores s
+    JOIN users u ON s.user_id = u.id
+    """
+    params = []
+
+    if difficulty != 'all':
+        query += " WHERE s.difficulty = %s"
+        params.append(difficulty)
+
+    query += " ORDER BY s.score DESC, s.time_taken ASC LIMIT %s"
+    params.append(limit)
+
+    # 结果会写入排行榜缓存：失效只跟踪本进程提交的分数，从库落后时读到的旧榜单会一直留在缓存中，因此读主库
+    return execute_query(query, params, fetch='all', primary=True) or []
+
+def load_leaderboard_body(difficulty, limit):
+    """辅助函数：查询排行榜并序列化，同时写入排行榜缓存"""
+    load_seq = leaderboard_cache.begin_load()
+    scores = load_leaderboard(difficulty, limit)
+    body = (app.json.dumps(scores) + '\n').encode()
+    leaderboard_cache.put(difficulty, limit, scores, body, load_seq)
+    return body
+
 @app.route('/api/scores', methods=['GET'])
 @token_required
+@admission_controlled(PRIORITY_LOW)
 def get_leaderboard():
     """获取分数排行榜"""
     try:
-        difficulty = request.args.get('difficulty', 'all')
-        limit = int(request.args.get('limit', 10))
-
-        query = """
-        SELECT s.id, s.score, s.difficulty, s.time_taken as time, s.created_at,
-               u.username
-        FROM scores s
-        JOIN users u ON s.user_id = u.id
-        """
-        params = []
-
-        if difficulty != 'all':
-            query += " WHERE s.difficulty = %s"
-            params.append(difficulty)
-
-        query += " ORDER BY s.score DESC, s.time_taken ASC LIMIT %s"
-        params.append(limit)
+        difficulty = request.args.get('difficulty', 'all').strip()
+        limit = min(max(int(request.args.get('limit', 10)), 1), LEADERBOARD_MAX_LIMIT)
+        # 先校验难度再构造缓存键，避免任意参数值占满排行榜缓存
+        if difficulty not in SCORE_DIFFICULTIES + ('all',):
+            return jsonify({'error': '难度必须是 all, easy, medium, master 或 hard'}), 400
 
-        scores = execute_query(query, params, fetch='all')
+        body = leaderboard_cache.get(difficulty, limit)
+        if body is None:
+            body = read_flights.do(make_key('leaderboard', difficulty, limit),
+                                   load_leaderboard_body, difficulty, limit)
 
         # 直接返回分数数组，与前端期望格式匹配
-        return jsonify(scores or []), 200
+        return app.response_class(body, mimetype='application/json'), 200
 
     except Exception as e:
         return jsonify({'error': f'获取分数失败: {str(e)}'}), 500
 
 @app.route('/api/scores', methods=['POST'])
 @token_required
+@admission_controlled(PRIORITY_NORMAL)
 def submit_score():
     """提交分数"""
     try:
@@ -580,7 +1263,7 @@ def submit_score():
         if not isinstance(time_taken, int) or time_taken < 0:
             return jsonify({'error': '时间必须是非负整数'}), 400
 
-        if difficulty not in ['easy', 'medium', 'hard', 'master']:
+        if difficulty not in SCORE_DIFFICULTIES:
             return jsonify({'error': '难度必须是 easy, medium, master 或 hard'}), 400
 
         # 插入分数记录
@@ -591,11 +1274,13 @@ def submit_score():
 
         if score_id:
             user_id = request.user['user_id']
+            leaderboard_cache.on_score(difficulty, score, time_taken)
             # 删除 game_saves 记录
             execute_query(
                 "DELETE FROM game_saves WHERE user_id = %s AND difficulty = %s",
                 (user_id, str(difficulty))
             )
+            resource_versions.bump(user_id, 'profile', 'achievements', 'saves')
             return jsonify({
                 'message': '分数提交成功',
                 'score_id': score_id
@@ -606,37 +1291,55 @@ def submit_score():
     except Exception as e:
         return jsonify({'error': f'提交分数失败: {str(e)}'}), 500
 
+def load_profile(user_id):
+    """辅助函数：查询用户基本信息和统计信息，用户不存在时返回 (None, None)"""
+    # 获取用户基本信息
+    user = execute_query(
+        "SELECT id, username, email, created_at FROM users WHERE id = %s",
+        (user_id,),
+        fetch='one'
+    )
+
+    if not user:
+        return None, None
+
+    # 获取用户统计信息：已汇总的部分读每日汇总表，汇总水位之后的新成绩直接读 scores
+    stats = execute_query(
+        """
+        SELECT
+            CAST(IFNULL(SUM(games), 0) AS SIGNED) as games_played,
+            IFNULL(MAX(best_score), 0) as best_score,
+            IFNULL(SUM(total_score) / SUM(games), 0) as avg_score,
+            IFNULL(MIN(best_time), 0) as best_time
+        FROM (
+            SELECT games, best_score, total_score, best_time
+            FROM score_daily_summaries
+            WHERE user_id = %s
+            UNION ALL
+            SELECT 1, score, score, time_taken
+            FROM scores
+            WHERE user_id = %s
+              AND id > IFNULL((SELECT last_score_id FROM score_rollup_state WHERE name = 'daily'), 0)
+        ) stats
+        """,
+        (user_id, user_id),
+        fetch='one'
+    )
+    return user, stats
+
 @app.route('/api/user/profile', methods=['GET'])
 @token_required
+@conditional_get('profile')
+@admission_controlled(PRIORITY_NORMAL)
 def get_profile():
     """获取用户资料"""
     try:
         user_id = request.user['user_id']
 
-        # 获取用户基本信息
-        user = execute_query(
-            "SELECT id, username, email, created_at FROM users WHERE id = %s",
-            (user_id,),
-            fetch='one'
-        )
+        user, stats = read_flights.do(make_key('profile', user_id), load_profile, user_id)
 
         if not user:
             return jsonify({'error': '用户不存在'}), 404
-        
-        # 获取用户统计信息
-        stats = execute_query(
-            """
-            SELECT 
-                COUNT(*) as games_played,
-                IFNULL(MAX(score), 0) as best_score,
-                IFNULL(AVG(score), 0) as avg_score,
-                IFNULL(MIN(time_taken), 0) as best_time
-            FROM scores 
-            WHERE user_id = %s
-            """,
-            (user_id,),
-            fetch='one'
-        )
 
         return jsonify({
             'user': user,
@@ -653,6 +1356,8 @@ def get_profile():
 
 @app.route('/api/user/achievements', methods=['GET'])
 @token_required
+@conditional_get('achievements')
+@admission_controlled(PRIORITY_NORMAL)
 def get_user_achievements():
     """获取用户成就完成情况"""
     try:
@@ -666,49 +1371,65 @@ def get_user_achievements():
         )
 
         # 获取用户统计数据用于判断成就完成情况
+        # 已汇总的部分读每日汇总表（按难度分行，难度相关的统计由各行的计数相加），
+        # 汇总水位之后的新成绩直接读 scores
         user_stats = execute_query(
             """
-            SELECT 
+            SELECT
                 -- 基础统计
-                COUNT(*) as total_games,
-                IFNULL(MAX(score), 0) as best_score,
-                IFNULL(SUM(score), 0) as total_score,
-                IFNULL(AVG(score), 0) as avg_score,
-                IFNULL(MIN(time_taken), 0) as best_time,
-                IFNULL(MAX(time_taken), 0) as longest_time,
-                IFNULL(AVG(time_taken), 0) as avg_time,
-                
+                CAST(IFNULL(SUM(games), 0) AS SIGNED) as total_games,
+                IFNULL(MAX(best_score), 0) as best_score,
+                IFNULL(SUM(total_score), 0) as total_score,
+                IFNULL(SUM(total_score) / SUM(games), 0) as avg_score,
+                IFNULL(MIN(best_time), 0) as best_time,
+                IFNULL(MAX(longest_time), 0) as longest_time,
+                IFNULL(SUM(total_time) / SUM(games), 0) as avg_time,
+
                 -- 难度统计
-                COUNT(CASE WHEN difficulty = 'easy' THEN 1 END) as easy_completed,
-                COUNT(CASE WHEN difficulty = 'medium' THEN 1 END) as medium_completed,
-                COUNT(CASE WHEN difficulty = 'hard' THEN 1 END) as hard_completed,
-                COUNT(CASE WHEN difficulty = 'master' THEN 1 END) as master_completed,
-                
+                CAST(IFNULL(SUM(CASE WHEN difficulty = 'easy' THEN games END), 0) AS SIGNED) as easy_completed,
+                CAST(IFNULL(SUM(CASE WHEN difficulty = 'medium' THEN games END), 0) AS SIGNED) as medium_completed,
+                CAST(IFNULL(SUM(CASE WHEN difficulty = 'hard' THEN games END), 0) AS SIGNED) as hard_completed,
+                CAST(IFNULL(SUM(CASE WHEN difficulty = 'master' THEN games END), 0) AS SIGNED) as master_completed,
+
                 -- 时间相关统计
-                COUNT(CASE WHEN time_taken <= 15 THEN 1 END) as games_under_15s,
-                COUNT(CASE WHEN time_taken <= 30 THEN 1 END) as games_under_30s,
-                COUNT(CASE WHEN time_taken <= 60 THEN 1 END) as games_under_60s,
-                COUNT(CASE WHEN time_taken >= 300 THEN 1 END) as games_over_5min,
-                COUNT(CASE WHEN time_taken >= 600 THEN 1 END) as games_over_10min,
-                
+                CAST(IFNULL(SUM(games_under_15s), 0) AS SIGNED) as games_under_15s,
+                CAST(IFNULL(SUM(games_under_30s), 0) AS SIGNED) as games_under_30s,
+                CAST(IFNULL(SUM(games_under_60s), 0) AS SIGNED) as games_under_60s,
+                CAST(IFNULL(SUM(games_over_5min), 0) AS SIGNED) as games_over_5min,
+                CAST(IFNULL(SUM(games_over_10min), 0) AS SIGNED) as games_over_10min,
+
                 -- 特定条件组合统计
-                COUNT(CASE WHEN difficulty = 'easy' AND time_taken <= 30 THEN 1 END) as easy_under_30s,
-                COUNT(CASE WHEN difficulty = 'easy' AND time_taken <= 15 THEN 1 END) as easy_under_15s,
-                COUNT(CASE WHEN difficulty = 'medium' AND time_taken <= 60 THEN 1 END) as medium_under_60s,
-                COUNT(CASE WHEN difficulty = 'hard' AND time_taken <= 120 THEN 1 END) as hard_under_120s,
-                
+                CAST(IFNULL(SUM(CASE WHEN difficulty = 'easy' THEN games_under_30s END), 0) AS SIGNED) as easy_under_30s,
+                CAST(IFNULL(SUM(CASE WHEN difficulty = 'easy' THEN games_under_15s END), 0) AS SIGNED) as easy_under_15s,
+                CAST(IFNULL(SUM(CASE WHEN difficulty = 'medium' THEN games_under_60s END), 0) AS SIGNED) as medium_under_60s,
+                CAST(IFNULL(SUM(CASE WHEN difficulty = 'hard' THEN games_under_120s END), 0) AS SIGNED) as hard_under_120s,
+
                 -- 分数相关统计
-                COUNT(CASE WHEN score >= 1000 THEN 1 END) as high_score_games,
-                COUNT(CASE WHEN score >= 5000 THEN 1 END) as very_high_score_games,
-                COUNT(CASE WHEN score >= 10000 THEN 1 END) as ultra_high_score_games,
-                
+                CAST(IFNULL(SUM(scores_over_1000), 0) AS SIGNED) as high_score_games,
+                CAST(IFNULL(SUM(scores_over_5000), 0) AS SIGNED) as very_high_score_games,
+                CAST(IFNULL(SUM(scores_over_10000), 0) AS SIGNED) as ultra_high_score_games,
+
                 -- 连续性和频率统计 (可以根据需要添加)
-                MIN(created_at) as first_game_date,
-                MAX(created_at) as last_game_date
-            FROM scores 
-            WHERE user_id = %s
+                MIN(first_played_at) as first_game_date,
+                MAX(last_played_at) as last_game_date
+            FROM (
+                SELECT difficulty, games, best_score, total_score, best_time, longest_time, total_time,
+                       games_under_15s, games_under_30s, games_under_60s, games_under_120s,
+                       games_over_5min, games_over_10min, scores_over_1000, scores_over_5000, scores_over_10000,
+                       first_played_at, last_played_at
+                FROM score_daily_summaries
+                WHERE user_id = %s
+                UNION ALL
+                SELECT difficulty, 1, score, score, time_taken, time_taken, time_taken,
+                       time_taken <= 15, time_taken <= 30, time_taken <= 60, time_taken <= 120,
+                       time_taken >= 300, time_taken >= 600, score >= 1000, score >= 5000, score >= 10000,
+                       created_at, created_at
+                FROM scores
+                WHERE user_id = %s
+                  AND id > IFNULL((SELECT last_score_id FROM score_rollup_state WHERE name = 'daily'), 0)
+            ) stats
             """,
-            (user_id,),
+            (user_id, user_id),
             fetch='one'
         )
         
@@ -760,6 +1481,7 @@ def get_user_achievements():
 
 @app.route('/api/user/achievements', methods=['POST'])
 @token_required
+@admission_controlled(PRIORITY_NORMAL)
 def unlock_achievement():
     """解锁用户成就"""
     try:
@@ -788,6 +1510,7 @@ def unlock_achievement():
         )
 
         if result:
+            resource_versions.bump(user_id, 'achievements')
             return jsonify({
                 'message': '成就解锁成功',
                 'achievement_id': achievement_id
@@ -799,61 +1522,239 @@ def unlock_achievement():
         return jsonify({'error': f'解锁成就失败: {str(e)}'}), 500
 
 
+def load_match_history(user_id):
+    """辅助函数：查询用户最近的已完成对战，并标注输赢"""
+    # 使用 UNION ALL 来合并用户作为挑战者和应战者的所有已完成比赛
+    # 每个分支先按 (challenger_id/opponent_id, status, completed_at) 索引倒序取前 50 条，
+    # 外层只需对最多 100 行排序，而不是该用户的全部对战记录
+    query = """
+        (SELECT
+            m.id, m.difficulty, m.completed_at, m.winner_id,
+            opp.id as opponent_id,
+            opp.username as opponent_username
+        FROM matches m
+        JOIN users opp ON m.opponent_id = opp.id
+        WHERE m.challenger_id = %s AND m.status = 'completed'
+        ORDER BY m.completed_at DESC
+        LIMIT 50)
+
+        UNION ALL
+
+        (SELECT
+            m.id, m.difficulty, m.completed_at, m.winner_id,
+            chal.id as opponent_id,
+            chal.username as opponent_username
+        FROM matches m
+        JOIN users chal ON m.challenger_id = chal.id
+        WHERE m.opponent_id = %s AND m.status = 'completed'
+        ORDER BY m.completed_at DESC
+        LIMIT 50)
+
+        ORDER BY completed_at DESC
+        LIMIT 50
+    """
+
+    matches = execute_query(query, (user_id, user_id), fetch='all')
+
+    # 处理结果，添加'result'字段，并序列化
+    history = []
+    for match in matches:
+        # 判断输赢
+        if match['winner_id'] is None:
+            # 已完成的比赛理论上应该有 winner_id, 此处为健壮性检查
+            match['result'] = '平局'
+        elif match['winner_id'] == user_id:
+            match['result'] = '胜利'
+        else:
+            match['result'] = '失败'
+
+        history.append(json_serializable(match))
+    return history
+
 @app.route('/api/matches/history', methods=['GET'])
 @token_required
+@conditional_get('match_history')
+@admission_controlled(PRIORITY_LOW)
 def get_match_history():
     """获取用户的对战历史记录"""
     try:
         user_id = request.user['user_id']
 
-        # 使用 UNION ALL 来合并用户作为挑战者和应战者的所有已完成比赛
-        query = """
-            (SELECT
-                m.id, m.difficulty, m.completed_at, m.winner_id,
-                opp.id as opponent_id,
-                opp.username as opponent_username
-            FROM matches m
-            JOIN users opp ON m.opponent_id = opp.id
-            WHERE m.challenger_id = %s AND m.status = 'completed')
+        history = read_flights.do(make_key('match_history', user_id), load_match_history, user_id)
 
-            UNION ALL
+        return jsonify(history or []), 200
 
-            (SELECT
-                m.id, m.difficulty, m.completed_at, m.winner_id,
-                chal.id as opponent_id,
-                chal.username as opponent_username
-            FROM matches m
-            JOIN users chal ON m.challenger_id = chal.id
-            WHERE m.opponent_id = %s AND m.status = 'completed')
+    except Exception as e:
+        print(f"获取对战历史失败: {str(e)}")
+        return jsonify({'error': f'获取对战历史失败: {str(e)}'}), 500
 
-            ORDER BY completed_at DESC
-            LIMIT 50
-        """
+@app.route('/api/matches/<int:match_id>/replay', methods=['GET'])
+@token_required
+@admission_controlled(PRIORITY_LOW)
+def get_match_replay(match_id):
+    """按时间顺序流式返回对战的进度/完成事件（NDJSON，每行一个事件）；只有参与者或已结束的对战可以回放"""
+    user_id = request.user['user_id']
+    players = active_matches.get(match_id)
+    if players is None or user_id not in players:
+        # 进行中对战的参与者直接由 active_matches 判断，其他情况查一次对战状态
+        match = execute_query("SELECT challenger_id, opponent_id, status FROM matches WHERE id = %s", (match_id,), fetch='one')
+        if not match:
+            return jsonify({'error': '对战不存在'}), 404
+        if match['status'] != 'completed' and user_id not in (match['challenger_id'], match['opponent_id']):
+            return jsonify({'error': '对战尚未结束，只有参与者可以回放'}), 403
+
+    if not event_log.has_events(match_id):
+        return jsonify({'error': '没有该对战的事件记录'}), 404
+
+    def generate():
+        start = None
+        for event in event_log.replay(match_id):
+            if start is None:
+                start = event['ts']
+            event['offset_ms'] = event['ts'] - start
+            yield json.dumps(event) + '\n'
+
+    return app.response_class(generate(), mimetype='application/x-ndjson')
+
+def parse_slice_params(values):
+    """辅助函数：从请求参数中解析网格大小和种子（未指定种子时从预设种子池中选取）"""
+    if values.get('grid_size'):
+        size = int(values['grid_size'])
+    else:
+        size = difficulty_grid_size(values.get('difficulty'))
+    if not 2 <= size <= PUZZLE_MAX_GRID_SIZE:
+        raise ValueError(size)
+    seed = int(values['seed']) if values.get('seed') else random.randint(1, PUZZLE_PRESET_SEEDS)
+    if not 0 <= seed <= 0xFFFFFFFF:
+        raise ValueError(seed)
+    return size, seed
+
+def slice_response(key, image_key):
+    """辅助函数：切割结果的元数据，附带正方形图片和图集的下载地址"""
+    with open(puzzle_slicer.cache.path(key, PIECES_JSON), encoding='utf-8') as f:
+        metadata = json.load(f)
+    metadata['image_url'] = f'/api/puzzles/cache/{image_key}/{SQUARE_IMAGE}'
+    metadata['atlas_url'] = f'/api/puzzles/cache/{key}/{metadata["atlas_file"]}'
+    return jsonify(metadata), 200
+
+@app.route('/api/puzzles/slice', methods=['GET'])
+@token_required
+@rate_limited('puzzle_slice')
+@admission_controlled(PRIORITY_LOW)
+def slice_puzzle():
+    """按 (内置图片, 网格大小, 种子) 返回服务端切割好的拼图（命中缓存时只读取一个 JSON 文件）"""
+    try:
+        size, seed = parse_slice_params(request.args)
+    except ValueError:
+        return jsonify({'error': '参数无效'}), 400
 
-        matches = execute_query(query, (user_id, user_id), fetch='all')
-
-        # 处理结果，添加'result'字段，并序列化
-        history = []
-        for match in matches:
-            # 判断输赢
-            if match['winner_id'] is None:
-                # 已完成的比赛理论上应该有 winner_id, 此处为健壮性检查
-                match['result'] = '平局'
-            elif match['winner_id'] == user_id:
-                match['result'] = '胜利'
-            else:
-                match['result'] = '失败'
+    image = resolve_image(request.args.get('image', DEFAULT_PUZZLE_IMAGE), seed)
+    name = os.path.basename(image)
+    path = os.path.join(PUZZLE_ASSET_DIR, name)
+    if image != f'assets/images/{name}' or not os.path.isfile(path):
+        return jsonify({'error': '图片不存在'}), 404
 
-            history.append(json_serializable(match))
+    try:
+        key, image_key = puzzle_slicer.slice_file(path, size, seed)
+        return slice_response(key, image_key)
+    except SlicerUnavailableError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        print(f"切割拼图失败: {str(e)}")
+        return jsonify({'error': f'切割拼图失败: {str(e)}'}), 500
 
-        return jsonify(history or []), 200
+@app.route('/api/puzzles/slice', methods=['POST'])
+@token_required
+@rate_limited('puzzle_slice')
+@admission_controlled(PRIORITY_LOW)
+def slice_uploaded_puzzle():
+    """切割上传的自定义图片（multipart 字段 image），相同内容的图片共用缓存"""
+    try:
+        size, seed = parse_slice_params(request.form)
+    except ValueError:
+        return jsonify({'error': '参数无效'}), 400
 
+    upload = request.files.get('image')
+    if upload is None:
+        return jsonify({'error': '缺少图片'}), 400
+    data = upload.read(PUZZLE_MAX_UPLOAD_BYTES + 1)
+    if len(data) > PUZZLE_MAX_UPLOAD_BYTES:
+        return jsonify({'error': '图片过大'}), 413
+
+    try:
+        key, image_key = puzzle_slicer.slice_bytes(data, size, seed)
+        return slice_response(key, image_key)
+    except SlicerUnavailableError as e:
+        return jsonify({'error': str(e)}), 503
+    except InvalidImageError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"获取对战历史失败: {str(e)}")
-        return jsonify({'error': f'获取对战历史失败: {str(e)}'}), 500
+        print(f"切割拼图失败: {str(e)}")
+        return jsonify({'error': f'切割拼图失败: {str(e)}'}), 500
+
+@app.route('/api/puzzles/cache/<key>/<name>', methods=['GET'])
+def get_puzzle_cache_file(key, name):
+    """切割缓存中的文件（按内容寻址，可被浏览器和 CDN 长期缓存）"""
+    if not re.fullmatch(r'[0-9a-f]{64}', key) or name not in CACHE_FILES:
+        return jsonify({'error': '文件不存在'}), 404
+    if puzzle_slicer.cache.get(key) is None:
+        return jsonify({'error': '文件不存在'}), 404
+    try:
+        response = send_file(puzzle_slicer.cache.path(key, name), etag=key, conditional=True)
+    except FileNotFoundError:
+        return jsonify({'error': '文件不存在'}), 404
+    response.headers['Cache-Control'] = f'public, max-age={PUZZLE_CACHE_MAX_AGE}, immutable'
+    return response
+
+@app.route('/api/ratings/ladder', methods=['GET'])
+@token_required
+@admission_controlled(PRIORITY_LOW)
+def get_rating_ladder():
+    """等级分天梯（名次和分数来自内存天梯，只查询用户名）"""
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', 20)), 1), RATING_LADDER_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': '参数无效'}), 400
+
+    try:
+        rows = rating_ladder.page(offset, limit)
+        if rows:
+            placeholders = ', '.join(['%s'] * len(rows))
+            users = execute_query(f"SELECT id, username FROM users WHERE id IN ({placeholders})",
+                                  [row['user_id'] for row in rows], fetch='all') or []
+            names = {user['id']: user['username'] for user in users}
+            for row in rows:
+                row['username'] = names.get(row['user_id'])
+        return jsonify({'total': len(rating_ladder), 'offset': offset, 'players': rows}), 200
+    except Exception as e:
+        print(f"获取等级分天梯失败: {str(e)}")
+        return jsonify({'error': f'获取等级分天梯失败: {str(e)}'}), 500
+
+@app.route('/api/user/rating', methods=['GET'])
+@token_required
+@admission_controlled(PRIORITY_LOW)
+def get_user_rating():
+    """当前用户的等级分、名次和最近的等级分变化"""
+    try:
+        user_id = request.user['user_id']
+        rating = rating_ladder.get(user_id)
+        history = execute_query(
+            "SELECT match_id, rating_before, rating_after, created_at FROM rating_history "
+            "WHERE user_id = %s ORDER BY id DESC LIMIT 20",
+            (user_id,), fetch='all'
+        ) or []
+        rating['total_players'] = len(rating_ladder)
+        rating['history'] = [json_serializable(row) for row in history]
+        return jsonify(rating), 200
+    except Exception as e:
+        print(f"获取等级分失败: {str(e)}")
+        return jsonify({'error': f'获取等级分失败: {str(e)}'}), 500
 
 @app.route('/api/users/search', methods=['GET'])
 @token_required
+@rate_limited('users_search')
+@admission_controlled(PRIORITY_LOW)
 def search_users():
     """根据用户名或邮箱搜索用户"""
     query_str = request.args.get('query', '').strip()
@@ -878,6 +1779,7 @@ def search_users():
 
 @app.route('/api/friends/request', methods=['POST'])
 @token_required
+@admission_controlled(PRIORITY_NORMAL)
 def send_friend_request():
     """发送好友请求"""
     data = request.get_json()
@@ -912,18 +1814,20 @@ def send_friend_request():
 
 def get_user_friends_list(user_id):
     """辅助函数：获取用户的好友列表"""
+    # 从好友关系出发按主键关联对方用户（OR 形式的 JOIN 条件无法使用 users 的主键）
     query = """
-        SELECT u.id, u.username FROM users u
-        JOIN friendships f ON (u.id = f.user_one_id OR u.id = f.user_two_id)
+        SELECT u.id, u.username FROM friendships f
+        JOIN users u ON u.id = CASE WHEN f.user_one_id = %s THEN f.user_two_id ELSE f.user_one_id END
         WHERE (f.user_one_id = %s OR f.user_two_id = %s)
-          AND u.id != %s
           AND f.status = 'accepted'
     """
-    return execute_query(query, (user_id, user_id, user_id), fetch='all')
+    return execute_query(query, (user_id, user_id, user_id), fetch='all') or []
 
 
 @app.route('/api/friends', methods=['GET'])
 @token_required
+@conditional_get('friends')
+@admission_controlled(PRIORITY_NORMAL)
 def get_friends():
     """获取好友列表"""
     user_id = request.user['user_id']
@@ -937,6 +1841,7 @@ def get_friends():
 
 @app.route('/api/friends/requests', methods=['GET'])
 @token_required
+@admission_controlled(PRIORITY_NORMAL)
 def get_friend_requests():
     """获取收到的好友请求"""
     user_id = request.user['user_id']
@@ -953,6 +1858,7 @@ def get_friend_requests():
 
 @app.route('/api/friends/respond', methods=['POST'])
 @token_required
+@admission_controlled(PRIORITY_NORMAL)
 def respond_to_friend_request():
     """回应好友请求"""
     data = request.get_json()
@@ -973,6 +1879,7 @@ def respond_to_friend_request():
         execute_query("UPDATE friendships SET status = 'accepted', action_user_id = %s WHERE id = %s", (user_id, friendship_id))
         # 实时通知对方请求已被接受
         other_user_id = friendship['action_user_id']
+        resource_versions.bump([user_id, other_user_id], 'friends')
         if other_user_id in online_users:
              emit('friend_request_accepted', {'username': request.user['username']}, room=str(other_user_id), namespace='/')
         return jsonify({'message': '已添加好友'}), 200
@@ -980,8 +1887,24 @@ def respond_to_friend_request():
         execute_query("DELETE FROM friendships WHERE id = %s", (friendship_id,))
         return jsonify({'message': '已拒绝请求'}), 200
 
+def calculate_save_progress(game_mode, grid_size, placed_pieces_ids, available_pieces_ids, master_pieces):
+    """辅助函数：根据存档内容计算游戏进度（百分比）"""
+    if game_mode == 'master':
+        # 大师模式：基于拼图块组数计算进度
+        total_pieces = len(master_pieces)
+        if total_pieces > 0:
+            # 简单地基于拼图块数量计算进度，实际可以根据需要调整
+            return min(100.0, (total_pieces / (grid_size * grid_size * 9)) * 100)
+        return 0.0
+
+    # 经典模式：基于已放置的拼图块数量
+    total_pieces = len(placed_pieces_ids) + len(available_pieces_ids)
+    placed_count = len([p for p in placed_pieces_ids if p is not None])
+    return (placed_count / total_pieces * 100) if total_pieces > 0 else 0.0
+
 @app.route('/api/save-game', methods=['POST'])
 @token_required
+@admission_controlled(PRIORITY_NORMAL)
 def submit_save():
     """保存游戏进度"""
     try:
@@ -1003,19 +1926,8 @@ def submit_save():
         save_name = data.get('save_name', f"auto_save_{int(time.time())}")
 
         # 计算游戏进度（可选，基于已放置的拼图块数量）
-        if game_mode == 'master':
-            # 大师模式：基于拼图块组数计算进度
-            total_pieces = len(master_pieces)
-            if total_pieces > 0:
-                # 简单地基于拼图块数量计算进度，实际可以根据需要调整
-                progress = min(100.0, (total_pieces / (data.get('difficulty', 1) * data.get('difficulty', 1) * 9)) * 100)
-            else:
-                progress = 0.0
-        else:
-            # 经典模式：基于已放置的拼图块数量
-            total_pieces = len(placed_pieces_ids) + len(available_pieces_ids)
-            placed_count = len([p for p in placed_pieces_ids if p is not None])
-            progress = (placed_count / total_pieces * 100) if total_pieces > 0 else 0.0
+        progress = calculate_save_progress(game_mode, data.get('difficulty', 1),
+                                           placed_pieces_ids, available_pieces_ids, master_pieces)
 
         if not game_mode:
             return jsonify({'error': '游戏模式不能为空'}), 400
@@ -1060,6 +1972,7 @@ def submit_save():
             )
 
         if save_id:
+            resource_versions.bump(user_id, 'saves')
             return jsonify({
                 'message': '游戏保存成功',
                 'save_id': save_id,
@@ -1072,8 +1985,65 @@ def submit_save():
     except Exception as e:
         return jsonify({'error': f'保存游戏失败: {str(e)}'}), 500
 
+def decode_save(save_data):
+    """辅助函数：解析存档中的 JSON 字段并转换为前端期望的格式"""
+    # 解析JSON数据
+    try:
+        if save_data['placed_pieces_ids']:
+            save_data['placedPiecesIds'] = json.loads(save_data['placed_pieces_ids'])
+        else:
+            save_data['placedPiecesIds'] = []
+
+        if save_data['available_pieces_ids']:
+            save_data['availablePiecesIds'] = json.loads(save_data['available_pieces_ids'])
+        else:
+            save_data['availablePiecesIds'] = []
+
+        # 新增：解析 master_pieces 数据
+        if save_data.get('master_pieces'):
+            save_data['masterPieces'] = json.loads(save_data['master_pieces'])
+        else:
+            save_data['masterPieces'] = []
+
+        # 重命名字段以匹配前端期望的格式
+        save_data['gameMode'] = save_data['game_mode']
+        save_data['elapsedSeconds'] = save_data['elapsed_seconds']
+        save_data['currentScore'] = save_data['current_score']
+        save_data['imageSource'] = save_data['image_source']
+
+        # 删除原有的下划线命名字段
+        del save_data['game_mode']
+        del save_data['elapsed_seconds']
+        del save_data['current_score']
+        del save_data['image_source']
+        del save_data['placed_pieces_ids']
+        del save_data['available_pieces_ids']
+        if 'master_pieces' in save_data:
+            del save_data['master_pieces']
+
+    except Exception as json_error:
+        print(f"JSON解析错误: {json_error}")
+        save_data['placedPiecesIds'] = []
+        save_data['availablePiecesIds'] = []
+        save_data['masterPieces'] = []  # 新增：默认空的大师模式数据
+        save_data['gameMode'] = save_data.get('game_mode', 'classic')
+        save_data['elapsedSeconds'] = save_data.get('elapsed_seconds', 0)
+        save_data['currentScore'] = save_data.get('current_score', 0)
+        save_data['imageSource'] = save_data.get('image_source', 'assets/images/default_puzzle.jpg')
+
+    # 转换 Decimal 和 datetime 类型为 JSON 可序列化的格式
+    for key, value in save_data.items():
+        if isinstance(value, Decimal):
+            save_data[key] = float(value)
+        elif isinstance(value, datetime.datetime):
+            save_data[key] = value.isoformat()
+
+    return save_data
+
 @app.route('/api/load-save', methods=['GET'])
 @token_required
+@conditional_get('saves')
+@admission_controlled(PRIORITY_NORMAL)
 def load_save():
     """加载游戏存档"""
     try:
@@ -1135,56 +2105,7 @@ def load_save():
         if not save_data:
             return jsonify({'error': '存档不存在'}), 404
         
-        # 解析JSON数据
-        try:
-            if save_data['placed_pieces_ids']:
-                save_data['placedPiecesIds'] = json.loads(save_data['placed_pieces_ids'])
-            else:
-                save_data['placedPiecesIds'] = []
-
-            if save_data['available_pieces_ids']:
-                save_data['availablePiecesIds'] = json.loads(save_data['available_pieces_ids'])
-            else:
-                save_data['availablePiecesIds'] = []
-
-            # 新增：解析 master_pieces 数据
-            if save_data.get('master_pieces'):
-                save_data['masterPieces'] = json.loads(save_data['master_pieces'])
-            else:
-                save_data['masterPieces'] = []
-
-            # 重命名字段以匹配前端期望的格式
-            save_data['gameMode'] = save_data['game_mode']
-            save_data['elapsedSeconds'] = save_data['elapsed_seconds']
-            save_data['currentScore'] = save_data['current_score']
-            save_data['imageSource'] = save_data['image_source']
-
-            # 删除原有的下划线命名字段
-            del save_data['game_mode']
-            del save_data['elapsed_seconds']
-            del save_data['current_score']
-            del save_data['image_source']
-            del save_data['placed_pieces_ids']
-            del save_data['available_pieces_ids']
-            if 'master_pieces' in save_data:
-                del save_data['master_pieces']
-
-        except Exception as json_error:
-            print(f"JSON解析错误: {json_error}")
-            save_data['placedPiecesIds'] = []
-            save_data['availablePiecesIds'] = []
-            save_data['masterPieces'] = []  # 新增：默认空的大师模式数据
-            save_data['gameMode'] = save_data.get('game_mode', 'classic')
-            save_data['elapsedSeconds'] = save_data.get('elapsed_seconds', 0)
-            save_data['currentScore'] = save_data.get('current_score', 0)
-            save_data['imageSource'] = save_data.get('image_source', 'assets/images/default_puzzle.jpg')
-
-        # 转换 Decimal 和 datetime 类型为 JSON 可序列化的格式
-        for key, value in save_data.items():
-            if isinstance(value, Decimal):
-                save_data[key] = float(value)
-            elif isinstance(value, datetime.datetime):
-                save_data[key] = value.isoformat()
+        save_data = decode_save(save_data)
 
         # 添加调试信息，显示转换后的返回值
         print(f"转换后的 load_save 返回值: {save_data}")
@@ -1195,6 +2116,7 @@ def load_save():
 
 @app.route('/api/delete-save', methods=['DELETE'])
 @token_required
+@admission_controlled(PRIORITY_NORMAL)
 def delete_save():
     """删除游戏存档"""
     try:
@@ -1225,24 +2147,107 @@ def delete_save():
             query_params
         )
 
+        resource_versions.bump(user_id, 'saves')
         return jsonify({'message': '存档删除成功'}), 200
 
     except Exception as e:
         return jsonify({'error': f'删除存档失败: {str(e)}'}), 500
 
+@app.route('/api/admission/status', methods=['GET'])
+@local_only
+def admission_status():
+    """准入控制状态（监控用，仅允许本机访问）"""
+    return jsonify(admission_controller.snapshot()), 200
+
+@app.route('/metrics', methods=['GET'])
+@local_only
+def metrics_endpoint():
+    """运行指标（Prometheus 文本格式，仅允许本机访问）"""
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/traces/slow', methods=['GET'])
+@local_only
+def slow_traces():
+    """最慢的请求追踪（format=text 时返回文本瀑布图）"""
+    limit = request.args.get('limit', 20, type=int)
+    min_ms = request.args.get('min_ms', 0, type=float)
+    traces = tracer.slowest(limit, min_ms)
+    if request.args.get('format') == 'text':
+        return app.response_class('\n\n'.join(format_waterfall(t) for t in traces) + '\n', mimetype='text/plain')
+    return jsonify({'traces': traces}), 200
+
+@app.route('/api/traces/recent', methods=['GET'])
+@local_only
+def recent_traces():
+    """最近完成的请求追踪"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'traces': tracer.recent(limit)}), 200
+
+@app.route('/api/profiler', methods=['GET', 'POST'])
+@local_only
+def profiler_control():
+    """
+    采样分析器开关（仅允许本机访问）
+    POST {"action": "start", "duration": 60, "sample_rate": 0.1, "targets": ["get_leaderboard"], "interval_ms": 5}
+    POST {"action": "stop"}
+    """
+    if request.method == 'GET':
+        return jsonify(profiler.status()), 200
+
+    data = request.get_json() or {}
+    action = data.get('action')
+    if action == 'stop':
+        return jsonify({'result': profiler.stop()}), 200
+    if action != 'start':
+        return jsonify({'error': 'action 必须是 start 或 stop'}), 400
+
+    try:
+        session = profiler.start(
+            duration=float(data.get('duration', 60)),
+            sample_rate=float(data.get('sample_rate', 0.1)),
+            targets=data.get('targets'),
+            interval=float(data.get('interval_ms', 5)) / 1000,
+            include_async=bool(data.get('include_async', False)),
+        )
+    except ProfilerBusyError as e:
+        return jsonify({'error': str(e)}), 409
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'参数无效: {e}'}), 400
+    return jsonify({'session': session}), 201
+
+@app.route('/api/live', methods=['GET'])
+def liveness_check():
+    """存活检查（不访问数据库）"""
+    return jsonify({'status': 'alive'}), 200
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查"""
     try:
-        # 测试数据库连接
-        connection = get_db_connection()
-        if connection:
-            connection.close()
-            return jsonify({'status': 'healthy', 'database': 'connected'}), 200
+        # 测试存储连接
+        if storage.ping():
+            return jsonify({'status': 'healthy', 'database': 'connected', 'storage': storage.status(),
+                            'score_rollup': score_rollup.status(),
+                            'match_sweeper': match_sweeper.status(),
+                            'matchmaking': matchmaker.status(),
+                            'rated_players': len(rating_ladder),
+                            'spectators': spectator_hub.status(),
+                            'event_log': event_log.status(),
+                            'puzzle_slicer': puzzle_slicer.stats()}), 200
         else:
             return jsonify({'status': 'unhealthy', 'database': 'disconnected'}), 503
     except Exception as e:
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 503
 
 if __name__ == '__main__':
+    password_hasher.calibrate()
+    storage.start()
+    rebuild_ladder(rating_ladder, storage, batch_size=RATING_REBUILD_BATCH_SIZE)
+    score_rollup.start()
+    match_sweeper.start()
+    matchmaker.start()
+    spectator_hub.start()
+    event_log.start()
+    atexit.register(event_log.stop)
+    puzzle_slicer.cache.load()
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
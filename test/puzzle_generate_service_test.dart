@@ -1,4 +1,5 @@
 import 'package:flutter_test/flutter_test.dart';
+import 'package:jigsaw_master/services/puzzle_generate_service.dart';
 
 void main() {
   group('PuzzleGenerateService Tests', () {
@@ -35,4 +36,33 @@ void main() {
       expect(20, isPositive);
     });
   });
+
+  // 对照值由服务器 backend/puzzle_layout.py 生成，两端必须逐位一致
+  group('Seeded battle layout', () {
+    test('LayoutRandom should match the server sequence', () {
+      final random = LayoutRandom(12345);
+      expect(
+          List.generate(5, (_) => random.nextUint32()),
+          equals(
+              [642384322, 2822516123, 2623811804, 1434976643, 3803259071]));
+    });
+
+    test('layoutSignature should match the server for each grid size', () {
+      String signature(int seed, int size) {
+        final graph = PuzzleGenerateService.generateGridGraph(size, size);
+        PuzzleGenerateService.applySeededLayout(graph, seed);
+        return PuzzleGenerateService.layoutSignature(graph);
+      }
+
+      expect(signature(12345, 3), equals('61b'));
+      expect(signature(12345, 5), equals('61b1ee3b3c'));
+      expect(signature(1, 4), equals('0f7a7e'));
+      expect(signature(2147483647, 5), equals('fc154f8480'));
+    });
+
+    test('defaultImageForSeed should match the server', () {
+      expect(PuzzleGenerateService.defaultImageForSeed(12345),
+          equals('assets/images/4.jpg'));
+    });
+  });
 }